@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Parser throughput benchmark - feeds adversarial and fuzzed markdown of
+growing size through parse_markdown and tokenize_inline and checks that
+throughput stays flat, i.e. that parsing is linear in input size. Exits
+non-zero when the largest input is much slower per byte than the smallest.
+"""
+
+import argparse
+import io
+import random
+import time
+
+from markdown_parser import parse_markdown, tokenize_inline
+
+INLINE_TYPES = ('h1', 'h2', 'h3', 'h4', 'para', 'caption', 'bullet', 'numbered')
+
+
+def _fuzz(size, seed=1234):
+    rng = random.Random(seed)
+    alphabet = 'ab _*`[]()|-#!\\:.1 '
+    return ''.join(rng.choice(alphabet) for _ in range(size))
+
+
+# Each case builds a markdown document of roughly `n` bytes
+CASES = {
+    'snake_case line': lambda n: 'path/to/snake_case_name_' * (n // 24),
+    'underscore run': lambda n: 'a' + '_' * n + 'a',
+    'unmatched stars': lambda n: '*a ' * (n // 3),
+    'nested emphasis': lambda n: '**' * (n // 8) + 'x' + '**' * (n // 8) + ' *' * (n // 8),
+    'unclosed links': lambda n: '[a](' * (n // 4),
+    'link labels': lambda n: '[a]' * (n // 3) + '(x)',
+    'open brackets': lambda n: '[' * n + ']',
+    'backticks': lambda n: '`a' * (n // 2),
+    'log lines': lambda n: '\n'.join(['2024-01-01T00:00:00Z app_server[123]: /var/lib/app_data/file_1.log *WARN*'] * (n // 80)),
+    'huge table': lambda n: '\n'.join(['| A | B | C |', '|---|:-:|---|'] +
+                                      ['| **x** | y_z | `c` |'] * (n // 21)),
+    'numbered digits': lambda n: '1' * n + ' x',
+    'fuzz': _fuzz,
+}
+
+
+def run_case(text):
+    """Parse a document and tokenize every inline element; returns seconds."""
+    data = text.encode('utf-8')
+    start = time.perf_counter()
+    for elem_type, content in parse_markdown(io.BytesIO(data), base_dir='.'):
+        if elem_type in INLINE_TYPES:
+            tokenize_inline(content)
+        elif elem_type == 'table':
+            for row in content:
+                for cell in row:
+                    tokenize_inline(cell)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--max-kb', type=int, default=1024, help='largest input size in KB (default 1024)')
+    parser.add_argument('--steps', type=int, default=4, help='number of sizes, each 4x the previous (default 4)')
+    parser.add_argument('--tolerance', type=float, default=3.0,
+                        help='fail when per-byte time grows by more than this factor (default 3)')
+    args = parser.parse_args()
+
+    sizes = [args.max_kb * 1024 // 4 ** k for k in reversed(range(args.steps))]
+    print(f"{'case':<18}" + ''.join(f"{size // 1024:>9} KB" for size in sizes) + "   growth")
+    failed = []
+    for name, build in CASES.items():
+        rates = []
+        for size in sizes:
+            text = build(size)
+            elapsed = min(run_case(text) for _ in range(3 if size < sizes[-1] else 1))
+            rates.append(len(text) / max(elapsed, 1e-9) / 1e6)
+        growth = rates[0] / rates[-1]
+        flag = '' if growth <= args.tolerance else '  SLOW'
+        if flag:
+            failed.append(name)
+        print(f"{name:<18}" + ''.join(f"{rate:>7.1f} MB/s" for rate in rates) + f"{growth:>8.2f}x{flag}")
+    if failed:
+        raise SystemExit(f"Throughput not flat for: {', '.join(failed)}")
+    print("Throughput is flat for all cases.")
+
+
+if __name__ == "__main__":
+    main()
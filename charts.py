@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Vector cost charts - donut charts of the Section 9 cost tables built from
+shapes (Bezier arcs) and text, drawn straight into PDF content streams or
+written as SVG or PNG. PNG output needs NumPy; labels are rasterized from a
+TrueType font when one is installed.
+"""
+
+import argparse
+import math
+import os
+import re
+
+from markdown_parser import parse_markdown, strip_markdown
+from pdf_fonts import HELVETICA_BOLD_WIDTHS, HELVETICA_WIDTHS
+from truetype import TrueTypeFont, find_font
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+# Professional blues and grays, as in diagrams/generate_cost_charts.py
+PALETTE = ['#1a365d', '#2b6cb0', '#3182ce', '#4a90d9', '#63a4e8', '#7cb8f7', '#4a5568']
+INK = '#1a365d'
+WHITE = '#ffffff'
+
+# Midpoints of the Section 9 tables, used when the markdown is not available
+INITIAL_COSTS = {
+    'Cloud Setup (AWS GovCloud)': 27500,
+    'M365 GCC High Setup': 17500,
+    'Security Tooling': 75000,
+    'Hardware (Endpoints)': 57500,
+    'Network Equipment': 27500,
+    'Consulting Services': 95000,
+    'C3PAO Assessment': 45000,
+}
+ANNUAL_COSTS = {
+    'AWS GovCloud Consumption': 270000,
+    'M365 GCC High Licensing': 26000,
+    'Security Tooling Renewals': 45000,
+    'Personnel (Security/Compliance)': 200000,
+    'Training': 17500,
+}
+
+# Headings whose first table holds each cost breakdown
+COST_SECTIONS = {'Initial Implementation Costs': 'initial', 'Ongoing Operational Costs': 'annual'}
+
+
+def text_width(text, size, bold=False):
+    """Width of `text` in Helvetica (or Helvetica-Bold) at `size` points."""
+    widths = HELVETICA_BOLD_WIDTHS if bold else HELVETICA_WIDTHS
+    return sum(widths[ord(c) - 32] if 32 <= ord(c) < 127 else 556 for c in text) * size / 1000
+
+
+def rgb(color):
+    """'#rrggbb' as an (r, g, b) tuple of 0-1 floats."""
+    return tuple(round(int(color[i:i + 2], 16) / 255, 3) for i in (1, 3, 5))
+
+
+def _fmt(value):
+    return f"{value:.2f}".rstrip('0').rstrip('.')
+
+
+class Chart:
+    """Filled shapes and text in a width x height box with y pointing down.
+
+    Shapes are ('path', subpaths, fill) where each subpath is a list of
+    ('M', x, y), ('L', x, y), ('C', x1, y1, x2, y2, x, y) and ('Z',)
+    commands; text is ('text', x, y, text, size, bold, anchor, color)
+    with y on the baseline and anchor 'start', 'middle' or 'end'.
+    """
+
+    def __init__(self, width, height=0):
+        self.width = width
+        self.height = height
+        self.items = []
+
+    def path(self, subpaths, fill):
+        self.items.append(('path', subpaths, fill))
+
+    def rect(self, x, y, w, h, fill):
+        self.path([[('M', x, y), ('L', x + w, y), ('L', x + w, y + h), ('L', x, y + h), ('Z',)]], fill)
+
+    def text(self, x, y, text, size, bold=False, anchor='start', color=INK):
+        self.items.append(('text', x, y, text, size, bold, anchor, color))
+
+
+def _point(cx, cy, r, angle):
+    # Angles run clockwise from 12 o'clock
+    return cx + r * math.sin(angle), cy - r * math.cos(angle)
+
+
+def arc(cx, cy, r, start, end):
+    """Cubic Bezier commands for a circular arc, in segments of at most 90 degrees."""
+    count = max(1, math.ceil(abs(end - start) / (math.pi / 2) - 1e-9))
+    step = (end - start) / count
+    k = 4 / 3 * math.tan(step / 4) * r
+    commands = []
+    for i in range(count):
+        a0, a1 = start + i * step, start + (i + 1) * step
+        x0, y0 = _point(cx, cy, r, a0)
+        x1, y1 = _point(cx, cy, r, a1)
+        commands.append(('C', x0 + k * math.cos(a0), y0 + k * math.sin(a0),
+                         x1 - k * math.cos(a1), y1 - k * math.sin(a1), x1, y1))
+    return commands
+
+
+def _ring_segment(cx, cy, outer, inner, start, end):
+    return [('M', *_point(cx, cy, outer, start)), *arc(cx, cy, outer, start, end),
+            ('L', *_point(cx, cy, inner, end)), *arc(cx, cy, inner, end, start), ('Z',)]
+
+
+def _luminance(color):
+    r, g, b = rgb(color)
+    return 0.299 * r + 0.587 * g + 0.114 * b
+
+
+def draw_donut(chart, x, y, width, costs, title, subtitle=None, total_label='Total'):
+    """Draw a titled donut chart with a legend into a width-wide column at (x, y).
+
+    Returns the y coordinate below the legend.
+    """
+    cx = x + width / 2
+    chart.text(cx, y + 11, title, 10.5, bold=True, anchor='middle')
+    y += 14
+    if subtitle:
+        chart.text(cx, y + 9, subtitle, 8, anchor='middle')
+        y += 12
+
+    total = sum(costs.values())
+    outer = min(62, width / 2 - 10)
+    inner = outer * 0.55
+    cy = y + 8 + outer
+    angle = 0
+    separators = []
+    for i, (label, value) in enumerate(costs.items()):
+        color = PALETTE[i % len(PALETTE)]
+        share = value / total if total else 0  # All-zero costs draw an empty ring
+        sweep = 2 * math.pi * share
+        chart.path([_ring_segment(cx, cy, outer, inner, angle, angle + sweep)], color)
+        if share >= 0.05:
+            lx, ly = _point(cx, cy, (outer + inner) / 2, angle + sweep / 2)
+            chart.text(lx, ly + 2.5, f"{share:.0%}", 7, bold=True, anchor='middle',
+                       color=WHITE if _luminance(color) < 0.6 else INK)
+        separators.append(angle)
+        angle += sweep
+    if len(costs) > 1:
+        # Thin white gaps between slices
+        for angle in separators:
+            (ox, oy), (ix, iy) = _point(cx, cy, outer + 0.5, angle), _point(cx, cy, inner - 0.5, angle)
+            nx, ny = math.cos(angle) * 0.6, math.sin(angle) * 0.6
+            chart.path([[('M', ox - nx, oy - ny), ('L', ox + nx, oy + ny),
+                         ('L', ix + nx, iy + ny), ('L', ix - nx, iy - ny), ('Z',)]], WHITE)
+    chart.text(cx, cy - 2, total_label, 8, bold=True, anchor='middle')
+    chart.text(cx, cy + 9, f"${total:,.0f}", 9, bold=True, anchor='middle')
+
+    y = cy + outer + 14
+    left, right = x + 8, x + width - 8
+    for i, (label, value) in enumerate(costs.items()):
+        chart.rect(left, y - 6.5, 7, 7, PALETTE[i % len(PALETTE)])
+        chart.text(left + 11, y, label, 7.5)
+        share = value / total if total else 0
+        chart.text(right, y, f"${value:,.0f} ({share:.0%})", 7.5, anchor='end')
+        y += 11
+    return y
+
+
+def donut_chart(costs, title, total_label='Total', width=300):
+    """A single donut chart figure."""
+    chart = Chart(width)
+    chart.height = draw_donut(chart, 0, 0, width, costs, title, total_label=total_label) + 4
+    return chart
+
+
+def combined_chart(initial, annual, width=468):
+    """Initial and annual cost donuts side by side."""
+    chart = Chart(width)
+    half = width / 2
+    bottom = max(draw_donut(chart, 0, 0, half, initial, 'Initial Implementation', '(One-Time)'),
+                 draw_donut(chart, half, 0, half, annual, 'Annual Operations', '(Recurring)'))
+    chart.height = bottom + 4
+    return chart
+
+
+def figures(initial=None, annual=None):
+    """Charts keyed by the file name of the raster figure each one replaces."""
+    initial = initial or INITIAL_COSTS
+    annual = annual or ANNUAL_COSTS
+    return {
+        'cost_breakdown_combined.png': combined_chart(initial, annual),
+        'cost_initial_implementation.png': donut_chart(initial, 'Initial Implementation Costs'),
+        'cost_annual_operations.png': donut_chart(annual, 'Annual Operational Costs', 'Annual'),
+    }
+
+
+def parse_amount(cell):
+    """Dollar amount in a table cell ('$15,000', '**$280,000**') as an int, or None."""
+    match = re.search(r'\$([\d,]+)', cell)
+    return int(match.group(1).replace(',', '')) if match else None
+
+
+def costs_from_table(rows):
+    """Category midpoints from a cost table (category, low, high, ...); total rows are skipped."""
+    costs = {}
+    for row in rows[1:]:
+        label = strip_markdown(row[0]).strip()
+        low, high = (parse_amount(cell) for cell in row[1:3])
+        if label.lower().startswith('total') or low is None or high is None:
+            continue
+        middle = (low + high) / 2
+        costs[label] = int(middle) if middle.is_integer() else middle
+    return costs
+
+
+def section_costs(source):
+    """Return (initial, annual) cost dicts read from the markdown's Section 9 tables.
+
+    Either is None when its table is not found.
+    """
+    found = {}
+    section = None
+    for elem_type, content in parse_markdown(source):
+        if elem_type in ('h1', 'h2', 'h3', 'h4'):
+            section = next((key for heading, key in COST_SECTIONS.items() if heading in content), None)
+        elif elem_type == 'table' and section and section not in found:
+            found[section] = costs_from_table(content) or None
+            if len(found) == len(COST_SECTIONS):
+                break
+    return found.get('initial'), found.get('annual')
+
+
+def with_cost_figures(elements, into):
+    """Pass parser elements through, keeping the dict `into` filled with figures().
+
+    The charts are rebuilt from each Section 9 cost table as it goes by,
+    so one parse serves both the document text and its charts. A cost
+    figure comes before the tables it draws, so an image of one is held
+    back, with the elements after it, until every cost table has been
+    read or the next h1 or h2 heading ends the section.
+    """
+    into.update(figures())
+    found = {}
+    section = None
+    held = []
+    for elem_type, content in elements:
+        if elem_type in ('h1', 'h2', 'h3', 'h4'):
+            if elem_type in ('h1', 'h2'):
+                yield from held
+                held.clear()
+            section = next((key for heading, key in COST_SECTIONS.items() if heading in content), None)
+        elif elem_type == 'table' and section and section not in found:
+            found[section] = costs_from_table(content) or None
+            into.update(figures(found.get('initial'), found.get('annual')))
+        elif elem_type == 'image' and len(found) < len(COST_SECTIONS) and os.path.basename(content[0]) in into:
+            held.append((elem_type, content))
+            continue
+        if not held:
+            yield elem_type, content
+            continue
+        held.append((elem_type, content))
+        if len(found) == len(COST_SECTIONS):
+            yield from held
+            held.clear()
+    yield from held
+
+
+def path_ops(subpaths, x0, top, scale=1):
+    """PDF path operators for subpaths placed with their origin at (x0, top)."""
+    ops = []
+    for subpath in subpaths:
+        for cmd, *coords in subpath:
+            if cmd == 'Z':
+                ops.append('h')
+                continue
+            points = ' '.join(f"{_fmt(x0 + coords[i] * scale)} {_fmt(top - coords[i + 1] * scale)}"
+                              for i in range(0, len(coords), 2))
+            ops.append(f"{points} {dict(M='m', L='l', C='c')[cmd]}")
+    return ' '.join(ops)
+
+
+def to_svg(chart):
+    """Render a chart as a standalone SVG document."""
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{_fmt(chart.width)}" '
+           f'height="{_fmt(chart.height)}" viewBox="0 0 {_fmt(chart.width)} {_fmt(chart.height)}" '
+           f'font-family="Helvetica, Arial, sans-serif">',
+           f'<rect width="100%" height="100%" fill="{WHITE}"/>']
+    for item in chart.items:
+        if item[0] == 'path':
+            d = ' '.join(cmd + ' '.join(_fmt(v) for v in coords)
+                         for subpath in item[1] for cmd, *coords in subpath)
+            out.append(f'<path d="{d}" fill="{item[2]}"/>')
+        else:
+            _, x, y, text, size, bold, anchor, color = item
+            text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+            weight = ' font-weight="bold"' if bold else ''
+            out.append(f'<text x="{_fmt(x)}" y="{_fmt(y)}" font-size="{_fmt(size)}"{weight} '
+                       f'text-anchor="{anchor}" fill="{color}">{text}</text>')
+    out.append('</svg>')
+    return '\n'.join(out) + '\n'
+
+
+def _polygons(subpaths, scale, steps=12):
+    """Flatten subpaths into point arrays in pixel coordinates."""
+    polygons = []
+    for subpath in subpaths:
+        points = []
+        for cmd, *coords in subpath:
+            if cmd in ('M', 'L'):
+                points.append((coords[0], coords[1]))
+            elif cmd == 'C':
+                (x0, y0), (x1, y1, x2, y2, x3, y3) = points[-1], coords
+                t = np.linspace(0, 1, steps + 1)[1:, None]
+                mt = 1 - t
+                curve = (mt ** 3 * (x0, y0) + 3 * mt * mt * t * (x1, y1) +
+                         3 * mt * t * t * (x2, y2) + t ** 3 * (x3, y3))
+                points.extend(map(tuple, curve))
+        if len(points) > 2:
+            polygons.append(np.array(points) * scale)
+    return polygons
+
+
+def _coverage(polygons, width, height, ss=4):
+    """Anti-aliased nonzero-winding coverage of polygons.
+
+    Returns ((x0, y0), mask) with mask covering the polygons' pixel bounding
+    box, or None if they fall outside the canvas. Spans are found per
+    subsample row from sorted edge crossings and filled with a difference
+    array, then averaged over ss x ss subsamples.
+    """
+    if not polygons:
+        return None
+    pts = np.vstack(polygons)
+    x0, y0 = max(0, int(pts[:, 0].min())), max(0, int(pts[:, 1].min()))
+    x1, y1 = min(width, int(pts[:, 0].max()) + 1), min(height, int(pts[:, 1].max()) + 1)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    edges = np.vstack([np.hstack([p, np.roll(p, -1, axis=0)]) for p in polygons])
+    edges = edges[edges[:, 1] != edges[:, 3]]
+    rows = (y1 - y0) * ss
+    ys = y0 + (np.arange(rows) + 0.5) / ss
+    ey0, ey1 = edges[:, 1], edges[:, 3]
+    lo, hi = np.minimum(ey0, ey1), np.maximum(ey0, ey1)
+    row_idx, edge_idx = np.nonzero((lo[None, :] <= ys[:, None]) & (ys[:, None] < hi[None, :]))
+    e = edges[edge_idx]
+    xs = e[:, 0] + (ys[row_idx] - e[:, 1]) * (e[:, 2] - e[:, 0]) / (e[:, 3] - e[:, 1])
+    winding = np.where(e[:, 3] > e[:, 1], 1, -1)
+    order = np.lexsort((xs, row_idx))
+    row_idx, xs, winding = row_idx[order], xs[order], winding[order]
+    inside = np.cumsum(winding) != 0
+    start = np.nonzero(inside[:-1] & (row_idx[:-1] == row_idx[1:]))[0]
+    cols = (x1 - x0) * ss
+    col = lambda x: np.clip(np.ceil((x - x0) * ss - 0.5), 0, cols).astype(np.intp)
+    diff = np.zeros((rows, cols + 1), dtype=np.int32)
+    np.add.at(diff, (row_idx[start], col(xs[start])), 1)
+    np.add.at(diff, (row_idx[start], col(xs[start + 1])), -1)
+    samples = np.cumsum(diff[:, :cols], axis=1) > 0
+    mask = samples.reshape(y1 - y0, ss, x1 - x0, ss).mean(axis=(1, 3))
+    return (x0, y0), mask
+
+
+def to_png(chart, scale=2):
+    """Render a chart as PNG bytes at `scale` pixels per point."""
+    from image_prep import encode_png
+    if np is None:
+        raise RuntimeError("PNG output needs NumPy")
+    width, height = math.ceil(chart.width * scale), math.ceil(chart.height * scale)
+    canvas = np.ones((height, width, 3), dtype=np.float32)
+    fonts = {}
+    for bold, name in ((False, 'DejaVuSans.ttf'), (True, 'DejaVuSans-Bold.ttf')):
+        path = find_font(name)
+        fonts[bold] = TrueTypeFont(path) if path else None
+
+    for item in chart.items:
+        if item[0] == 'path':
+            subpaths, color = item[1], item[2]
+        else:
+            _, x, y, text, size, bold, anchor, color = item
+            font = fonts[bold]
+            if font is None:
+                continue
+            shift = {'start': 0, 'middle': 0.5, 'end': 1}[anchor] * font.text_width(text, size)
+            subpaths = font.path(text, x - shift, y, size)
+        covered = _coverage(_polygons(subpaths, scale), width, height)
+        if covered is None:
+            continue
+        (x0, y0), mask = covered
+        region = canvas[y0:y0 + mask.shape[0], x0:x0 + mask.shape[1]]
+        alpha = mask[:, :, None].astype(np.float32)
+        region[:] = region * (1 - alpha) + np.array(rgb(color), dtype=np.float32) * alpha
+
+    rgba = np.empty((height, width, 4), dtype=np.uint8)
+    rgba[:, :, :3] = np.rint(canvas * 255)
+    rgba[:, :, 3] = 255
+    return encode_png(rgba, dpi=72 * scale)
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', nargs='?',
+                        default=os.path.join(script_dir, "Furientis_CMMC_Compliance_Strategy.md"),
+                        help='markdown source with the Section 9 cost tables, or - for stdin')
+    parser.add_argument('-o', '--output-dir', default=os.path.join(script_dir, 'diagrams'),
+                        help='directory for the chart files (default: diagrams/)')
+    parser.add_argument('--format', choices=['svg', 'png'], action='append',
+                        help='output format; repeat for both (default: svg)')
+    parser.add_argument('--scale', type=float, default=2, help='PNG pixels per point (default 2)')
+    args = parser.parse_args()
+
+    charts = figures(*section_costs(args.input))
+    for filename, chart in charts.items():
+        base = os.path.join(args.output_dir, os.path.splitext(filename)[0])
+        for fmt in args.format or ['svg']:
+            if fmt == 'png' and np is None:
+                print(f"Skipped {base}.png (PNG output needs NumPy)")
+                continue
+            data = to_svg(chart).encode('utf-8') if fmt == 'svg' else to_png(chart, args.scale)
+            with open(f"{base}.{fmt}", 'wb') as f:
+                f.write(data)
+            print(f"Created: {base}.{fmt}")
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Parallel compression and output writing for the document generators -
+deflates PDF streams and DOCX zip members on a thread pool (zlib releases
+the GIL) while layout goes on, and writes results back in submission order
+through a bounded stage, so serializing and disk writes overlap.
+Output is reproducible: no wall-clock metadata, and files whose content is
+unchanged are not rewritten.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_LEVEL = 6
+
+# Jobs each compression thread may have queued before submit() blocks the producer
+PENDING_PER_WORKER = 4
+
+# Chunks a staged() producer may run ahead of its consumer
+STAGE_DEPTH = 16
+
+# Zip member timestamp when none is requested: the DOS date-time epoch
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+
+class _Done:
+    """Already-computed result with the Future interface, for inline compression."""
+
+    def __init__(self, value):
+        self._value = value
+
+    def result(self):
+        return self._value
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def source_date_time():
+    """Zip timestamp from SOURCE_DATE_EPOCH (UTC) if set, else ZIP_EPOCH."""
+    epoch = os.environ.get('SOURCE_DATE_EPOCH')
+    if not epoch:
+        return ZIP_EPOCH
+    return max(ZIP_EPOCH, time.gmtime(int(epoch))[:6])
+
+
+def _file_digest(path):
+    """SHA-256 of a file's content, or None if it cannot be read."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.digest()
+
+
+def write_if_changed(path, data):
+    """Write `data` to `path` unless the file already holds exactly that content.
+
+    Returns True if the file was written. An unchanged file keeps its
+    mtime, so sync and backup jobs only see files that really changed.
+    New content is written to a temporary file and moved into place.
+    """
+    if os.path.exists(path) and os.path.getsize(path) == len(data):
+        if _file_digest(path) == hashlib.sha256(data).digest():
+            return False
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        _discard(tmp_path)
+        raise
+    return True
+
+
+def _discard(tmp_path):
+    # The temporary file is missing if open() itself failed; keep that error
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(tmp_path)
+
+
+def write_chunks_if_changed(path, chunks):
+    """Streaming form of write_if_changed() for an iterable of byte chunks.
+
+    Chunks go to a temporary file as they arrive and are hashed on the
+    way; the file only replaces `path` if the content differs.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+    except BaseException:
+        _discard(tmp_path)
+        raise
+    if (os.path.exists(path) and os.path.getsize(path) == size
+            and _file_digest(path) == digest.digest()):
+        os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, path)
+    return True
+
+
+def read_manifest(path, target):
+    """The build manifest at `path` if it still describes the file `target`, else None.
+
+    A manifest records how an output file was built so the next build can
+    reuse parts of it; it is only trusted while the file's size and mtime
+    are the ones write_manifest() saw.
+    """
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+        stat = os.stat(target)
+    except (OSError, ValueError):
+        return None
+    if [stat.st_size, stat.st_mtime_ns] != manifest.get('file'):
+        return None
+    return manifest
+
+
+def write_manifest(path, target, manifest):
+    """Save `manifest` (a JSON-able dict) at `path` for the file `target` as it is now."""
+    stat = os.stat(target)
+    manifest['file'] = [stat.st_size, stat.st_mtime_ns]
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    write_if_changed(path, json.dumps(manifest, separators=(',', ':')).encode('utf-8'))
+
+
+def staged(chunks, depth=STAGE_DEPTH):
+    """Iterate `chunks` on a thread of its own, at most `depth` items ahead.
+
+    The bounded queue between the two sides is the backpressure: a
+    producer that outruns its consumer blocks instead of buffering the
+    whole output. An exception in the producer is raised in the consumer;
+    a consumer that stops early stops the producer.
+    """
+    items = queue.Queue(depth)
+    stop = threading.Event()
+    end = object()
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if stop.is_set():
+                    return
+                items.put((chunk, None))
+            items.put((end, None))
+        except BaseException as e:
+            items.put((end, e))
+
+    thread = threading.Thread(target=produce, name='stage', daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk, error = items.get()
+            if chunk is end:
+                if error is not None:
+                    raise error
+                return
+            yield chunk
+    finally:
+        stop.set()
+        while thread.is_alive():  # Unblock a producer waiting on a full queue
+            try:
+                items.get(timeout=0.05)
+            except queue.Empty:
+                pass
+
+
+def _to_bytes(data):
+    return data.encode('utf-8') if isinstance(data, str) else data
+
+
+def _read_payload(path, name, entry):
+    """Compressed payload of member `name` in the archive at `path`, or None if it is not where `entry` says."""
+    _, _, _, _, offset, packed = entry
+    encoded = name.encode('utf-8')
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            header = f.read(30 + len(encoded))
+            payload = f.read(packed)
+    except OSError:
+        return None
+    if (len(header) < 30 or struct.unpack_from('<I', header)[0] != 0x04034b50
+            or header[30:] != encoded or len(payload) != packed):
+        return None
+    return payload
+
+
+def _deflate_member(data, level, previous, *args):
+    """Deflate one zip member; `data` may be a callable producing the bytes.
+
+    Returns (method, payload, crc, size, digest). Members that do not
+    shrink (already-compressed images) are stored instead. `previous` is
+    None or (archive path, name, manifest entry) of an earlier build; if
+    the content is unchanged its payload is copied instead of deflated.
+    """
+    if callable(data):
+        data = data(*args)
+    data = _to_bytes(data)
+    digest = hashlib.sha256(data).hexdigest()
+    if previous and previous[2][0] == digest:
+        method, crc, size = previous[2][1:4]
+        payload = _read_payload(*previous)
+        if payload is not None:
+            return method, payload, crc, size, digest
+    packer = zlib.compressobj(level, zlib.DEFLATED, -15)
+    packed = packer.compress(data) + packer.flush()
+    crc = zlib.crc32(data)
+    if len(packed) >= len(data):
+        return ZIP_STORED, data, crc, len(data), digest
+    return ZIP_DEFLATED, packed, crc, len(data), digest
+
+
+def _deflate_open(data, level):
+    """zlib stream of `data` left open for close_stream(): sync-flushed,
+    without a final block or checksum. Returns (head, adler32)."""
+    packer = zlib.compressobj(level)
+    return packer.compress(data) + packer.flush(zlib.Z_SYNC_FLUSH), zlib.adler32(data)
+
+
+def close_stream(opened, tail, level=DEFAULT_LEVEL):
+    """Finish an open stream from Compressor.open_stream() with `tail` appended.
+
+    The head ends on a byte boundary, so the tail is deflated on its own
+    as the final block and only the checksum covers both; the result
+    inflates to head data + tail.
+    """
+    head, checksum = opened
+    tail = _to_bytes(tail)
+    packer = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return head + packer.compress(tail) + packer.flush() + struct.pack('>I', zlib.adler32(tail, checksum))
+
+
+class Compressor:
+    """Thread pool for deflate jobs.
+
+    Every method returns a future; with one worker jobs run inline on the
+    calling thread. At most PENDING_PER_WORKER jobs per thread wait in
+    the pool: submitting more blocks until one finishes, so input that
+    outpaces compression is not buffered without limit. Jobs must not
+    submit further jobs. Use as a context manager to shut the pool down.
+    """
+
+    def __init__(self, workers=None, level=DEFAULT_LEVEL):
+        self.workers = default_workers() if workers is None else max(1, workers)
+        self.level = level
+        self._pool = (ThreadPoolExecutor(self.workers, thread_name_prefix='deflate')
+                      if self.workers > 1 else None)
+        self._slots = threading.Semaphore(self.workers * (PENDING_PER_WORKER + 1))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def submit(self, fn, *args):
+        if self._pool is None:
+            return _Done(fn(*args))
+        self._slots.acquire()
+        future = self._pool.submit(fn, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def stream(self, data):
+        """Future of `data` as a zlib stream (PDF /FlateDecode)."""
+        return self.submit(zlib.compress, _to_bytes(data), self.level)
+
+    def open_stream(self, data):
+        """Future of `data` as an open zlib stream, finished later by close_stream()."""
+        return self.submit(_deflate_open, _to_bytes(data), self.level)
+
+    def member(self, data, *args):
+        """Future of a deflated zip member; `data` is bytes, str, or a callable and its args."""
+        return self.submit(_deflate_member, data, self.level, None, *args)
+
+
+class ZipWriter:
+    """Write a ZIP archive from members compressed by a Compressor.
+
+    Members are written in the order they were added, each as soon as it
+    is compressed, all stamped with the same `date_time` (default:
+    source_date_time()), so equal input gives a byte-identical archive.
+    The file is only rewritten when its content changes; `written`
+    records whether it was. Archives are small, so there is no ZIP64.
+
+    With a `manifest` path, each member's content hash and location are
+    recorded there. Members made by member() on the next build whose
+    content is unchanged are then copied raw from the previous archive
+    rather than compressed again; `reused` counts them.
+    """
+
+    def __init__(self, path, compressor, date_time=None, manifest=None):
+        self.path = path
+        self.compressor = compressor
+        self.date_time = date_time or source_date_time()
+        self.manifest = manifest
+        self.entries = []
+        self.written = None
+        self.reused = 0
+        previous = read_manifest(manifest, path) if manifest else None
+        # Payloads deflated at another level would not match a fresh build
+        self._previous = previous['members'] if previous and previous.get('level') == compressor.level else {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+
+    def member(self, name, data, *args):
+        """Future of member `name` for add(); `data` is bytes, str, or a callable and its args."""
+        entry = self._previous.get(name)
+        return self.compressor.submit(_deflate_member, data, self.compressor.level,
+                                      entry and (self.path, name, entry), *args)
+
+    def add(self, name, data):
+        """Add a member from bytes or str, or from a future made by member() or Compressor.member()."""
+        if not hasattr(data, 'result'):
+            data = self.member(name, data)
+        self.entries.append((name, data))
+
+    def close(self):
+        members = {}
+        self.written = write_chunks_if_changed(self.path, staged(self._chunks(members)))
+        if self.manifest:
+            write_manifest(self.manifest, self.path, {'level': self.compressor.level, 'members': members})
+
+    def _chunks(self, members):
+        """Yield the archive member by member as compression finishes; fills `members` for the manifest."""
+        year, month, day, hour, minute, second = self.date_time
+        dos_time = (hour << 11) | (minute << 5) | (second // 2)
+        dos_date = ((year - 1980) << 9) | (month << 5) | day
+        central = []
+        offset = 0
+        for name, future in self.entries:
+            method, payload, crc, size, digest = future.result()
+            entry = [digest, method, crc, size, offset, len(payload)]
+            if self._previous.get(name, [None])[:4] == entry[:4]:
+                self.reused += 1
+            members[name] = entry
+            encoded = name.encode('utf-8')
+            flags = 0x800 if not name.isascii() else 0
+            fields = (20, flags, method, dos_time, dos_date, crc, len(payload), size, len(encoded))
+            yield struct.pack('<IHHHHHIIIHH', 0x04034b50, *fields, 0) + encoded
+            yield payload
+            central.append(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, 3 << 8 | 20, *fields,
+                                       0, 0, 0, 0, 0o644 << 16, offset) + encoded)
+            offset += 30 + len(encoded) + len(payload)
+        directory = b''.join(central)
+        yield directory + struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, len(central), len(central),
+                                      len(directory), offset, 0)
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+NIST SP 800-171 control matrix - loads the requirement catalog and our
+control mappings (CSV snapshots with one row per system and requirement)
+and computes domain and system coverage, gap lists, SPRS scores and POA&M
+candidates on bitsets holding one bit per requirement. The bitsets are
+ints: 110 requirements fit in two machine words, so a catalog-wide AND,
+OR or bit_count() is one operation, and masks are immutable values that
+key dicts and compare directly. The results render as tables in the
+document generators through [CONTROLS:view] lines.
+"""
+
+import argparse
+import collections
+import csv
+import functools
+import os
+
+CONTROLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'controls')
+CATALOG = os.path.join(CONTROLS_DIR, 'nist_800_171r2.csv')
+DOMAINS = os.path.join(CONTROLS_DIR, 'domains.csv')
+
+# Mapping statuses; inherited means a provider (e.g. a FedRAMP High cloud) meets it for the system
+STATUSES = ('implemented', 'inherited', 'partial', 'planned', 'not_applicable')
+
+# SPRS scoring (DoD Assessment Methodology); CMMC conditional status needs 80% of the maximum
+MAX_SCORE = 110
+CONDITIONAL_SCORE = 88
+
+VIEWS = ('domains', 'matrix', 'gaps', 'poam', 'summary')
+
+# Bitsets per coverage state; partial and planned requirements are also gaps
+Coverage = collections.namedtuple('Coverage', 'met partial planned na gaps')
+
+
+def practice_id(requirement):
+    """CMMC practice identifier of a catalog row, e.g. AC.L2-3.1.1."""
+    return f"{requirement['domain']}.L2-{requirement['requirement']}"
+
+
+class Catalog:
+    """The requirement catalog; each requirement's bit is its position in catalog order."""
+
+    def __init__(self, catalog_path=CATALOG, domains_path=DOMAINS):
+        with open(domains_path, newline='', encoding='utf-8') as f:
+            self.domains = list(csv.DictReader(f))
+        with open(catalog_path, newline='', encoding='utf-8') as f:
+            self.requirements = list(csv.DictReader(f))
+        self.all = (1 << len(self.requirements)) - 1
+        self.index = {}  # Requirement number or practice id -> bit
+        self.domain_masks = {domain['domain']: 0 for domain in self.domains}
+        self.points = collections.defaultdict(int)    # Points deducted when unmet -> requirements
+        self.partial_points = collections.defaultdict(int)  # The same when partially implemented
+        self.poam = 0  # Requirements that may be left open on a POA&M
+        for bit, req in enumerate(self.requirements):
+            if req['domain'] not in self.domain_masks:
+                raise ValueError(f"{catalog_path}: {req['requirement']} has unknown domain {req['domain']}")
+            self.index[req['requirement']] = self.index[practice_id(req)] = bit
+            self.domain_masks[req['domain']] |= 1 << bit
+            self.points[int(req['points'])] |= 1 << bit
+            if req['partial_points']:
+                self.partial_points[int(req['partial_points'])] |= 1 << bit
+            if req['poam'] == 'yes':
+                self.poam |= 1 << bit
+        self.reduced = 0  # Requirements with partial credit
+        for mask in self.partial_points.values():
+            self.reduced |= mask
+
+    def members(self, mask):
+        """Catalog rows whose bits are set in `mask`, in catalog order."""
+        rows = []
+        while mask:
+            low = mask & -mask
+            rows.append(self.requirements[low.bit_length() - 1])
+            mask ^= low
+        return rows
+
+    def score(self, coverage):
+        """SPRS score: MAX_SCORE less the points of every gap.
+
+        Partially implemented requirements with partial credit in the
+        catalog deduct their partial points instead.
+        """
+        reduced = coverage.partial & self.reduced
+        full = coverage.gaps & ~reduced
+        deducted = sum(points * (mask & full).bit_count() for points, mask in self.points.items())
+        deducted += sum(points * (mask & reduced).bit_count() for points, mask in self.partial_points.items())
+        return MAX_SCORE - deducted
+
+
+@functools.lru_cache(maxsize=None)
+def load_catalog():
+    """The shipped catalog, read once per process."""
+    return Catalog()
+
+
+class Snapshot:
+    """One mapping file: per system, a bitset per status, plus implementation and evidence text.
+
+    A requirement without a row for a system is unaddressed there, which
+    counts as a gap.
+    """
+
+    def __init__(self, path, catalog=None):
+        self.path = path
+        self.catalog = catalog or load_catalog()
+        self.systems = {}  # System -> {status: bitset}
+        self.details = {}  # (system, bit) -> (status, implementation, evidence)
+        with open(path, newline='', encoding='utf-8') as f:
+            for line, row in enumerate(csv.DictReader(f), 2):
+                system = row['system'].strip()
+                bit = self.catalog.index.get(row['requirement'].strip())
+                status = row['status'].strip().lower().replace(' ', '_')
+                if bit is None:
+                    raise ValueError(f"{path}:{line}: unknown requirement {row['requirement']!r}")
+                if status not in STATUSES:
+                    raise ValueError(f"{path}:{line}: status must be one of {', '.join(STATUSES)}")
+                if (system, bit) in self.details:
+                    raise ValueError(f"{path}:{line}: {row['requirement']} is mapped twice for {system}")
+                masks = self.systems.setdefault(system, dict.fromkeys(STATUSES, 0))
+                masks[status] |= 1 << bit
+                self.details[system, bit] = (status, row.get('implementation', '').strip(),
+                                             row.get('evidence', '').strip())
+
+    def coverage(self, system=None):
+        """Coverage of one system, or of the organization when `system` is None.
+
+        A requirement is met for the organization when every system meets
+        it or has it not applicable (and at least one applies it); it is
+        partial or planned when any system that has not met it says so.
+        """
+        everything = self.catalog.all
+        if system is not None:
+            systems = [self.systems[system]]
+        else:
+            systems = list(self.systems.values())
+        met_or_na, na, partial, planned = everything, everything, 0, 0
+        for masks in systems:
+            met_or_na &= masks['implemented'] | masks['inherited'] | masks['not_applicable']
+            na &= masks['not_applicable']
+            partial |= masks['partial']
+            planned |= masks['planned']
+        if not systems:
+            met_or_na = na = 0
+        met = met_or_na & ~na
+        gaps = everything & ~met_or_na
+        return Coverage(met, partial & gaps, planned & gaps & ~partial, na, gaps)
+
+
+def status_label(coverage, bit):
+    """Display status of one requirement under `coverage`."""
+    mask = 1 << bit
+    for label, state in (('Met', coverage.met), ('Partial', coverage.partial), ('Planned', coverage.planned),
+                         ('N/A', coverage.na)):
+        if state & mask:
+            return label
+    return 'Not addressed'
+
+
+def _percent(part, whole):
+    return f"{100 * part / whole:.0f}%" if whole else "-"
+
+
+def domain_rows(catalog, coverage=None):
+    """Practices per domain; with `coverage`, also the count in each state."""
+    if coverage is None:
+        rows = [['Domain', 'Abbrev', 'Practices', 'Key Focus Areas']]
+        for domain in catalog.domains:
+            count = catalog.domain_masks[domain['domain']].bit_count()
+            rows.append([domain['name'], domain['domain'], str(count), domain['focus']])
+        return rows
+
+    rows = [['Domain', 'Abbrev', 'Practices', 'Met', 'Partial', 'Planned', 'Gaps', 'Coverage']]
+    for domain in catalog.domains + [None]:
+        mask = catalog.domain_masks[domain['domain']] if domain else catalog.all
+        counts = [(state & mask).bit_count() for state in (coverage.met, coverage.partial, coverage.planned,
+                                                            coverage.gaps)]
+        applicable = (mask & ~coverage.na).bit_count()
+        label = [domain['name'], domain['domain']] if domain else ['**Total**', '']
+        rows.append(label + [str(mask.bit_count())] + [str(n) for n in counts] + [_percent(counts[0], applicable)])
+    return rows
+
+
+def matrix_rows(snapshot):
+    """Every requirement with its status, implementation and evidence, per system."""
+    catalog = snapshot.catalog
+    many = len(snapshot.systems) > 1
+    rows = [(['System'] if many else []) + ['Practice', 'Status', 'Implementation', 'Evidence']]
+    for system in snapshot.systems:
+        coverage = snapshot.coverage(system)
+        for bit, req in enumerate(catalog.requirements):
+            _, implementation, evidence = snapshot.details.get((system, bit), (None, '', ''))
+            rows.append(([system] if many else []) +
+                        [f"{practice_id(req)} {req['title']}", status_label(coverage, bit), implementation, evidence])
+    return rows
+
+
+def gap_rows(snapshot):
+    """Requirements the organization has not met, with their SPRS points and POA&M eligibility."""
+    catalog = snapshot.catalog
+    coverage = snapshot.coverage()
+    rows = [['Practice', 'Status', 'Points', 'POA&M']]
+    for req in catalog.members(coverage.gaps):
+        bit = catalog.index[req['requirement']]
+        rows.append([f"{practice_id(req)} {req['title']}", status_label(coverage, bit), req['points'],
+                     'Yes' if catalog.poam >> bit & 1 else 'No'])
+    return rows
+
+
+def poam_rows(snapshot):
+    """Gaps that may stay open on a POA&M, with the planned implementation from each system."""
+    catalog = snapshot.catalog
+    coverage = snapshot.coverage()
+    rows = [['Practice', 'Points', 'Planned Implementation']]
+    for req in catalog.members(coverage.gaps & catalog.poam):
+        bit = catalog.index[req['requirement']]
+        plans = [snapshot.details[system, bit][1] for system in snapshot.systems
+                 if (system, bit) in snapshot.details and snapshot.details[system, bit][1]]
+        rows.append([f"{practice_id(req)} {req['title']}", req['points'], '; '.join(plans)])
+    return rows
+
+
+def summary_row(catalog, label, coverage):
+    """[label, SPRS score, met, gaps, POA&M candidates, conditional status possible]."""
+    score = catalog.score(coverage)
+    blocking = coverage.gaps & ~catalog.poam
+    conditional = 'Yes' if score >= CONDITIONAL_SCORE and not blocking else 'No'
+    met, applicable = coverage.met.bit_count(), (catalog.all & ~coverage.na).bit_count()
+    return [label, str(score), f"{met} ({_percent(met, applicable)})",
+            str(coverage.gaps.bit_count()), str((coverage.gaps & catalog.poam).bit_count()), conditional]
+
+
+def summary_rows(snapshot):
+    """SPRS score and gap counts per system, then for the organization."""
+    rows = [['System', 'SPRS Score', 'Met', 'Gaps', 'POA&M Candidates', 'Conditional']]
+    for system in snapshot.systems:
+        rows.append(summary_row(snapshot.catalog, system, snapshot.coverage(system)))
+    if len(snapshot.systems) > 1:
+        rows.append(summary_row(snapshot.catalog, '**Organization**', snapshot.coverage()))
+    return rows
+
+
+def table(view, mapping=None):
+    """Rows (header first) of one view; every view but `domains` needs a mapping file."""
+    if view not in VIEWS:
+        raise ValueError(f"unknown control matrix view {view!r} (expected one of {', '.join(VIEWS)})")
+    catalog = load_catalog()
+    if view == 'domains':
+        return domain_rows(catalog, Snapshot(mapping, catalog).coverage() if mapping else None)
+    if not mapping:
+        raise ValueError(f"control matrix view {view!r} needs a mapping file: [CONTROLS:{view}](mapping.csv)")
+    snapshot = Snapshot(mapping, catalog)
+    return {'matrix': matrix_rows, 'gaps': gap_rows, 'poam': poam_rows, 'summary': summary_rows}[view](snapshot)
+
+
+def expand(elements):
+    """Replace the parser's ('controls', (view, mapping)) elements with ('table', rows)."""
+    for elem_type, content in elements:
+        if elem_type == 'controls':
+            yield ('table', table(*content))
+        else:
+            yield (elem_type, content)
+
+
+def diff(old, new):
+    """Yield (system, newly met requirements, no longer met requirements) between two snapshots."""
+    for system in sorted(set(old.systems) | set(new.systems)):
+        before = old.coverage(system).met if system in old.systems else 0
+        after = new.coverage(system).met if system in new.systems else 0
+        yield system, new.catalog.members(after & ~before), new.catalog.members(before & ~after)
+
+
+def print_table(rows):
+    widths = [max(len(row[c]) for row in rows) for c in range(len(rows[0]))]
+    for k, row in enumerate(rows):
+        print('  '.join(cell.replace('**', '').ljust(width) for cell, width in zip(row, widths)).rstrip())
+        if k == 0:
+            print('  '.join('-' * width for width in widths))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    report_cmd = commands.add_parser('report', help='score and summarize mapping snapshots')
+    report_cmd.add_argument('mappings', nargs='+', help='mapping CSV files (system,requirement,status,...)')
+    report_cmd.add_argument('--domains', action='store_true', help='show coverage per domain')
+    report_cmd.add_argument('--gaps', action='store_true', help='list unmet requirements')
+    report_cmd.add_argument('--poam', action='store_true', help='list POA&M candidates')
+    diff_cmd = commands.add_parser('diff', help='requirements newly met or lost between two snapshots')
+    diff_cmd.add_argument('old')
+    diff_cmd.add_argument('new')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'report':
+            catalog = load_catalog()
+            snapshots = [Snapshot(path, catalog) for path in args.mappings]
+            rows = [['Snapshot'] + summary_rows(snapshots[0])[0]]
+            for snapshot in snapshots:
+                rows.extend([os.path.basename(snapshot.path)] + row for row in summary_rows(snapshot)[1:])
+            print_table(rows)
+            for snapshot in snapshots:
+                for flag, build in (('domains', lambda s: domain_rows(catalog, s.coverage())),
+                                    ('gaps', gap_rows), ('poam', poam_rows)):
+                    if getattr(args, flag):
+                        print(f"\n{os.path.basename(snapshot.path)}: {flag}")
+                        print_table(build(snapshot))
+        else:
+            for system, gained, lost in diff(Snapshot(args.old), Snapshot(args.new)):
+                print(f"{system}: +{len(gained)} -{len(lost)}")
+                for sign, reqs in (('+', gained), ('-', lost)):
+                    for req in reqs:
+                        print(f"  {sign} {practice_id(req)} {req['title']}")
+    except (OSError, ValueError) as e:
+        raise SystemExit(str(e))
@@ -66,7 +66,7 @@ def main():
     diagrams = [
         ('dual_echelon_architecture.mmd', 'dual_echelon_architecture.png'),
         ('cui_data_flow.mmd', 'cui_data_flow.png'),
-        ('implementation_roadmap.mmd', 'implementation_roadmap.png'),
+        # implementation_roadmap.png is drawn by `roadmap.py gantt` with its .mmd
     ]
 
     print("Rendering Mermaid diagrams using mermaid.ink API...")
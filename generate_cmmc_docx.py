@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
 """
 CMMC Compliance Strategy DOCX Generator - Converts markdown to DOCX with full content.
-Supports embedded images. Shows progress bar during generation.
+Supports embedded images, resampled to their placed size when NumPy is installed
+(see image_prep). Shows progress bar during generation.
 """
 
+import argparse
+import hashlib
 import os
-import re
-import sys
-import zipfile
-from datetime import datetime
+
+import control_matrix
+import roadmap
+from compression import Compressor, ZipWriter
+from image_prep import DEFAULT_DPI, prepare_image
+from markdown_parser import (BOLD, CODE, ITALIC, LINK, document_title, parse_markdown, strip_markdown,
+                             tokenize_inline)
 
 # Progress tracking
 TOTAL_STEPS = 15
@@ -33,15 +39,35 @@ COLORS = {
 def escape_xml(text):
     return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
 
-def strip_markdown(text):
-    """Remove markdown formatting from text."""
-    text = re.sub(r'\*\*(.+?)\*\*', r'\1', text)  # Bold
-    text = re.sub(r'\*(.+?)\*', r'\1', text)  # Italic
-    text = re.sub(r'__(.+?)__', r'\1', text)  # Bold alt
-    text = re.sub(r'_(.+?)_', r'\1', text)  # Italic alt
-    text = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', text)  # Links
-    text = re.sub(r'`([^`]+)`', r'\1', text)  # Inline code
-    return text
+def create_runs_xml(text, base_style=0):
+    """Create <w:r> runs for inline markdown (bold, italic, code, links).
+
+    base_style is OR-ed into every run. Fonts, sizes and colors belong in
+    styles, so runs only carry the inline formatting itself.
+    """
+    xml = []
+    for chunk, style, href in tokenize_inline(text):
+        style |= base_style
+        rpr = ""
+        if style & LINK:
+            rpr += '<w:rStyle w:val="Hyperlink"/>'
+        elif style & CODE:
+            rpr += '<w:rStyle w:val="CodeChar"/>'
+        if style & BOLD:
+            rpr += '<w:b/>'
+        if style & ITALIC:
+            rpr += '<w:i/>'
+        # Whitespace only needs preserving at the edges of a run
+        space = ' xml:space="preserve"' if chunk[:1].isspace() or chunk[-1:].isspace() else ''
+        run = f'<w:r>{f"<w:rPr>{rpr}</w:rPr>" if rpr else ""}<w:t{space}>{escape_xml(chunk)}</w:t></w:r>'
+        if href:
+            # A HYPERLINK field needs no relationship part entry
+            run = (f'<w:r><w:fldChar w:fldCharType="begin"/></w:r>'
+                   f'<w:r><w:instrText xml:space="preserve"> HYPERLINK "{escape_xml(href)}" </w:instrText></w:r>'
+                   f'<w:r><w:fldChar w:fldCharType="separate"/></w:r>{run}'
+                   f'<w:r><w:fldChar w:fldCharType="end"/></w:r>')
+        xml.append(run)
+    return ''.join(xml)
 
 def get_image_size(image_path):
     """Get image dimensions from PNG file."""
@@ -79,111 +105,44 @@ def get_image_size(image_path):
         pass
     return 5000000, 3750000  # Default fallback
 
-def parse_markdown(md_path):
-    """Parse markdown file into structured content."""
-    with open(md_path, 'r') as f:
-        content = f.read()
-
-    base_dir = os.path.dirname(md_path)
-    elements = []
-    lines = content.split('\n')
-    i = 0
-    in_code_block = False
-    code_content = []
-    in_table = False
-    table_rows = []
-
-    while i < len(lines):
-        line = lines[i]
-
-        # Code blocks
-        if line.startswith('```'):
-            if in_code_block:
-                elements.append(('code', '\n'.join(code_content)))
-                code_content = []
-                in_code_block = False
-            else:
-                in_code_block = True
-            i += 1
-            continue
-
-        if in_code_block:
-            code_content.append(line)
-            i += 1
-            continue
-
-        # Tables
-        if '|' in line and line.strip().startswith('|'):
-            if not in_table:
-                in_table = True
-                table_rows = []
-            cells = [c.strip() for c in line.split('|')[1:-1]]
-            if not all(c.replace('-', '').replace(':', '') == '' for c in cells):
-                table_rows.append(cells)
-            i += 1
-            continue
-        elif in_table:
-            if table_rows:
-                elements.append(('table', table_rows))
-            in_table = False
-            table_rows = []
-
-        # Images - ![alt](path)
-        img_match = re.match(r'^!\[([^\]]*)\]\(([^)]+)\)\s*$', line.strip())
-        if img_match:
-            alt_text = img_match.group(1)
-            img_path = img_match.group(2)
-            # Resolve relative path
-            full_path = os.path.join(base_dir, img_path)
-            if os.path.exists(full_path):
-                elements.append(('image', (full_path, alt_text)))
-            i += 1
-            continue
-
-        # Headers
-        if line.startswith('# '):
-            elements.append(('h1', line[2:].strip()))
-        elif line.startswith('## '):
-            elements.append(('h2', line[3:].strip()))
-        elif line.startswith('### '):
-            elements.append(('h3', line[4:].strip()))
-        elif line.startswith('#### '):
-            elements.append(('h4', line[5:].strip()))
-        # Bullets
-        elif line.strip().startswith('- '):
-            elements.append(('bullet', line.strip()[2:]))
-        elif re.match(r'^\d+\.\s', line.strip()):
-            elements.append(('numbered', re.sub(r'^\d+\.\s', '', line.strip())))
-        # Horizontal rule
-        elif line.strip() == '---':
-            elements.append(('hr', ''))
-        # Regular paragraph (including italics for captions)
-        elif line.strip():
-            text = line.strip()
-            # Check if it's an italic caption line
-            if text.startswith('*') and text.endswith('*') and not text.startswith('**'):
-                elements.append(('caption', text[1:-1]))  # Remove surrounding asterisks
-            else:
-                elements.append(('para', text))
-
-        i += 1
-
-    # Handle trailing table
-    if in_table and table_rows:
-        elements.append(('table', table_rows))
-
-    return elements
-
 def create_paragraph_xml(text, style="Normal"):
-    text = strip_markdown(text)
-    return f'''<w:p><w:pPr><w:pStyle w:val="{style}"/></w:pPr>
-<w:r><w:t xml:space="preserve">{escape_xml(text)}</w:t></w:r></w:p>'''
+    ppr = "" if style == "Normal" else f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>'
+    return f'<w:p>{ppr}{create_runs_xml(text)}</w:p>'
+
+def create_heading_xml(text, level, bookmark_id):
+    """Create a heading paragraph wrapped in a _Toc bookmark."""
+    return (f'<w:p><w:pPr><w:pStyle w:val="Heading{level}"/></w:pPr>'
+            f'<w:bookmarkStart w:id="{bookmark_id}" w:name="_Toc{bookmark_id}"/>'
+            f'{create_runs_xml(text)}<w:bookmarkEnd w:id="{bookmark_id}"/></w:p>')
+
+def create_toc_xml(headings, levels=(2, 3)):
+    """Create a TOC field whose cached result links to each heading bookmark.
+
+    Page numbers are PAGEREF fields; Word fills them in when it updates
+    fields on open (see create_settings_xml).
+    """
+    entries = [(level, text, bookmark_id) for level, text, bookmark_id in headings if level in levels]
+    xml = '''<w:p><w:pPr><w:pStyle w:val="TOCHeading"/></w:pPr><w:r><w:t>Table of Contents</w:t></w:r></w:p>'''
+    field_begin = f'''<w:r><w:fldChar w:fldCharType="begin"/></w:r>
+<w:r><w:instrText xml:space="preserve"> TOC \\o "{levels[0]}-{levels[-1]}" \\h \\z \\u </w:instrText></w:r>
+<w:r><w:fldChar w:fldCharType="separate"/></w:r>'''
+    field_end = '<w:r><w:fldChar w:fldCharType="end"/></w:r>'
+    if not entries:
+        return xml + f'<w:p>{field_begin}{field_end}</w:p>'
+    for idx, (level, text, bookmark_id) in enumerate(entries):
+        # Word styles the entries of heading level N as TOC N when it updates the field
+        xml += f'''<w:p><w:pPr><w:pStyle w:val="TOC{level}"/></w:pPr>
+{field_begin if idx == 0 else ''}<w:hyperlink w:anchor="_Toc{bookmark_id}" w:history="1">
+<w:r><w:t xml:space="preserve">{escape_xml(strip_markdown(text))}</w:t></w:r><w:r><w:tab/></w:r>
+<w:r><w:fldChar w:fldCharType="begin"/></w:r>
+<w:r><w:instrText xml:space="preserve"> PAGEREF _Toc{bookmark_id} \\h </w:instrText></w:r>
+<w:r><w:fldChar w:fldCharType="separate"/></w:r><w:r><w:t></w:t></w:r>
+<w:r><w:fldChar w:fldCharType="end"/></w:r></w:hyperlink>{field_end if idx == len(entries) - 1 else ''}</w:p>'''
+    return xml
 
 def create_caption_xml(text):
     """Create italic centered caption paragraph."""
-    text = strip_markdown(text)
-    return f'''<w:p><w:pPr><w:pStyle w:val="Caption"/><w:jc w:val="center"/></w:pPr>
-<w:r><w:rPr><w:i/><w:sz w:val="20"/></w:rPr><w:t xml:space="preserve">{escape_xml(text)}</w:t></w:r></w:p>'''
+    return f'<w:p><w:pPr><w:pStyle w:val="Caption"/></w:pPr>{create_runs_xml(text)}</w:p>'
 
 def create_image_xml(rel_id, width_emu, height_emu, alt_text=""):
     """Create drawing XML for an embedded image."""
@@ -224,13 +183,9 @@ xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing
 </w:r></w:p>'''
 
 def create_code_block_xml(text):
-    lines = text.split('\n')
-    xml = ""
-    for line in lines:
-        xml += f'''<w:p><w:pPr><w:pStyle w:val="Code"/></w:pPr>
-<w:r><w:rPr><w:rFonts w:ascii="Courier New" w:hAnsi="Courier New"/><w:sz w:val="18"/></w:rPr>
-<w:t xml:space="preserve">{escape_xml(line)}</w:t></w:r></w:p>'''
-    return xml
+    # Font and size come from the Code paragraph style
+    return ''.join(f'<w:p><w:pPr><w:pStyle w:val="Code"/></w:pPr><w:r><w:t xml:space="preserve">{escape_xml(line)}</w:t></w:r></w:p>'
+                   for line in text.split('\n'))
 
 def create_table_xml(rows):
     if not rows:
@@ -238,32 +193,20 @@ def create_table_xml(rows):
     num_cols = len(rows[0])
     col_width = 9360 // num_cols
 
-    xml = f'''<w:tbl><w:tblPr><w:tblW w:w="9360" w:type="dxa"/>
-<w:tblBorders>
-<w:top w:val="single" w:sz="4" w:color="{COLORS['table_border']}"/>
-<w:left w:val="single" w:sz="4" w:color="{COLORS['table_border']}"/>
-<w:bottom w:val="single" w:sz="4" w:color="{COLORS['table_border']}"/>
-<w:right w:val="single" w:sz="4" w:color="{COLORS['table_border']}"/>
-<w:insideH w:val="single" w:sz="4" w:color="{COLORS['table_border']}"/>
-<w:insideV w:val="single" w:sz="4" w:color="{COLORS['table_border']}"/>
-</w:tblBorders></w:tblPr><w:tblGrid>'''
-
-    for _ in range(num_cols):
-        xml += f'<w:gridCol w:w="{col_width}"/>'
-    xml += '</w:tblGrid>'
+    # Borders, header shading and bold come from the CmmcTable style;
+    # column widths from the grid (fixed layout), so cells carry no properties
+    xml = ['''<w:tbl><w:tblPr><w:tblStyle w:val="CmmcTable"/><w:tblW w:w="9360" w:type="dxa"/>
+<w:tblLook w:val="0020" w:firstRow="1" w:lastRow="0" w:firstColumn="0" w:lastColumn="0" w:noHBand="1" w:noVBand="1"/></w:tblPr><w:tblGrid>''',
+           f'<w:gridCol w:w="{col_width}"/>' * num_cols, '</w:tblGrid>']
 
     for idx, row in enumerate(rows):
-        xml += '<w:tr>'
+        xml.append('<w:tr><w:trPr><w:tblHeader/></w:trPr>' if idx == 0 else '<w:tr>')
         for cell in row:
-            shading = f'<w:shd w:val="clear" w:fill="{COLORS["table_header_bg"]}"/>' if idx == 0 else ''
-            bold = '<w:b/>' if idx == 0 else ''
-            cell_text = strip_markdown(str(cell))
-            xml += f'''<w:tc><w:tcPr><w:tcW w:w="{col_width}" w:type="dxa"/>{shading}</w:tcPr>
-<w:p><w:r><w:rPr>{bold}</w:rPr><w:t>{escape_xml(cell_text)}</w:t></w:r></w:p></w:tc>'''
-        xml += '</w:tr>'
-
-    xml += '</w:tbl>'
-    return xml
+            xml.append(f'<w:tc><w:p>{create_runs_xml(str(cell))}</w:p></w:tc>')
+        xml.append('</w:tr>')
+
+    xml.append('</w:tbl>')
+    return ''.join(xml)
 
 def create_styles_xml():
     return f'''<?xml version="1.0" encoding="UTF-8"?>
@@ -293,11 +236,81 @@ def create_styles_xml():
 <w:pPr><w:numPr><w:numId w:val="1"/></w:numPr></w:pPr></w:style>
 <w:style w:type="paragraph" w:styleId="ListNumber"><w:name w:val="List Number"/>
 <w:pPr><w:numPr><w:numId w:val="2"/></w:numPr></w:pPr></w:style>
+<w:style w:type="paragraph" w:styleId="TOCHeading"><w:name w:val="TOC Heading"/>
+<w:pPr><w:spacing w:before="400" w:after="200"/></w:pPr>
+<w:rPr><w:b/><w:sz w:val="28"/></w:rPr></w:style>
+<w:style w:type="paragraph" w:styleId="TOC2"><w:name w:val="toc 2"/>
+<w:pPr><w:tabs><w:tab w:val="right" w:leader="dot" w:pos="9350"/></w:tabs><w:spacing w:after="60"/></w:pPr>
+<w:rPr><w:b/></w:rPr></w:style>
+<w:style w:type="paragraph" w:styleId="TOC3"><w:name w:val="toc 3"/>
+<w:pPr><w:tabs><w:tab w:val="right" w:leader="dot" w:pos="9350"/></w:tabs><w:spacing w:after="40"/><w:ind w:left="220"/></w:pPr>
+<w:rPr><w:sz w:val="20"/></w:rPr></w:style>
+<w:style w:type="character" w:styleId="Hyperlink"><w:name w:val="Hyperlink"/>
+<w:rPr><w:color w:val="0563C1"/><w:u w:val="single"/></w:rPr></w:style>
 <w:style w:type="paragraph" w:styleId="Code"><w:name w:val="Code"/>
 <w:pPr><w:shd w:val="clear" w:fill="f5f5f5"/><w:spacing w:after="0"/></w:pPr>
 <w:rPr><w:rFonts w:ascii="Courier New" w:hAnsi="Courier New"/><w:sz w:val="18"/></w:rPr></w:style>
+<w:style w:type="character" w:styleId="CodeChar"><w:name w:val="Code Char"/>
+<w:rPr><w:rFonts w:ascii="Courier New" w:hAnsi="Courier New"/></w:rPr></w:style>
+<w:style w:type="paragraph" w:styleId="HorizontalRule"><w:name w:val="Horizontal Rule"/>
+<w:pPr><w:pBdr><w:bottom w:val="single" w:sz="12" w:color="000000"/></w:pBdr></w:pPr></w:style>
+<w:style w:type="paragraph" w:styleId="Header"><w:name w:val="header"/>
+<w:pPr><w:tabs><w:tab w:val="center" w:pos="4680"/><w:tab w:val="right" w:pos="9360"/></w:tabs>
+<w:pBdr><w:bottom w:val="single" w:sz="4" w:color="b3b3b3"/></w:pBdr><w:spacing w:after="0"/></w:pPr>
+<w:rPr><w:sz w:val="16"/><w:color w:val="666666"/></w:rPr></w:style>
+<w:style w:type="paragraph" w:styleId="Footer"><w:name w:val="footer"/>
+<w:pPr><w:tabs><w:tab w:val="center" w:pos="4680"/><w:tab w:val="right" w:pos="9360"/></w:tabs>
+<w:pBdr><w:top w:val="single" w:sz="4" w:color="b3b3b3"/></w:pBdr><w:spacing w:after="0"/></w:pPr>
+<w:rPr><w:sz w:val="16"/><w:color w:val="666666"/></w:rPr></w:style>
+<w:style w:type="paragraph" w:styleId="Marking"><w:name w:val="Marking"/>
+<w:pPr><w:jc w:val="center"/><w:spacing w:after="0"/></w:pPr>
+<w:rPr><w:b/><w:sz w:val="20"/></w:rPr></w:style>
+<w:style w:type="table" w:styleId="CmmcTable"><w:name w:val="CMMC Table"/>
+<w:tblPr><w:tblLayout w:type="fixed"/><w:tblBorders>
+<w:top w:val="single" w:sz="4" w:color="{COLORS['table_border']}"/>
+<w:left w:val="single" w:sz="4" w:color="{COLORS['table_border']}"/>
+<w:bottom w:val="single" w:sz="4" w:color="{COLORS['table_border']}"/>
+<w:right w:val="single" w:sz="4" w:color="{COLORS['table_border']}"/>
+<w:insideH w:val="single" w:sz="4" w:color="{COLORS['table_border']}"/>
+<w:insideV w:val="single" w:sz="4" w:color="{COLORS['table_border']}"/>
+</w:tblBorders></w:tblPr>
+<w:tblStylePr w:type="firstRow"><w:rPr><w:b/></w:rPr>
+<w:tcPr><w:shd w:val="clear" w:color="auto" w:fill="{COLORS['table_header_bg']}"/></w:tcPr></w:tblStylePr></w:style>
 </w:styles>'''
 
+def create_header_xml(header, marking):
+    """Default page header part: the marking banner above the running header."""
+    xml = f'<w:p><w:pPr><w:pStyle w:val="Marking"/></w:pPr>{create_runs_xml(marking)}</w:p>' if marking else ''
+    if header:
+        xml += f'<w:p><w:pPr><w:pStyle w:val="Header"/></w:pPr>{create_runs_xml(header)}</w:p>'
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<w:hdr xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">{xml}</w:hdr>'''
+
+def create_footer_xml(footer, marking, page_numbers=True):
+    """Default page footer part: running footer with PAGE / NUMPAGES fields, then the marking banner.
+
+    Word repeats the part on every page and only the fields change, so
+    the document body carries no per-page markup.
+    """
+    xml = ''
+    if footer or page_numbers:
+        numbers = ('<w:r><w:tab/><w:tab/><w:t xml:space="preserve">Page </w:t></w:r>'
+                   '<w:fldSimple w:instr=" PAGE "><w:r><w:t>1</w:t></w:r></w:fldSimple>'
+                   '<w:r><w:t xml:space="preserve"> of </w:t></w:r>'
+                   '<w:fldSimple w:instr=" NUMPAGES "><w:r><w:t>1</w:t></w:r></w:fldSimple>') if page_numbers else ''
+        xml += f'<w:p><w:pPr><w:pStyle w:val="Footer"/></w:pPr>{create_runs_xml(footer or "")}{numbers}</w:p>'
+    if marking:
+        xml += f'<w:p><w:pPr><w:pStyle w:val="Marking"/></w:pPr>{create_runs_xml(marking)}</w:p>'
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<w:ftr xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">{xml}</w:ftr>'''
+
+def create_settings_xml():
+    """Ask Word to refresh fields (TOC page numbers) when the document opens."""
+    return '''<?xml version="1.0" encoding="UTF-8"?>
+<w:settings xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">
+<w:updateFields w:val="true"/>
+</w:settings>'''
+
 def create_numbering_xml():
     return '''<?xml version="1.0" encoding="UTF-8"?>
 <w:numbering xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">
@@ -311,86 +324,120 @@ def create_numbering_xml():
 <w:num w:numId="2"><w:abstractNumId w:val="1"/></w:num>
 </w:numbering>'''
 
-def generate_docx(md_path, output_path):
+def generate_docx(md_path, output_path, image_dpi=DEFAULT_DPI, image_palette='auto', cache_dir=None,
+                  workers=None, header=None, footer=None, marking=None, page_numbers=False, update=False):
+    """Write the DOCX.
+
+    With `update` (and a `cache_dir`), members whose content is the same
+    as in the previous build of `output_path` are copied from it still
+    compressed; only changed parts are deflated again.
+    """
     print(f"Generating DOCX from: {md_path}")
 
-    progress("Parsing markdown...")
-    elements = parse_markdown(md_path)
-
-    # Collect images
-    images = []
-    image_rels = []
-    rel_id_counter = 3  # Start after styles and numbering
-
-    progress("Processing images...")
-    for elem_type, content in elements:
-        if elem_type == 'image':
-            img_path, alt_text = content
-            rel_id = f"rId{rel_id_counter}"
-            rel_id_counter += 1
-            ext = os.path.splitext(img_path)[1].lower()
-            img_name = f"image{len(images) + 1}{ext}"
-            width_emu, height_emu = get_image_size(img_path)
-            images.append((img_path, img_name))
-            image_rels.append((rel_id, img_name, width_emu, height_emu, alt_text))
-
-    progress("Building document structure...")
-    body_xml = ""
-
-    progress("Processing content sections...")
-    section_count = 0
-    image_idx = 0
-    for elem_type, content in elements:
-        if elem_type == 'h1':
-            body_xml += create_paragraph_xml(content, "Heading1")
-            section_count += 1
-            if section_count % 3 == 0:
-                progress(f"Section {section_count}...")
-        elif elem_type == 'h2':
-            body_xml += create_paragraph_xml(content, "Heading2")
-        elif elem_type == 'h3':
-            body_xml += create_paragraph_xml(content, "Heading3")
-        elif elem_type == 'h4':
-            body_xml += create_paragraph_xml(content, "Heading4")
-        elif elem_type == 'para':
-            body_xml += create_paragraph_xml(content, "Normal")
-        elif elem_type == 'caption':
-            body_xml += create_caption_xml(content)
-        elif elem_type == 'image':
-            if image_idx < len(image_rels):
-                rel_id, _, width_emu, height_emu, alt_text = image_rels[image_idx]
-                body_xml += create_image_xml(rel_id, width_emu, height_emu, alt_text)
-                image_idx += 1
-        elif elem_type == 'bullet':
-            body_xml += f'''<w:p><w:pPr><w:pStyle w:val="ListBullet"/>
-<w:numPr><w:ilvl w:val="0"/><w:numId w:val="1"/></w:numPr></w:pPr>
-<w:r><w:t>{escape_xml(strip_markdown(content))}</w:t></w:r></w:p>'''
-        elif elem_type == 'numbered':
-            body_xml += f'''<w:p><w:pPr><w:pStyle w:val="ListNumber"/>
-<w:numPr><w:ilvl w:val="0"/><w:numId w:val="2"/></w:numPr></w:pPr>
-<w:r><w:t>{escape_xml(strip_markdown(content))}</w:t></w:r></w:p>'''
-        elif elem_type == 'code':
-            body_xml += create_code_block_xml(content)
-        elif elem_type == 'table':
-            body_xml += create_table_xml(content)
-        elif elem_type == 'hr':
-            body_xml += '''<w:p><w:pPr><w:pBdr>
-<w:bottom w:val="single" w:sz="12" w:color="000000"/></w:pBdr></w:pPr></w:p>'''
-
-    progress("Creating document XML...")
-    doc_xml = f'''<?xml version="1.0" encoding="UTF-8"?>
+    # Parts are deflated on worker threads as soon as they are known;
+    # the archive is assembled in a fixed order at the end
+    with Compressor(workers) as compressor:
+        manifest = None
+        if update and cache_dir:
+            key = hashlib.sha256(os.path.abspath(output_path).encode('utf-8')).hexdigest()[:32]
+            manifest = os.path.join(cache_dir, 'docx', key + '.json')
+        archive = ZipWriter(output_path, compressor, manifest=manifest)
+        static_parts = [(name, archive.member(name, xml)) for name, xml in (
+            ('word/styles.xml', create_styles_xml()),
+            ('word/numbering.xml', create_numbering_xml()),
+            ('word/settings.xml', create_settings_xml()),
+        )]
+
+        # Running header and footer parts, shared by every page of the section
+        furniture = []  # (rel_id, kind, part name)
+        if header or marking:
+            static_parts.append(('word/header1.xml',
+                                 archive.member('word/header1.xml', create_header_xml(header, marking))))
+            furniture.append((f"rId{4 + len(furniture)}", 'header', 'header1.xml'))
+        if footer or marking or page_numbers:
+            static_parts.append(('word/footer1.xml',
+                                 archive.member('word/footer1.xml', create_footer_xml(footer, marking, page_numbers))))
+            furniture.append((f"rId{4 + len(furniture)}", 'footer', 'footer1.xml'))
+        image_cache = os.path.join(cache_dir, 'images') if cache_dir else None
+
+        progress("Parsing markdown...")
+        # Elements are consumed as the parser produces them
+        elements = roadmap.expand(control_matrix.expand(parse_markdown(md_path)))
+
+        # Images are registered as they are encountered
+        images = []
+        image_rels = []
+        rel_id_counter = 4 + len(furniture)  # Start after styles, numbering, settings, header and footer
+
+        progress("Building document structure...")
+        body = []  # XML fragments, joined once at the end
+
+        progress("Processing content sections...")
+        section_count = 0
+        headings = []  # (level, text, bookmark_id) for the TOC
+        toc_first_heading = None
+        for elem_type, content in elements:
+            if elem_type in ('h1', 'h2', 'h3', 'h4'):
+                level = int(elem_type[1])
+                bookmark_id = len(headings) + 1
+                headings.append((level, content, bookmark_id))
+                body.append(create_heading_xml(content, level, bookmark_id))
+                if level == 1:
+                    section_count += 1
+                    if section_count % 3 == 0:
+                        progress(f"Section {section_count}...")
+            elif elem_type == 'toc':
+                # Filled in once every heading has been seen
+                toc_first_heading = len(headings)
+                toc_slot = len(body)
+                body.append('')
+            elif elem_type == 'para':
+                body.append(create_paragraph_xml(content, "Normal"))
+            elif elem_type == 'caption':
+                body.append(create_caption_xml(content))
+            elif elem_type == 'image':
+                img_path, alt_text = content
+                rel_id = f"rId{rel_id_counter}"
+                rel_id_counter += 1
+                ext = os.path.splitext(img_path)[1].lower()
+                img_name = f"image{len(images) + 1}{ext}"
+                width_emu, height_emu = get_image_size(img_path)
+                images.append((f'word/media/{img_name}',
+                               archive.member(f'word/media/{img_name}', prepare_image, img_path, width_emu, height_emu,
+                                              image_dpi, image_palette, image_cache)))
+                image_rels.append((rel_id, img_name, width_emu, height_emu, alt_text))
+                body.append(create_image_xml(rel_id, width_emu, height_emu, alt_text))
+            elif elem_type == 'bullet':
+                # Numbering comes from the list paragraph styles
+                body.append(create_paragraph_xml(content, "ListBullet"))
+            elif elem_type == 'numbered':
+                body.append(create_paragraph_xml(content, "ListNumber"))
+            elif elem_type == 'code':
+                body.append(create_code_block_xml(content))
+            elif elem_type == 'table':
+                body.append(create_table_xml(content))
+            elif elem_type == 'hr':
+                body.append('<w:p><w:pPr><w:pStyle w:val="HorizontalRule"/></w:pPr></w:p>')
+
+        if toc_first_heading is not None:
+            body[toc_slot] = create_toc_xml(headings[toc_first_heading:])
+        body_xml = ''.join(body)
+
+        progress("Creating document XML...")
+        doc_xml = f'''<?xml version="1.0" encoding="UTF-8"?>
 <w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"
 xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"
 xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"
 xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"
 xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture">
 <w:body>{body_xml}
-<w:sectPr><w:pgSz w:w="12240" w:h="15840"/>
-<w:pgMar w:top="1440" w:right="1440" w:bottom="1440" w:left="1440"/></w:sectPr>
+<w:sectPr>{''.join(f'<w:{kind}Reference w:type="default" r:id="{rel_id}"/>' for rel_id, kind, _ in furniture)}
+<w:pgSz w:w="12240" w:h="15840"/>
+<w:pgMar w:top="1440" w:right="1440" w:bottom="1440" w:left="1440" w:header="720" w:footer="720"/></w:sectPr>
 </w:body></w:document>'''
 
-    progress("Creating content types...")
-    content_types = '''<?xml version="1.0" encoding="UTF-8"?>
+        progress("Creating content types...")
+        content_types = f'''<?xml version="1.0" encoding="UTF-8"?>
 <Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
 <Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
 <Default Extension="xml" ContentType="application/xml"/>
@@ -400,49 +447,82 @@ xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture">
 <Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
 <Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>
 <Override PartName="/word/numbering.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.numbering+xml"/>
+<Override PartName="/word/settings.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.settings+xml"/>{''.join(f"""
+<Override PartName="/word/{name}" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.{kind}+xml"/>"""
+        for _, kind, name in furniture)}
 </Types>'''
 
-    progress("Creating relationships...")
-    root_rels = '''<?xml version="1.0" encoding="UTF-8"?>
+        progress("Creating relationships...")
+        root_rels = '''<?xml version="1.0" encoding="UTF-8"?>
 <Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
 <Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
 </Relationships>'''
 
-    # Build document relationships including images
-    doc_rels_content = '''<?xml version="1.0" encoding="UTF-8"?>
+        # Build document relationships including images
+        doc_rels_content = '''<?xml version="1.0" encoding="UTF-8"?>
 <Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
 <Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
-<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/numbering" Target="numbering.xml"/>'''
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/numbering" Target="numbering.xml"/>
+<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/settings" Target="settings.xml"/>'''
+
+        for rel_id, kind, name in furniture:
+            doc_rels_content += f'''
+<Relationship Id="{rel_id}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/{kind}" Target="{name}"/>'''
 
-    for rel_id, img_name, _, _, _ in image_rels:
-        doc_rels_content += f'''
+        for rel_id, img_name, _, _, _ in image_rels:
+            doc_rels_content += f'''
 <Relationship Id="{rel_id}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" Target="media/{img_name}"/>'''
 
-    doc_rels_content += '''
+        doc_rels_content += '''
 </Relationships>'''
 
-    progress("Writing DOCX archive...")
-    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-        zf.writestr('[Content_Types].xml', content_types)
-        zf.writestr('_rels/.rels', root_rels)
-        zf.writestr('word/_rels/document.xml.rels', doc_rels_content)
-        zf.writestr('word/document.xml', doc_xml)
-        zf.writestr('word/styles.xml', create_styles_xml())
-        zf.writestr('word/numbering.xml', create_numbering_xml())
-
-        # Add images
-        progress("Embedding images...")
-        for img_path, img_name in images:
-            with open(img_path, 'rb') as img_file:
-                zf.writestr(f'word/media/{img_name}', img_file.read())
+        progress("Writing DOCX archive...")
+        with archive:
+            archive.add('[Content_Types].xml', content_types)
+            archive.add('_rels/.rels', root_rels)
+            archive.add('word/_rels/document.xml.rels', doc_rels_content)
+            archive.add('word/document.xml', doc_xml)
+            for name, member in static_parts:
+                archive.add(name, member)
+
+            # Images were resampled and deflated while the body was laid out
+            progress("Embedding images...")
+            for name, member in images:
+                archive.add(name, member)
 
     progress("Complete!")
-    print(f"\n\nCreated: {output_path}")
+    reused = f" ({archive.reused} of {len(archive.entries)} members reused)" if manifest else ""
+    print(f"\n\n{'Created' if archive.written else 'Unchanged (not rewritten)'}: {output_path}{reused}")
     print(f"Size: {os.path.getsize(output_path):,} bytes")
     print(f"Images embedded: {len(images)}")
 
 if __name__ == "__main__":
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    md_file = os.path.join(script_dir, "Furientis_CMMC_Compliance_Strategy.md")
-    docx_file = os.path.join(script_dir, "Furientis_CMMC_Compliance_Strategy.docx")
-    generate_docx(md_file, docx_file)
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', nargs='?',
+                        default=os.path.join(script_dir, "Furientis_CMMC_Compliance_Strategy.md"),
+                        help='markdown source, or - to read from stdin')
+    parser.add_argument('-o', '--output', help='DOCX path (default: input name with .docx)')
+    parser.add_argument('--image-dpi', type=int, default=DEFAULT_DPI,
+                        help=f'resample embedded images to this DPI at their placed size (default {DEFAULT_DPI})')
+    parser.add_argument('--no-palette', action='store_true',
+                        help='never reduce flat-color images to a palette')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='compression threads (default: number of CPUs)')
+    parser.add_argument('--header', nargs='?', const='', metavar='TEXT',
+                        help='add a running header (TEXT defaults to the document title)')
+    parser.add_argument('--footer', help='running footer text')
+    parser.add_argument('--marking', help='distribution marking banner for the top and bottom of every page, e.g. CUI')
+    parser.add_argument('--page-numbers', action='store_true', help='add "Page N of M" footers')
+    parser.add_argument('--update', action='store_true',
+                        help='copy members unchanged since the previous build instead of compressing them again')
+    args = parser.parse_args()
+
+    md_file = args.input
+    docx_file = args.output or (os.path.splitext(md_file)[0] + ".docx" if md_file != '-' else "output.docx")
+    generate_docx(md_file, docx_file, image_dpi=args.image_dpi,
+                  image_palette=None if args.no_palette else 'auto',
+                  cache_dir=os.path.join(script_dir, '.build_cache'), workers=args.jobs,
+                  header=(args.header or document_title(md_file)) if args.header is not None else None,
+                  footer=args.footer, marking=args.marking, page_numbers=args.page_numbers,
+                  update=args.update)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+CMMC Compliance Strategy HTML Generator - Streams markdown to semantic HTML.
+Cost figures are inline SVG charts; other images are linked or inlined.
+Adds a heading anchor index and a print stylesheet.
+"""
+
+import argparse
+import base64
+import html
+import os
+import re
+import sys
+
+import charts
+import control_matrix
+import roadmap
+from compression import write_chunks_if_changed
+from markdown_parser import (BOLD, CODE, ITALIC, LINK, document_title, parse_markdown, strip_markdown,
+                             tokenize_inline)
+
+INDEX_LEVELS = (1, 2, 3)
+FLUSH_SIZE = 64 * 1024  # Bytes buffered before a chunk is handed to the writer
+
+STYLESHEET = """
+body { font: 16px/1.55 Helvetica, Arial, sans-serif; color: #1a1a1a; margin: 0; }
+main { max-width: 48rem; margin: 0 auto; padding: 2rem 1.5rem 4rem; }
+h1, h2, h3, h4 { color: #000; line-height: 1.25; margin: 1.6em 0 0.5em; }
+h1 { font-size: 1.8rem; } h2 { font-size: 1.4rem; } h3 { font-size: 1.15rem; } h4 { font-size: 1rem; }
+a { color: #0563c1; }
+code, pre { font: 0.875rem/1.45 "Courier New", monospace; }
+pre { background: #f5f5f5; padding: 0.75rem 1rem; overflow-x: auto; }
+table { border-collapse: collapse; width: 100%; margin: 1rem 0; font-size: 0.9rem; }
+th, td { border: 1px solid #cccccc; padding: 0.35rem 0.5rem; text-align: left; vertical-align: top; }
+thead th { background: #e6e6e6; }
+figure { margin: 1.5rem 0; text-align: center; }
+figure img, figure svg { max-width: 100%; height: auto; }
+figcaption, .caption { font-size: 0.85rem; font-style: italic; color: #666666; text-align: center; }
+hr { border: 0; border-top: 2px solid #000; margin: 2rem 0; }
+#contents { font-size: 0.9rem; }
+#contents ol { list-style: none; padding-left: 1rem; }
+@media screen and (min-width: 80rem) {
+  main { margin-left: 22rem; }
+  #contents { position: fixed; top: 0; left: 0; bottom: 0; width: 19rem; overflow-y: auto;
+              padding: 1.5rem 1rem; background: #fafafa; border-right: 1px solid #e6e6e6; }
+}
+@media print {
+  @page { size: letter; margin: 1in; }
+  body { font-size: 11pt; }
+  main { max-width: none; padding: 0; }
+  h1, h2, h3, h4 { break-after: avoid; }
+  table, figure, pre { break-inside: avoid; }
+  a[href^="http"]::after { content: " (" attr(href) ")"; font-size: 0.8em; }
+  .toc-link { display: none; }
+  #contents { break-before: page; }
+}
+"""
+
+
+def runs_html(text):
+    """Render inline markdown runs as HTML."""
+    out = []
+    for chunk, style, href in tokenize_inline(text):
+        piece = html.escape(chunk, quote=False)
+        if style & CODE:
+            piece = f"<code>{piece}</code>"
+        if style & ITALIC:
+            piece = f"<em>{piece}</em>"
+        if style & BOLD:
+            piece = f"<strong>{piece}</strong>"
+        if style & LINK:
+            piece = f'<a href="{html.escape(href)}">{piece}</a>'
+        out.append(piece)
+    return ''.join(out)
+
+
+def slugify(text, used):
+    """Anchor id for a heading, unique within `used`."""
+    slug = re.sub(r'[^a-z0-9]+', '-', strip_markdown(text).lower()).strip('-') or 'section'
+    candidate, n = slug, 1
+    while candidate in used:
+        n += 1
+        candidate = f"{slug}-{n}"
+    used.add(candidate)
+    return candidate
+
+
+def index_html(headings):
+    """Nested list of links to the headings, as (level, text, anchor) tuples."""
+    out = ['<nav id="contents" aria-label="Contents"><h2>Contents</h2>']
+    depth = 0
+    for level, text, anchor in headings:
+        if level not in INDEX_LEVELS:
+            continue
+        target = INDEX_LEVELS.index(level) + 1
+        if target > depth:
+            # A skipped level gets an empty item, so lists only nest inside items
+            out.append('<ol>' + '<li><ol>' * (target - depth - 1))
+        else:
+            out.append('</li></ol>' * (depth - target) + '</li>')
+        depth = target
+        out.append(f'<li><a href="#{anchor}">{html.escape(strip_markdown(text))}</a>')
+    out.append('</li></ol>' * depth + '</nav>')
+    return ''.join(out)
+
+
+def image_html(path, alt, out_dir, inline, figures):
+    name = os.path.basename(path)
+    if name in figures:
+        svg = charts.to_svg(figures[name])
+        return svg[svg.index('<svg'):].replace('<svg ', f'<svg role="img" aria-label="{html.escape(alt)}" ', 1)
+    if inline:
+        with open(path, 'rb') as f:
+            data = base64.b64encode(f.read()).decode('ascii')
+        ext = os.path.splitext(path)[1].lower().lstrip('.')
+        src = f"data:image/{'jpeg' if ext in ('jpg', 'jpeg') else ext};base64,{data}"
+    else:
+        src = os.path.relpath(path, out_dir).replace(os.sep, '/')
+    return f'<img src="{html.escape(src)}" alt="{html.escape(alt)}">'
+
+
+def iter_html(md_path, out_dir='.', inline_images=False):
+    """Yield the HTML document as text chunks while the markdown is parsed.
+
+    Nothing is buffered beyond the current element, except a cost figure
+    waiting for the tables it charts, so output starts at once. The
+    heading index goes last, where every heading is known; a [TOC] marker
+    links to it.
+    """
+    title = document_title(md_path)
+    figures = {}  # Filled from the Section 9 cost tables as the parse reaches them
+    yield (f'<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="utf-8">\n'
+           f'<meta name="viewport" content="width=device-width, initial-scale=1">\n'
+           f'<title>{html.escape(title)}</title>\n<style>{STYLESHEET}</style>\n</head>\n<body>\n<main>\n')
+
+    headings = []
+    used = set()
+    open_list = None   # 'ul' or 'ol' while list items are being emitted
+    in_figure = False  # An image was emitted and may still take a caption
+
+    elements = charts.with_cost_figures(parse_markdown(md_path), figures)
+    for elem_type, content in roadmap.expand(control_matrix.expand(elements)):
+        out = []
+        if in_figure:
+            if elem_type == 'caption':
+                yield f"<figcaption>{runs_html(content)}</figcaption></figure>\n"
+                in_figure = False
+                continue
+            if elem_type == 'blank':
+                continue
+            out.append('</figure>\n')
+            in_figure = False
+        list_tag = {'bullet': 'ul', 'numbered': 'ol'}.get(elem_type)
+        if open_list and list_tag != open_list:
+            out.append(f'</{open_list}>\n')
+            open_list = None
+        if list_tag and not open_list:
+            out.append(f'<{list_tag}>\n')
+            open_list = list_tag
+
+        if elem_type in ('h1', 'h2', 'h3', 'h4'):
+            anchor = slugify(content, used)
+            headings.append((int(elem_type[1]), content, anchor))
+            out.append(f'<{elem_type} id="{anchor}">{runs_html(content)}</{elem_type}>\n')
+        elif elem_type == 'para':
+            out.append(f"<p>{runs_html(content)}</p>\n")
+        elif elem_type == 'caption':
+            out.append(f'<p class="caption">{runs_html(content)}</p>\n')
+        elif list_tag:
+            out.append(f"<li>{runs_html(content)}</li>\n")
+        elif elem_type == 'code':
+            out.append(f"<pre><code>{html.escape(content, quote=False)}</code></pre>\n")
+        elif elem_type == 'table':
+            head, *body = content
+            out.append('<table>\n<thead><tr>' + ''.join(f"<th>{runs_html(c)}</th>" for c in head) +
+                       '</tr></thead>\n<tbody>\n')
+            out.extend('<tr>' + ''.join(f"<td>{runs_html(c)}</td>" for c in row) + '</tr>\n' for row in body)
+            out.append('</tbody>\n</table>\n')
+        elif elem_type == 'image':
+            path, alt = content
+            out.append(f"<figure>{image_html(path, alt, out_dir, inline_images, figures)}")
+            in_figure = True
+        elif elem_type == 'hr':
+            out.append('<hr>\n')
+        elif elem_type == 'toc':
+            out.append('<p class="toc-link"><a href="#contents">Contents</a></p>\n')
+        yield ''.join(out)
+
+    if in_figure:
+        yield '</figure>\n'
+    if open_list:
+        yield f'</{open_list}>\n'
+    yield f"</main>\n{index_html(headings)}\n</body>\n</html>\n"
+
+
+def encode_chunks(pieces):
+    """Encode text pieces to UTF-8 in chunks of about FLUSH_SIZE bytes."""
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= FLUSH_SIZE:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def generate_html(md_path, html_path, inline_images=False):
+    """Write the HTML document, or stream it to stdout when html_path is '-'."""
+    out_dir = os.path.dirname(os.path.abspath(html_path)) if html_path != '-' else os.getcwd()
+    chunks = encode_chunks(iter_html(md_path, out_dir, inline_images))
+    if html_path == '-':
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.flush()
+        return True
+    return write_chunks_if_changed(html_path, chunks)
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', nargs='?',
+                        default=os.path.join(script_dir, "Furientis_CMMC_Compliance_Strategy.md"),
+                        help='markdown source, or - to read from stdin')
+    parser.add_argument('-o', '--output', help='HTML path, or - for stdout (default: input name with .html)')
+    parser.add_argument('--inline-images', action='store_true',
+                        help='embed images as data URIs instead of linking them')
+    args = parser.parse_args()
+
+    md_file = args.input
+    html_file = args.output or (os.path.splitext(md_file)[0] + ".html" if md_file != '-' else "output.html")
+    written = generate_html(md_file, html_file, inline_images=args.inline_images)
+    if html_file != '-':
+        print(f"{'Created' if written else 'Unchanged (not rewritten)'}: {html_file}")
+        print(f"Size: {os.path.getsize(html_file):,} bytes")
@@ -1,24 +1,39 @@
 #!/usr/bin/env python3
 """
 CMMC Compliance Strategy PDF Generator - Converts markdown to PDF.
-Supports embedded PNG images. Uses only Python standard library. Shows progress bar.
+Supports embedded PNG images. Needs only the standard library; NumPy is optional.
+Shows progress bar.
 """
 
+import argparse
+import hashlib
 import os
 import re
 import zlib
 
+import charts
+import control_matrix
+import pdf_fonts
+import roadmap
+from compression import (Compressor, close_stream, read_manifest, staged, write_chunks_if_changed, write_if_changed,
+                         write_manifest)
+from markdown_parser import BOLD, CODE, ITALIC, document_title, parse_markdown, strip_markdown, tokenize_inline
+
 TOTAL_STEPS = 12
 
-def strip_markdown(text):
-    """Remove markdown formatting from text."""
-    text = re.sub(r'\*\*(.+?)\*\*', r'\1', text)  # Bold
-    text = re.sub(r'\*(.+?)\*', r'\1', text)  # Italic
-    text = re.sub(r'__(.+?)__', r'\1', text)  # Bold alt
-    text = re.sub(r'_(.+?)_', r'\1', text)  # Italic alt
-    text = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', text)  # Links
-    text = re.sub(r'`([^`]+)`', r'\1', text)  # Inline code
-    return text
+# Page furniture: baselines of the running header and footer, their rules,
+# and the top and bottom distribution marking banners
+HEADER_Y, HEADER_RULE_Y = 747, 741
+FOOTER_Y, FOOTER_RULE_Y = 42, 54
+MARKING_TOP_Y, MARKING_BOTTOM_Y = 772, 18
+FURNITURE_SIZE = 8
+FURNITURE_GRAY = 0.4
+
+# Incremental updates appended to a PDF before save() compacts it with a full rewrite
+MAX_UPDATES = 10
+
+# Most kids per /Pages node; longer documents get a deeper, balanced page tree
+PAGE_FANOUT = 32
 
 current_step = 0
 
@@ -72,11 +87,174 @@ def read_png_info(filepath):
         }
 
 
-class SimplePDF:
+def _text_string(text):
+    """PDF text string (outline titles): literal when ASCII, else UTF-16BE hex."""
+    if text.isascii():
+        return "(" + text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') + ")"
+    return "<FEFF" + text.encode('utf-16-be').hex().upper() + ">"
+
+
+def _num(value):
+    """Format a coordinate compactly (no trailing zeros)."""
+    if value == int(value):
+        return str(int(value))
+    return f"{value:.2f}".rstrip('0').rstrip('.')
+
+
+class ContentStream:
+    """Page content stream builder that tracks graphics and text state.
+
+    Consecutive text lines share one text object and move with relative
+    Td/TD/T* operators; fonts, colors and line widths are only emitted
+    when they change; stroked lines are batched into a single path that
+    is painted once, just before anything that would change its state.
+    """
+
     def __init__(self):
+        self.ops = []
+        self.in_text = False
+        self.line_start = (0, 0)
+        self.leading = None
+        self.last_dy = None
+        self.font = None
+        # PDF defaults at the start of every page
+        self.fill = self.stroke = 0
+        self.width = 1
+        self.path = []
+        self.path_state = None
+
+    def __bool__(self):
+        return bool(self.ops or self.path)
+
+    def getvalue(self):
+        self._flush_path()
+        self._end_text()
+        return '\n'.join(self.ops)
+
+    def end(self):
+        """Offset in getvalue() just past the last operator added so far."""
+        return sum(map(len, self.ops)) + len(self.ops) - 1
+
+    def _end_text(self):
+        if self.in_text:
+            self.ops.append("ET")
+            self.in_text = False
+
+    def _flush_path(self):
+        if self.path:
+            self.ops.append('\n'.join(self.path) + " S")
+            self.path = []
+
+    def _set_fill(self, color):
+        """Set the fill color: a gray level or an (r, g, b) tuple."""
+        if color != self.fill:
+            if isinstance(color, tuple):
+                self.ops.append(f"{' '.join(_num(c) for c in color)} rg")
+            else:
+                self.ops.append(f"{_num(color)} g")
+            self.fill = color
+
+    def _set_stroke(self, gray, width):
+        if gray != self.stroke:
+            self.ops.append(f"{_num(gray)} G")
+            self.stroke = gray
+        if width != self.width:
+            self.ops.append(f"{_num(width)} w")
+            self.width = width
+
+    def text(self, x, y, segments, gray=0):
+        """Show [(string, font, size)] segments on a new line starting at (x, y).
+
+        Each string is an encoded operand, delimiters included (see
+        SimplePDF._encode).
+
+        `gray` is the fill color: a gray level or an (r, g, b) tuple.
+        """
+        self._flush_path()
+        self._set_fill(gray)
+        ops = []
+        if not self.in_text:
+            self.ops.append("BT")
+            self.in_text = True
+            self.line_start = (0, 0)
+        dx, dy = x - self.line_start[0], y - self.line_start[1]
+        if dx == 0 and self.leading is not None and dy == -self.leading:
+            ops.append("T*")
+        elif dy < 0 and (self.leading is None or dy == self.last_dy):
+            # A repeated line advance becomes the leading (TD sets it),
+            # so the lines that follow can use T*
+            ops.append(f"{_num(dx)} {_num(dy)} TD")
+            self.leading = -dy
+        elif dx or dy:
+            ops.append(f"{_num(dx)} {_num(dy)} Td")
+        self.line_start = (x, y)
+        self.last_dy = dy
+        for string, font, size in segments:
+            if (font, size) != self.font:
+                ops.append(f"{font} {_num(size)} Tf")
+                self.font = (font, size)
+            ops.append(f"{string} Tj")
+        self.ops.append(' '.join(ops))
+
+    def line(self, x1, y1, x2, y2, gray=0, width=1):
+        """Add a stroked line segment to the pending path."""
+        self._end_text()
+        if self.path and self.path_state != (gray, width):
+            self._flush_path()
+        if not self.path:
+            self._set_stroke(gray, width)
+            self.path_state = (gray, width)
+        self.path.append(f"{_num(x1)} {_num(y1)} m {_num(x2)} {_num(y2)} l")
+
+    def rect(self, x, y, w, h, fill=None, stroke=None, width=1):
+        """Fill and/or stroke a rectangle with the given gray levels."""
+        self._end_text()
+        self._flush_path()
+        box = f"{_num(x)} {_num(y)} {_num(w)} {_num(h)} re"
+        if fill is not None:
+            self._set_fill(fill)
+            self.ops.append(f"{box} f")
+        if stroke is not None:
+            self._set_stroke(stroke, width)
+            self.ops.append(f"{box} S")
+
+    def fill_path(self, ops, color):
+        """Fill path construction operators (m/l/c/h) with a color."""
+        self._end_text()
+        self._flush_path()
+        self._set_fill(color)
+        self.ops.append(f"{ops} f")
+
+
+class SimplePDF:
+    """Single-column PDF writer with optional running header, footer and markings.
+
+    The fixed page furniture (header and footer text, rules, marking
+    banners) is drawn once in a shared Form XObject that every page
+    paints with Do. Only the page number differs per page: each page
+    stream is deflated during layout but left open, and a short stamp
+    with the Do and the number is appended when the file is written,
+    after the table of contents has settled the page count.
+
+    Text is set in embedded TrueType subsets when the fonts are installed
+    (see pdf_fonts), otherwise in the standard fonts; lines are wrapped by
+    measured width.
+    """
+
+    def __init__(self, compressor=None, header=None, footer=None, marking=None, page_numbers=False,
+                 embed_fonts=True, font_cache=None):
+        # Finished pages are deflated on the compressor's threads during layout
+        self.compressor = compressor or Compressor(1)
+        self.compress_pages = True
+        self.header = header    # Running header text, top left
+        self.footer = footer    # Running footer text, bottom left
+        self.marking = marking  # Distribution marking banner, centered top and bottom (e.g. CUI)
+        self.page_numbers = page_numbers
+        self.fonts = pdf_fonts.load_fonts(embed_fonts, font_cache)
+        self.appended = None  # Objects the last save() appended as an incremental update
         self.objects = []
         self.pages = []
-        self.current_content = []
+        self.current_content = ContentStream()
         self.page_height = 792
         self.page_width = 612
         self.margin = 72
@@ -84,141 +262,353 @@ class SimplePDF:
         self.line_height = 14
         self.images = []  # List of (filepath, obj_num) tuples
         self.image_objects = []  # Raw PDF objects for images
+        self.headings = []  # (level, text, page_index, y) recorded during layout
+        self.toc_index = None  # Page slot reserved for the table of contents
+        self.toc_first_heading = 0
 
     def _new_page(self):
         if self.current_content:
-            self.pages.append('\n'.join(self.current_content))
-        self.current_content = []
+            content = self.current_content.getvalue()
+            # Encoded text strings may hold any byte, so content is latin-1
+            self.pages.append(self.compressor.open_stream(content.encode('latin-1')) if self.compress_pages
+                              else content)
+        self.current_content = ContentStream()
         self.y = self.page_height - self.margin
 
     def _check_page(self, needed=20):
         if self.y - needed < self.margin:
             self._new_page()
 
-    def _escape(self, text):
-        # Replace unicode with ASCII, then escape PDF special chars
-        text = text.encode('ascii', 'replace').decode('ascii')
-        return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    def _encode(self, text, font):
+        """`text` as a string operand for a font resource name."""
+        return self.fonts[font].encode(text)
 
-    def _wrap(self, text, chars_per_line=85):
-        words = text.split()
+    def text_width(self, text, font, size):
+        return self.fonts[font].width(text, size)
+
+    def _font(self, style):
+        """Map an inline run style to a font resource name."""
+        if style & CODE:
+            return "/F3"
+        if style & BOLD:
+            return "/F5" if style & ITALIC else "/F2"
+        return "/F4" if style & ITALIC else "/F1"
+
+    def _words(self, text, base_style=0):
+        """Split inline markdown into words, each a list of (text, font) segments."""
+        words = []
+        attach = False
+        for chunk, style, _ in tokenize_inline(text):
+            font = self._font(style | base_style)
+            for piece in re.findall(r'\S+|\s+', chunk):
+                if piece.isspace():
+                    attach = False
+                elif attach:
+                    words[-1].append((piece, font))
+                else:
+                    words.append([(piece, font)])
+                    attach = True
+        return words
+
+    def _wrap_runs(self, text, width, size=11, base_style=0):
+        """Word-wrap inline markdown to `width` points; returns lines of (text, font) segments."""
+        return self._wrap_words(self._words(text, base_style), width, size) or [[("", self._font(base_style))]]
+
+    def _wrap_words(self, words, width, size):
+        """Fill lines of at most `width` points with `words`; returns lines of (text, font) segments."""
         lines, current = [], []
-        length = 0
+        used = 0
         for word in words:
-            if length + len(word) + 1 <= chars_per_line:
+            extent = sum(self.text_width(piece, font, size) for piece, font in word)
+            space = self.text_width(" ", word[0][1], size) if current else 0
+            if not current or used + space + extent <= width:
                 current.append(word)
-                length += len(word) + 1
+                used += space + extent
             else:
-                if current:
-                    lines.append(' '.join(current))
+                lines.append(current)
                 current = [word]
-                length = len(word)
+                used = extent
         if current:
-            lines.append(' '.join(current))
-        return lines or ['']
+            lines.append(current)
+        return [self._segments(line) for line in lines]
+
+    def _segments(self, words):
+        """Join words with spaces, merging neighbouring pieces that share a font."""
+        # Pieces are collected per font and joined once, so long lines stay linear
+        groups = []
+        for k, word in enumerate(words):
+            pieces = [(" ", groups[-1][1])] + word if k else word
+            for piece, font in pieces:
+                if groups and groups[-1][1] == font:
+                    groups[-1][0].append(piece)
+                else:
+                    groups.append(([piece], font))
+        return [(''.join(parts), font) for parts, font in groups]
+
+    def _text(self, x, y, segments, size, gray=0):
+        """Draw (text, font) segments as one line at (x, y)."""
+        self.current_content.text(x, y, [(self._encode(text, font), font, size) for text, font in segments], gray)
 
     def add_heading(self, text, level=1):
         text = strip_markdown(text)
         sizes = {1: 18, 2: 14, 3: 12, 4: 11}
         size = sizes.get(level, 11)
-        self._check_page(size + 20)
+        lines = self._wrap_words([[(word, "/F2")] for word in text.split()], self.page_width - 2 * self.margin, size)
+        lead = size + 4
+        self._check_page(size + 20 + lead * (len(lines) - 1))
         self.y -= 15
-        escaped = self._escape(text)
-        self.current_content.append(f"BT /F2 {size} Tf {self.margin} {self.y} Td ({escaped}) Tj ET")
+        self.headings.append((level, text, len(self.pages), self.y + size))
+        for k, line in enumerate(lines):
+            if k:
+                self.y -= lead
+            self._text(self.margin, self.y, line, size)
         self.y -= size + 8
 
+    def add_toc(self):
+        """Reserve the table of contents at this point; it is filled in by save()."""
+        if self.current_content:
+            self._new_page()
+        self.toc_index = len(self.pages)
+        self.toc_first_heading = len(self.headings)
+
+    def _insert_toc(self, levels=(2, 3)):
+        """Lay out the reserved table of contents and splice it into the page list.
+
+        Entries are written with page-number placeholders whose offsets in
+        the page stream are recorded; once the number of TOC pages is known
+        each placeholder is replaced by the final page number, so the body
+        is laid out only once. Numbers sit in a
+        right-aligned four-digit slot padded with spaces (in Helvetica and
+        DejaVu Sans two spaces are as wide as one digit), so patching never
+        moves text.
+        """
+        entries = [(idx, level, text) for idx, (level, text, _, _) in
+                   enumerate(self.headings[self.toc_first_heading:], start=self.toc_first_heading)
+                   if level in levels]
+        saved = self.pages, self.current_content, self.y
+        self.pages, self.current_content = [], ContentStream()
+        self.compress_pages = False  # Compressed once the placeholders are patched
+        self.y = self.page_height - self.margin - 15
+        self._text(self.margin, self.y, [("Table of Contents", "/F2")], 14)
+        self.y -= 30
+        slots = {}  # TOC page -> [(offset of the number operand, its length, heading index)]
+        for idx, level, text in entries:
+            self._check_page(16)
+            indent = 15 * (level - levels[0])
+            size = 11 if level == levels[0] else 10
+            font = "/F2" if level == levels[0] else "/F1"
+            slot_x = self.page_width - self.margin - self.text_width("0000", "/F1", size)
+            title = self.fonts[font].fit(text, size, slot_x - self.margin - indent - 10)
+            self._text(self.margin + indent, self.y, [(title, font)], size)
+            placeholder = self._encode("0000", "/F1")
+            self.current_content.text(slot_x, self.y, [(placeholder, "/F1", size)])
+            offset = self.current_content.end() - len(" Tj") - len(placeholder)
+            slots.setdefault(len(self.pages), []).append((offset, len(placeholder), idx))
+            self.y -= 16
+        self._new_page()
+        toc_pages = self.pages
+        self.pages, self.current_content, self.y = saved
+        self.compress_pages = True
+
+        shift = len(toc_pages)
+        self.headings = [(level, text, page + shift if page >= self.toc_index else page, y)
+                         for level, text, page, y in self.headings]
+
+        def patch(page, slots):
+            pieces, pos = [], 0
+            for offset, length, idx in slots:
+                number = str(self.headings[idx][2] + 1)
+                pieces += [page[pos:offset], self._encode('  ' * (4 - len(number)) + number, "/F1")]
+                pos = offset + length
+            pieces.append(page[pos:])
+            return ''.join(pieces)
+
+        toc_pages = [self.compressor.open_stream(patch(page, slots.get(k, ())).encode('latin-1'))
+                     for k, page in enumerate(toc_pages)]
+        self.pages[self.toc_index:self.toc_index] = toc_pages
+        self.toc_index = None
+
+    def _outline_objects(self, first_num, page_ref):
+        """Build the /Outlines tree from the heading index.
+
+        Returns (root_num, [object strings]); objects are numbered from
+        first_num in document order. page_ref maps a page index to its
+        page object number.
+        """
+        if not self.headings:
+            return first_num, []
+        root = {'children': [], 'level': 0}
+        stack = [root]
+        for level, text, page, y in self.headings:
+            while stack[-1]['level'] >= level:
+                stack.pop()
+            node = {'children': [], 'level': level, 'title': text, 'page': page, 'y': y}
+            stack[-1]['children'].append(node)
+            stack.append(node)
+
+        nodes = []
+
+        def number(node):
+            # Preorder numbering; each node learns its parent and siblings from the parent's loop
+            node['num'] = first_num + len(nodes)
+            nodes.append(node)
+            kids = node['children']
+            for pos, child in enumerate(kids):
+                child['parent'] = node['num']
+                child['prev'] = kids[pos - 1] if pos else None
+                child['next'] = kids[pos + 1] if pos + 1 < len(kids) else None
+                number(child)
+
+        number(root)
+
+        # Visible descendants, children before parents: top-level entries start open, deeper ones closed
+        for node in reversed(nodes):
+            node['visible'] = sum(1 + (c['visible'] if c['level'] <= 1 else 0) for c in node['children'])
+
+        objects = []
+        for node in nodes:
+            kids = node['children']
+            links = ""
+            if kids:
+                links = f" /First {kids[0]['num']} 0 R /Last {kids[-1]['num']} 0 R"
+            if node is root:
+                objects.append(f"{node['num']} 0 obj\n<< /Type /Outlines{links} /Count {node['visible']} >>\nendobj")
+                continue
+            if node['prev']:
+                links += f" /Prev {node['prev']['num']} 0 R"
+            if node['next']:
+                links += f" /Next {node['next']['num']} 0 R"
+            if kids:
+                count = node['visible']
+                links += f" /Count {count if node['level'] <= 1 else -count}"
+            dest = f"[{page_ref(node['page'])} 0 R /XYZ 0 {node['y']} null]"
+            objects.append(f"{node['num']} 0 obj\n<< /Title {_text_string(node['title'])} "
+                           f"/Parent {node['parent']} 0 R{links} /Dest {dest} >>\nendobj")
+        return first_num, objects
+
     def add_para(self, text, indent=0):
-        text = strip_markdown(text)
-        lines = self._wrap(text, 85 - indent//6)
+        lines = self._wrap_runs(text, self.page_width - 2 * self.margin - indent)
         for line in lines:
             self._check_page(14)
-            escaped = self._escape(line)
             x = self.margin + indent
-            self.current_content.append(f"BT /F1 11 Tf {x} {self.y} Td ({escaped}) Tj ET")
+            self._text(x, self.y, line, 11)
             self.y -= 14
         self.y -= 4
 
     def add_caption(self, text):
         """Add italic centered caption."""
-        text = strip_markdown(text)
         self._check_page(14)
-        # Center the text (approximate)
-        text_width = len(text) * 5  # Rough estimate
-        x = (self.page_width - text_width) / 2
-        escaped = self._escape(text)
-        self.current_content.append(f"BT /F4 9 Tf {x} {self.y} Td ({escaped}) Tj ET")
+        line = self._segments(self._words(text, ITALIC))
+        x = (self.page_width - sum(self.text_width(piece, font, 9) for piece, font in line)) / 2
+        self._text(x, self.y, line, 9)
         self.y -= 14
         self.y -= 8
 
     def add_bullet(self, text):
-        text = strip_markdown(text)
         self._check_page(14)
-        self.current_content.append(f"BT /F1 11 Tf {self.margin + 20} {self.y} Td (\\225) Tj ET")
-        lines = self._wrap(text, 75)
+        self._text(self.margin + 20, self.y, [("\u2022", "/F1")], 11)
+        lines = self._wrap_runs(text, self.page_width - 2 * self.margin - 35)
         for i, line in enumerate(lines):
             if i > 0:
                 self._check_page(14)
-            escaped = self._escape(line)
-            self.current_content.append(f"BT /F1 11 Tf {self.margin + 35} {self.y} Td ({escaped}) Tj ET")
+            self._text(self.margin + 35, self.y, line, 11)
             self.y -= 14
 
     def add_numbered(self, num, text):
-        text = strip_markdown(text)
         self._check_page(14)
-        self.current_content.append(f"BT /F1 11 Tf {self.margin + 20} {self.y} Td ({num}.) Tj ET")
-        lines = self._wrap(text, 75)
+        self._text(self.margin + 20, self.y, [(f"{num}.", "/F1")], 11)
+        lines = self._wrap_runs(text, self.page_width - 2 * self.margin - 40)
         for i, line in enumerate(lines):
             if i > 0:
                 self._check_page(14)
-            escaped = self._escape(line)
-            self.current_content.append(f"BT /F1 11 Tf {self.margin + 40} {self.y} Td ({escaped}) Tj ET")
+            self._text(self.margin + 40, self.y, line, 11)
             self.y -= 14
 
     def add_code(self, text):
         for line in text.split('\n')[:50]:  # Limit code blocks
             self._check_page(12)
-            escaped = self._escape(line[:90])
-            self.current_content.append(f"BT /F3 9 Tf {self.margin + 20} {self.y} Td ({escaped}) Tj ET")
+            self._text(self.margin + 20, self.y, [(line[:90], "/F3")], 9)
             self.y -= 12
 
-    def add_table(self, rows):
+    def _column_widths(self, rows, size):
+        """Split the text width between columns by their widest cell.
+
+        Columns that fit in an equal share get their natural width and
+        the rest share what is left; if every column fits, all are
+        widened in proportion to fill the line.
+        """
+        available = self.page_width - 2 * self.margin
+        natural = [10 + max(self.text_width(strip_markdown(row[col]), "/F2" if k == 0 else "/F1", size)
+                            for k, row in enumerate(rows))
+                   for col in range(len(rows[0]))]
+        if sum(natural) <= available:
+            return [width * available / sum(natural) for width in natural]
+        widths = natural[:]
+        pending = sorted(range(len(natural)), key=natural.__getitem__)
+        left = available
+        while pending and natural[pending[0]] <= left / len(pending):
+            left -= natural[pending.pop(0)]
+        for col in pending:
+            widths[col] = left / len(pending)
+        return widths
+
+    def add_table(self, rows, size=9, leading=11):
+        """Draw a table with wrapped cells; rows that do not fit continue on the next page under the header row."""
         if not rows:
             return
         num_cols = len(rows[0])
-        col_w = (self.page_width - 2*self.margin) // num_cols
-        row_h = 16
-        self._check_page(row_h * min(len(rows), 10) + 20)
-        self.y -= 10
-        start_y = self.y
+        rows = [[str(cell) for cell in row[:num_cols]] + [''] * (num_cols - len(row)) for row in rows]
+        widths = self._column_widths(rows, size)
+        cells = []
+        for idx, row in enumerate(rows):
+            cells.append([self._wrap_runs(cell, width - 10, size, BOLD if idx == 0 else 0)
+                          for cell, width in zip(row, widths)])
+        heights = [16 + leading * (max(map(len, row)) - 1) for row in cells]
+        table_w = sum(widths)
 
-        # Draw rows
-        for idx, row in enumerate(rows[:15]):  # Limit rows
+        def draw_row(row):
             x = self.margin
-            font = "/F2" if idx == 0 else "/F1"
-            for cell in row:
-                cell_text = str(cell)[:int(col_w/5)]
-                escaped = self._escape(cell_text)
-                self.current_content.append(f"BT {font} 9 Tf {x+5} {self.y - 12} Td ({escaped}) Tj ET")
-                x += col_w
-            self.y -= row_h
-
-        # Draw grid
-        self.current_content.append("0.7 G 0.5 w")
-        x = self.margin
-        for _ in range(num_cols + 1):
-            self.current_content.append(f"{x} {start_y} m {x} {self.y} l S")
-            x += col_w
-        y = start_y
-        for _ in range(min(len(rows), 15) + 1):
-            self.current_content.append(f"{self.margin} {y} m {self.margin + col_w*num_cols} {y} l S")
-            y -= row_h
-        self.current_content.append("0 G")
+            for lines, width in zip(row, widths):
+                for k, line in enumerate(lines):
+                    segments, room = [], width - 10
+                    for text, font in line:
+                        if room > 0:
+                            text = self.fonts[font].fit(text, size, room)
+                            segments.append((text, font))
+                            room -= self.text_width(text, font, size)
+                    self._text(x + 5, self.y - 12 - k * leading, segments, size)
+                x += width
+
+        def draw_grid(top, bounds):
+            x = self.margin
+            for width in widths + [0]:
+                self.current_content.line(x, top, x, self.y, gray=0.7, width=0.5)
+                x += width
+            for y in [top] + bounds:
+                self.current_content.line(self.margin, y, self.margin + table_w, y, gray=0.7, width=0.5)
+
+        self._check_page(sum(heights[:2]) + 20)
+        self.y -= 10
+        top, bounds = self.y, []
+        for idx, row in enumerate(cells):
+            if idx and self.y - heights[idx] < self.margin:
+                draw_grid(top, bounds)
+                self._new_page()
+                top, bounds = self.y, []
+                if idx > 1:
+                    draw_row(cells[0])
+                    self.y -= heights[0]
+                    bounds.append(self.y)
+            draw_row(row)
+            self.y -= heights[idx]
+            bounds.append(self.y)
+        draw_grid(top, bounds)
         self.y -= 15
 
     def add_hr(self):
         self._check_page(20)
         self.y -= 10
-        self.current_content.append(f"0.5 w {self.margin} {self.y} m {self.page_width - self.margin} {self.y} l S")
+        self.current_content.line(self.margin, self.y, self.page_width - self.margin, self.y, width=0.5)
         self.y -= 10
 
     def add_image(self, filepath, img_name):
@@ -235,161 +625,740 @@ class SimplePDF:
         box_height = 50
         x = self.margin
 
-        # Light gray fill
-        self.current_content.append(f"0.95 g {x} {self.y - box_height} {box_width} {box_height} re f")
-        # Border
-        self.current_content.append(f"0.7 G 0.5 w {x} {self.y - box_height} {box_width} {box_height} re S")
+        # Light gray fill with border
+        self.current_content.rect(x, self.y - box_height, box_width, box_height, fill=0.95, stroke=0.7, width=0.5)
         # Text
         text = f"[See DOCX for diagram: {filename}]"
-        text_x = x + (box_width - len(text) * 5) / 2
-        self.current_content.append(f"0 g BT /F4 10 Tf {text_x} {self.y - 30} Td ({self._escape(text)}) Tj ET")
+        text_x = x + (box_width - self.text_width(text, "/F4", 10)) / 2
+        self._text(text_x, self.y - 30, [(text, "/F4")], 10)
 
         self.y -= box_height + 10
 
-    def save(self, filename):
+    def add_chart(self, chart):
+        """Draw a charts.Chart as vector paths and text, scaled to the text width."""
+        scale = min(1, (self.page_width - 2 * self.margin) / chart.width)
+        height = chart.height * scale
+        self._check_page(height + 20)
+        self.y -= 10
+        x = self.margin + (self.page_width - 2 * self.margin - chart.width * scale) / 2
+        top = self.y
+        for item in chart.items:
+            if item[0] == 'path':
+                self.current_content.fill_path(charts.path_ops(item[1], x, top, scale), charts.rgb(item[2]))
+            else:
+                _, tx, ty, text, size, bold, anchor, color = item
+                font = "/F2" if bold else "/F1"
+                shift = {'start': 0, 'middle': 0.5, 'end': 1}[anchor] * self.text_width(text, font, size)
+                self._text(x + (tx - shift) * scale, top - ty * scale,
+                           [(text, font)], size * scale, gray=charts.rgb(color))
+        self.y -= height + 10
+
+    def _furniture(self):
+        """Content of the shared page furniture form, or '' when there is none."""
+        content = ContentStream()
+        width = self.page_width - 2 * self.margin
+        if self.header:
+            self._text_line(content, self.margin, HEADER_Y, self.header, "/F1", FURNITURE_GRAY)
+            content.line(self.margin, HEADER_RULE_Y, self.margin + width, HEADER_RULE_Y, gray=0.7, width=0.5)
+        if self.footer or self.page_numbers:
+            content.line(self.margin, FOOTER_RULE_Y, self.margin + width, FOOTER_RULE_Y, gray=0.7, width=0.5)
+        if self.footer:
+            self._text_line(content, self.margin, FOOTER_Y, self.footer, "/F1", FURNITURE_GRAY)
+        if self.marking:
+            x = (self.page_width - self.text_width(self.marking, "/F2", 10)) / 2
+            for y in (MARKING_TOP_Y, MARKING_BOTTOM_Y):
+                self._text_line(content, x, y, self.marking, "/F2", 0, size=10)
+        return content.getvalue()
+
+    def _text_line(self, content, x, y, text, font, gray, size=FURNITURE_SIZE):
+        content.text(x, y, [(self._encode(text, font), font, size)], gray)
+
+    def _page_stamp(self, index):
+        """Per-page tail of a content stream: paint the furniture form and the page number."""
+        ops = []
+        if self._form_num:
+            ops.append("/Fx1 Do")
+        if self.page_numbers:
+            label = f"Page {index + 1} of {len(self.pages)}"
+            x = self.page_width - self.margin - self.text_width(label, "/F1", FURNITURE_SIZE)
+            ops.append(f"{_num(FURNITURE_GRAY)} g BT /F1 {FURNITURE_SIZE} Tf {_num(x)} {FOOTER_Y} Td "
+                       f"{self._encode(label, '/F1')} Tj ET")
+        # Wrapped in q/Q so the page's own graphics state does not leak in
+        return f"\nq {' '.join(ops)} Q" if ops else ""
+
+    def _resources(self):
+        xobjects = f" /XObject << /Fx1 {self._form_num} 0 R >>" if self._form_num else ""
+        return f"<< /Font {self._font_dict()}{xobjects} >>"
+
+    def _font_dict(self):
+        """Font resources: references to the embedded fonts in use, inline dictionaries for standard ones."""
+        entries = [f"{name} {self._font_refs[name]} 0 R" if font.embedded else f"{name} {font.dictionary()}"
+                   for name, font in self.fonts.items() if name in self._font_refs or not font.embedded]
+        return "<<\n" + '\n'.join(entries) + "\n>>"
+
+    def _start_fonts(self):
+        """Start subsetting the embedded fonts in use; returns their resource names.
+
+        Every glyph must be known by now: page stamps are encoded later,
+        so their characters are registered first.
+        """
+        if self.page_numbers:
+            self._encode("Page 0123456789 of", "/F1")
+        names = [name for name, font in self.fonts.items() if font.embedded and font.used]
+        for name in names:
+            self.fonts[name].start(self.compressor)
+        return names
+
+    def _form_object(self, num, content):
+        """The shared page furniture as a Form XObject covering the page."""
+        data = self.compressor.stream(content.encode('latin-1')).result().decode('latin-1')
+        return (f"{num} 0 obj\n<< /Type /XObject /Subtype /Form /BBox [0 0 {self.page_width} {self.page_height}] "
+                f"/Resources << /Font {self._font_dict()} >> /Length {len(data)} /Filter /FlateDecode >>\n"
+                f"stream\n{data}\nendstream\nendobj")
+
+    def _page_object(self, num, parent, contents, inherit=True):
+        """A page; with `inherit` its media box and resources come from the page tree root."""
+        attributes = "" if inherit else f" /MediaBox [0 0 612 792] /Resources {self._resources_ref} 0 R"
+        return f"{num} 0 obj\n<< /Type /Page /Parent {parent} 0 R{attributes} /Contents {contents} 0 R >>\nendobj"
+
+    def _tree_objects(self, tree, root, page_ref, inherit=True):
+        """Yield the /Pages nodes of `tree` numbered from `root`; page_ref maps a page index to its object number.
+
+        With `inherit` the root holds the media box and resources every
+        page inherits.
+        """
+        for node, parent, pages, kids, count in tree.nodes():
+            refs = ' '.join([f"{page_ref(i)} 0 R" for i in pages] + [f"{root + k} 0 R" for k in kids])
+            if parent is not None:
+                attributes = f" /Parent {root + parent} 0 R"
+            elif inherit:
+                attributes = f" /MediaBox [0 0 612 792] /Resources {self._resources_ref} 0 R"
+            else:
+                attributes = ""
+            yield f"{root + node} 0 obj\n<< /Type /Pages{attributes} /Kids [{refs}] /Count {count} >>\nendobj"
+
+    def _catalog_outlines(self, outline_root):
+        if not self.headings:
+            return ""
+        return f" /Outlines {outline_root} 0 R /PageMode /UseOutlines"
+
+    def _stream_object(self, num, index):
+        """Write a page content stream: its open compressed body closed with the page stamp."""
+        data = close_stream(self.pages[index].result(), self._page_stamp(index).encode('latin-1'),
+                            self.compressor.level).decode('latin-1')
+        return f"{num} 0 obj\n<< /Length {len(data)} /Filter /FlateDecode >>\nstream\n{data}\nendstream\nendobj"
+
+    def _file_id(self, *parts):
+        """Trailer /ID derived from the file body, so equal output has equal IDs."""
+        digest = hashlib.md5()
+        for part in parts:
+            digest.update(part)
+        return f"/ID [<{digest.hexdigest()}> <{digest.hexdigest()}>]"
+
+    def finish(self):
+        """End the last page and insert the table of contents; page numbers are final after this."""
         if self.current_content:
-            self.pages.append('\n'.join(self.current_content))
-
-        pdf = ['%PDF-1.4']
-        pdf.append("1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj")
-        page_refs = ' '.join([f"{i+4} 0 R" for i in range(len(self.pages))])
-        pdf.append(f"2 0 obj\n<< /Type /Pages /Kids [{page_refs}] /Count {len(self.pages)} >>\nendobj")
-        pdf.append("""3 0 obj
-<< /Font <<
-/F1 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>
-/F2 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold >>
-/F3 << /Type /Font /Subtype /Type1 /BaseFont /Courier >>
-/F4 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Oblique >>
->> >>
-endobj""")
-
-        obj_num = 4
-        for content in self.pages:
-            pdf.append(f"{obj_num} 0 obj\n<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources 3 0 R /Contents {obj_num+1} 0 R >>\nendobj")
-            obj_num += 1
-            pdf.append(f"{obj_num} 0 obj\n<< /Length {len(content)} >>\nstream\n{content}\nendstream\nendobj")
-            obj_num += 1
-
-        content = '\n'.join(pdf) + '\n'
-        xref_pos = len(content)
-        xref = f"xref\n0 {obj_num}\n0000000000 65535 f \n"
-        pos = len('%PDF-1.4\n')
-        for line in pdf[1:]:
-            xref += f"{pos:010d} 00000 n \n"
-            pos += len(line) + 1
-
-        with open(filename, 'wb') as f:
-            f.write(content.encode('latin-1'))
-            f.write(xref.encode('latin-1'))
-            f.write(f"trailer\n<< /Size {obj_num} /Root 1 0 R >>\nstartxref\n{xref_pos}\n%%EOF".encode('latin-1'))
-
-
-def parse_md_and_generate(md_path, pdf_path):
-    print(f"Generating PDF from: {md_path}")
+            self._new_page()
+        if self.toc_index is not None:
+            self._insert_toc()
 
-    progress("Reading markdown...")
-    with open(md_path, 'r') as f:
-        content = f.read()
-
-    base_dir = os.path.dirname(md_path)
-    pdf = SimplePDF()
-    lines = content.split('\n')
-    i = 0
-    in_code = False
-    code_buf = []
-    in_table = False
-    table_rows = []
+    def save(self, filename, linearize=False, manifest=None, max_updates=MAX_UPDATES):
+        """Write the PDF; returns False if `filename` already had this exact content.
+
+        With a `manifest` path the object layout of every write is recorded
+        there, and the next save appends only the objects that changed, as
+        a PDF incremental update (new objects, an xref section and a trailer
+        pointing back with /Prev), provided the file is still the one the
+        manifest describes. After `max_updates` updates the file is
+        compacted by a full rewrite. Linearized files are always written in
+        full. `appended` is the number of objects an update wrote, or None
+        after a full write.
+        """
+        self.finish()
+        self.appended = None
+        if linearize:
+            return write_if_changed(filename, self._serialize_linearized())
+
+        previous = read_manifest(manifest, filename) if manifest else None
+        if previous and previous['updates'] < max_updates:
+            return self._save_update(filename, manifest, previous)
+        state = {}
+        written = write_chunks_if_changed(filename, staged(self._serialize(state)))
+        if manifest:
+            write_manifest(manifest, filename, state)
+        return written
+
+    def _save_update(self, filename, manifest, previous):
+        """Append the objects that differ from `previous` to `filename` as an incremental update."""
+        nums, size = self._number_objects(previous)
+        old = previous['blocks']
+        blocks = {}
+        changed = []
+        for key, texts in self._objects(nums):
+            first = nums[key]
+            blocks[key] = [first, self._digests(texts)]
+            changed.extend((first + k, text) for k, (text, digest) in enumerate(zip(texts, blocks[key][1]))
+                           if key not in old or old[key][0] != first or old[key][1][k] != digest)
+        changed.sort()
+        if not changed:
+            return False
+
+        # One xref subsection per run of consecutive object numbers, after the free list head
+        pos = os.path.getsize(filename) + 1
+        body = ['']
+        sections = [(0, ["0000000000 65535 f "])]
+        for num, text in changed:
+            if not sections or sections[-1][0] + len(sections[-1][1]) != num:
+                sections.append((num, []))
+            sections[-1][1].append(f"{pos:010d} 00000 n ")
+            body.append(text)
+            pos += len(text) + 1
+        body = '\n'.join(body) + '\n'
+        xref = ''.join(f"{first} {len(lines)}\n" + ''.join(line + '\n' for line in lines) for first, lines in sections)
+        # The first /ID part identifies the document across updates; the second changes with each one
+        file_id = f"/ID [<{previous['id']}> <{hashlib.md5(body.encode('latin-1')).hexdigest()}>]"
+        xref_pos = pos - 1
+        with open(filename, 'ab') as f:
+            f.write((f"{body}xref\n{xref}trailer\n<< /Size {size} /Root {previous['root']} 0 R "
+                     f"/Prev {previous['xref']} {file_id} >>\nstartxref\n{xref_pos}\n%%EOF").encode('latin-1'))
+        self.appended = len(changed)
+        write_manifest(manifest, filename, dict(previous, blocks=blocks, size=size, xref=xref_pos,
+                                                 updates=previous['updates'] + 1))
+        return True
+
+    def _blocks(self, furniture, fonts):
+        """Objects in file order as (key, count) blocks; a block's objects are numbered consecutively."""
+        blocks = [('catalog', 1), ('pages', PageTree(len(self.pages)).size), ('resources', 1)]
+        blocks += [(f'page{i}', 2) for i in range(len(self.pages))]
+        if furniture:
+            blocks.append(('form', 1))
+        blocks += [(f'font{name}', self.fonts[name].OBJECTS) for name in fonts]
+        if self.headings:
+            blocks.append(('outlines', len(self.headings) + 1))
+        return blocks
+
+    def _number_objects(self, previous=None):
+        """Number every object block; returns ({key: first number}, size).
+
+        Numbers are sequential from 1, or with `previous` (a manifest)
+        each block keeps its earlier numbers while its size is unchanged
+        and new blocks are numbered after the previous /Size.
+        """
+        furniture = self._furniture()
+        fonts = self._start_fonts()
+        nums = {}
+        size = previous['size'] if previous else 1
+        for key, count in self._blocks(furniture, fonts):
+            old = previous['blocks'].get(key) if previous else None
+            if old and len(old[1]) == count:
+                nums[key] = old[0]
+            else:
+                nums[key] = size
+                size += count
+        self._resources_ref = nums['resources']
+        self._form_num = nums.get('form')
+        self._font_refs = {name: nums[f'font{name}'] for name in fonts}
+        return nums, size
+
+    def _objects(self, nums):
+        """Yield (key, [object text]) for each block in file order, building each as it is reached."""
+        pages_num = nums['pages']
+        tree = PageTree(len(self.pages))
+
+        def page_ref(index):
+            return nums[f'page{index}']
+
+        outline_root, outlines = self._outline_objects(nums.get('outlines'), page_ref)
+        yield 'catalog', [f"{nums['catalog']} 0 obj\n<< /Type /Catalog /Pages {pages_num} 0 R"
+                          f"{self._catalog_outlines(outline_root)} >>\nendobj"]
+        yield 'pages', list(self._tree_objects(tree, pages_num, page_ref))
+        yield 'resources', [f"{self._resources_ref} 0 obj\n{self._resources()}\nendobj"]
+        for index in range(len(self.pages)):
+            num = page_ref(index)
+            yield f'page{index}', [self._page_object(num, pages_num + tree.parent(index), num + 1),
+                                   self._stream_object(num + 1, index)]
+        if self._form_num:
+            yield 'form', [self._form_object(self._form_num, self._furniture())]
+        for name, num in self._font_refs.items():
+            yield f'font{name}', self.fonts[name].objects(num, self.compressor.level)
+        if outlines:
+            yield 'outlines', outlines
+
+    @staticmethod
+    def _digests(texts):
+        return [hashlib.md5(text.encode('latin-1')).hexdigest()[:16] for text in texts]
+
+    def _serialize(self, manifest):
+        """Yield the whole file in chunks, objects numbered from 1.
+
+        Blocks are built as they are written, so only the chunks in
+        flight are held beyond the compressed page streams. `manifest` is
+        filled in for save() once the last chunk is out.
+        """
+        nums, size = self._number_objects()
+        header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        digest = hashlib.md5(header)
+        blocks = {}
+        xref = [f"xref\n0 {size}\n0000000000 65535 f \n"]
+        pos = len(header)
+        yield header
+        for key, texts in self._objects(nums):
+            blocks[key] = [nums[key], self._digests(texts)]
+            for text in texts:
+                xref.append(f"{pos:010d} 00000 n \n")
+                pos += len(text) + 1
+            chunk = ''.join(text + '\n' for text in texts).encode('latin-1')
+            digest.update(chunk)
+            yield chunk
+
+        file_id = digest.hexdigest()
+        yield (''.join(xref) + f"trailer\n<< /Size {size} /Root 1 0 R /ID [<{file_id}> <{file_id}>] >>\n"
+               f"startxref\n{pos}\n%%EOF").encode('latin-1')
+        manifest.update(blocks=blocks, size=size, root=1, id=file_id, xref=pos, updates=0)
+
+    def _serialize_linearized(self):
+        """Serialize as a linearized PDF (ISO 32000-1, Annex F).
+
+        Layout: header, linearization dictionary, first-page xref and
+        trailer, catalog, primary hint stream, first page (page, contents,
+        shared resources, furniture form and fonts), remaining pages, page
+        tree, main xref.
+        Objects of the first-page section are numbered after all others so
+        the two xref sections each cover one contiguous range. Pages state
+        their media box and resources themselves, as Annex F requires of
+        the first page, instead of inheriting them.
+        """
+        if not self.pages:
+            self.pages.append(self.compressor.open_stream(''))
+        n = len(self.pages)
+        tree = PageTree(n)
+
+        # Main section: objects 1..m-1 (pages 2..n, outlines, then the page tree, root first)
+        outline_count = len(self.headings) + 1 if self.headings else 0
+        m = 2 * (n - 1) + outline_count + tree.size + 1
+        pages_num = m - tree.size
+        # First-page section: linearization dictionary, catalog, page 1 and its contents,
+        # then the shared objects (resources, furniture form, fonts), then the hint stream
+        lin_num, cat_num, page1_num, content1_num, res_num = range(m, m + 5)
+        furniture = self._furniture()
+        self._form_num = res_num + 1 if furniture else None
+        self._font_refs = {}
+        hint_num = res_num + 1 + bool(furniture)
+        for name in self._start_fonts():
+            self._font_refs[name] = hint_num
+            hint_num += self.fonts[name].OBJECTS
+        size = hint_num + 1
+        self._resources_ref = res_num
+
+        def page_ref(index):
+            return page1_num if index == 0 else 2 * index - 1
+
+        outline_root, outlines = self._outline_objects(2 * n - 1, page_ref)
+
+        def obj(num, body):
+            return f"{num} 0 obj\n{body}\nendobj\n".encode('latin-1')
+
+        def line(text):
+            return (text + '\n').encode('latin-1')
+
+        catalog = obj(cat_num, f"<< /Type /Catalog /Pages {pages_num} 0 R{self._catalog_outlines(outline_root)} >>")
+        first_page = [
+            line(self._page_object(page1_num, pages_num + tree.parent(0), content1_num, inherit=False)),
+            line(self._stream_object(content1_num, 0)),
+            obj(res_num, self._resources()),
+        ]
+        if furniture:
+            first_page.append(line(self._form_object(self._form_num, furniture)))
+        for name, num in self._font_refs.items():
+            first_page.extend(line(text) for text in self.fonts[name].objects(num, self.compressor.level))
+        rest = []
+        for i in range(1, n):
+            page_num, contents_num = 2 * i - 1, 2 * i
+            rest.append((page_num, line(self._page_object(page_num, pages_num + tree.parent(i), contents_num,
+                                                          inherit=False))))
+            rest.append((contents_num, line(self._stream_object(contents_num, i))))
+        others = [(outline_root + k, line(text)) for k, text in enumerate(outlines)]
+        others += [(pages_num + k, line(text))
+                   for k, text in enumerate(self._tree_objects(tree, pages_num, page_ref, inherit=False))]
+        file_id = self._file_id(catalog, *first_page, *(data for _, data in rest + others))
+
+        header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        big = 10 ** 10 - 1
+
+        def lin_dict(length, hint_off, hint_len, end_first, main_xref_t):
+            return (f"<< /Linearized 1 /L {length} /H [{hint_off} {hint_len}] /O {page1_num} "
+                    f"/E {end_first} /N {n} /T {main_xref_t} >>")
+
+        lin_width = len(obj(lin_num, lin_dict(big, big, big, big, big)))
+
+        def first_trailer(prev):
+            return (f"trailer\n<< /Size {size} /Prev {prev} /Root {cat_num} 0 R {file_id} >>\n"
+                    f"startxref\n0\n%%EOF\n")
+
+        first_xref_head = f"xref\n{m} {size - m}\n".encode('latin-1')
+        first_xref_width = len(first_xref_head) + (size - m) * 20 + len(first_trailer(big))
+
+        # Offsets with the hint stream absent, as hint tables require
+        first_xref_pos = len(header) + lin_width
+        cat_pos = first_xref_pos + first_xref_width
+        page1_pos = cat_pos + len(catalog)
+        hint = self._hint_stream(hint_num, page1_pos, first_page, rest)
+
+        # Actual offsets
+        offsets = {lin_num: len(header), cat_num: cat_pos, hint_num: page1_pos}
+        pos = page1_pos + len(hint)
+        for num, data in zip((page1_num, content1_num, *range(res_num, hint_num)), first_page):
+            offsets[num] = pos
+            pos += len(data)
+        end_first = pos
+        for num, data in rest + others:
+            offsets[num] = pos
+            pos += len(data)
+
+        main_xref_pos = pos
+        main_xref = f"xref\n0 {m}\n0000000000 65535 f \n"
+        main_xref_t = main_xref_pos + len(f"xref\n0 {m}")
+        for num in range(1, m):
+            main_xref += f"{offsets[num]:010d} 00000 n \n"
+        main_xref += f"trailer\n<< /Size {m} {file_id} >>\nstartxref\n{first_xref_pos}\n%%EOF\n"
+        main_xref = main_xref.encode('latin-1')
+        total = main_xref_pos + len(main_xref)
+
+        lin = obj(lin_num, lin_dict(total, offsets[hint_num], len(hint), end_first, main_xref_t))
+        lin = lin[:-len(b'endobj\n')].ljust(lin_width - len(b'endobj\n')) + b'endobj\n'
+        first_xref = first_xref_head + b''.join(
+            f"{offsets[num]:010d} 00000 n \n".encode('latin-1') for num in range(m, size))
+        first_xref += first_trailer(main_xref_pos).encode('latin-1')
+        first_xref = first_xref.ljust(first_xref_width, b' ')
+
+        return b''.join([header, lin, first_xref, catalog, hint, *first_page,
+                         *(data for _, data in rest + others), main_xref])
+
+    def _hint_stream(self, num, page1_pos, first_page, rest):
+        """Build the primary hint stream: page offset and shared object hint tables.
+
+        The shared objects are the resource dictionary, the furniture form
+        and the embedded font objects; they live in the first-page section
+        and are referenced by every later page.
+        """
+        shared = first_page[2:]
+        id_bits = (len(shared) - 1).bit_length()
+        page_lens = [sum(len(d) for d in first_page)]
+        nobjects = [len(first_page)]
+        content_offsets = [len(first_page[0])]
+        content_lens = [len(first_page[1])]
+        nshared = [0]
+        for i in range(0, len(rest), 2):
+            page, contents = rest[i][1], rest[i + 1][1]
+            page_lens.append(len(page) + len(contents))
+            nobjects.append(2)
+            content_offsets.append(len(page))
+            content_lens.append(len(contents))
+            nshared.append(len(shared))
+
+        def bits(values):
+            return (max(values) - min(values)).bit_length()
+
+        w = _BitWriter()
+        w.write(min(nobjects), 32)
+        w.write(page1_pos, 32)
+        w.write(bits(nobjects), 16)
+        w.write(min(page_lens), 32)
+        w.write(bits(page_lens), 16)
+        w.write(min(content_offsets), 32)
+        w.write(bits(content_offsets), 16)
+        w.write(min(content_lens), 32)
+        w.write(bits(content_lens), 16)
+        w.write(max(nshared).bit_length(), 16)
+        w.write(id_bits, 16)  # bits for shared object identifiers
+        w.write(0, 16)  # bits for fractional position numerators
+        w.write(1, 16)  # fractional position denominator
+        for values in (nobjects, page_lens):
+            for v in values:
+                w.write(v - min(values), bits(values))
+            w.align()
+        for v in nshared:
+            w.write(v, max(nshared).bit_length())
+        w.align()
+        for v in nshared:
+            for ident in range(v):
+                w.write(ident, id_bits)
+        w.align()
+        # Numerators are zero-width
+        for values in (content_offsets, content_lens):
+            for v in values:
+                w.write(v - min(values), bits(values))
+            w.align()
+
+        shared_offset = len(w.out)
+        w.write(0, 32)  # first object in the shared objects section (none)
+        w.write(0, 32)  # location of the shared objects section (none)
+        w.write(len(shared), 32)  # shared object entries for the first page
+        w.write(len(shared), 32)  # total shared object entries
+        w.write(0, 16)  # bits for objects per group (always 1)
+        lens = [len(d) for d in shared]
+        w.write(min(lens), 32)
+        w.write(bits(lens), 16)
+        for v in lens:
+            w.write(v - min(lens), bits(lens))
+        w.align()
+        for _ in shared:
+            w.write(0, 1)  # no MD5 signature
+        w.align()
+
+        data = bytes(w.out)
+        head = f"{num} 0 obj\n<< /Length {len(data)} /S {shared_offset} >>\nstream\n".encode('latin-1')
+        return head + data + b"\nendstream\nendobj\n"
+
+
+class PageTree:
+    """Shape of a balanced /Pages tree over `count` pages, at most `fanout` kids per node.
+
+    Each level spreads its entries evenly over the nodes of the level
+    above, so every page is at the same depth and the nodes of a level
+    differ in size by at most one. Nodes are numbered from 0 (the root)
+    level by level down to the nodes holding pages. Everything is derived
+    from the page count, so no list of pages is ever built.
+    """
+
+    def __init__(self, count, fanout=PAGE_FANOUT):
+        self.levels = [count]  # Entries per level, from the pages up to the root
+        while len(self.levels) == 1 or self.levels[-1] > 1:
+            self.levels.append(max(1, -(-self.levels[-1] // fanout)))
+        # Number of the first node of each level (none for the pages)
+        self.first = [None] + [sum(self.levels[level + 1:]) for level in range(1, len(self.levels))]
+        self.size = sum(self.levels[1:])
+
+    def _children(self, level, index):
+        """Range of the entries one level down held by node `index` of `level`."""
+        below, here = self.levels[level - 1], self.levels[level]
+        return range(index * below // here, (index + 1) * below // here)
+
+    def _first_page(self, level, index):
+        while level:
+            index = index * self.levels[level - 1] // self.levels[level]
+            level -= 1
+        return index
+
+    def parent(self, index, level=0):
+        """Node number of the parent of entry `index` of `level` (0: the pages)."""
+        below, above = self.levels[level], self.levels[level + 1]
+        return self.first[level + 1] + ((index + 1) * above - 1) // below
+
+    def nodes(self):
+        """Yield (node, parent node or None, page indexes, kid nodes, page count) from the root down."""
+        for level in range(len(self.levels) - 1, 0, -1):
+            for index in range(self.levels[level]):
+                children = self._children(level, index)
+                parent = self.parent(index, level) if level < len(self.levels) - 1 else None
+                count = self._first_page(level, index + 1) - self._first_page(level, index)
+                if level == 1:
+                    yield self.first[level] + index, parent, children, (), count
+                else:
+                    first = self.first[level - 1]
+                    yield (self.first[level] + index, parent, (), range(first + children.start, first + children.stop),
+                           count)
+
+
+class _BitWriter:
+    """Big-endian bit packer for hint tables."""
+
+    def __init__(self):
+        self.out = bytearray()
+        self.acc = 0
+        self.nbits = 0
+
+    def write(self, value, nbits):
+        self.acc = (self.acc << nbits) | value
+        self.nbits += nbits
+        while self.nbits >= 8:
+            self.nbits -= 8
+            self.out.append((self.acc >> self.nbits) & 0xFF)
+        self.acc &= (1 << self.nbits) - 1
+
+    def align(self):
+        if self.nbits:
+            self.write(0, 8 - self.nbits)
+
+
+def check_linearized(path):
+    """Check the linearization structure of a PDF; return a list of problems.
+
+    Malformed input is reported as a problem, never raised.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    problems = []
+    m = re.search(rb'(\d+) 0 obj\n<< /Linearized 1 (.*?)>>', data[:1024], re.S)
+    if not m:
+        return ['no linearization dictionary in the first 1024 bytes']
+    params = dict((k.decode(), v) for k, v in re.findall(rb'/(\w+) (\[[^\]]*\]|\d+)', m.group(2)))
+    missing = [key for key in ('L', 'H', 'O', 'E', 'T') if key not in params]
+    if missing:
+        return [f"linearization dictionary lacks {', '.join('/' + key for key in missing)}"]
+    hint = params['H'].strip(b'[]').split()
+    if len(hint) not in (2, 4) or not all(x.isdigit() for x in hint):
+        return ['/H is not an array of hint stream offsets and lengths']
+    lin_num = int(m.group(1))
+    if int(params['L']) != len(data):
+        problems.append(f"/L {params['L'].decode()} != file length {len(data)}")
+
+    def obj_at(offset):
+        hit = re.match(rb'(\d+) 0 obj', data[offset:offset + 20])
+        return int(hit.group(1)) if hit else None
+
+    endobj = data.find(b'endobj\n', m.start())
+    first_xref = data.find(b'xref\n', endobj)
+    head = re.match(rb'xref\n(\d+) (\d+)\n', data[first_xref:]) if endobj >= 0 and first_xref >= 0 else None
+    if not head:
+        return problems + ['no first-page xref table after the linearization dictionary']
+    if data[endobj + len(b'endobj\n'):first_xref].strip():
+        problems.append('first-page xref does not follow the linearization dictionary')
+    first, count = int(head.group(1)), int(head.group(2))
+    entries = first_xref + head.end()
+    for k in range(count):
+        offset = data[entries + 20 * k:entries + 20 * k + 10]
+        if not offset.isdigit() or obj_at(int(offset)) != first + k:
+            problems.append(f"first-page xref entry for object {first + k} is wrong")
+    if first != lin_num:
+        problems.append('linearization dictionary is not the first first-page object')
+
+    hint_off, hint_len = int(hint[0]), int(hint[1])
+    if not data[hint_off:hint_off + hint_len].endswith(b'endobj\n') or obj_at(hint_off) is None:
+        problems.append('/H does not span the primary hint stream')
+    page1 = int(params['O'])
+    if not (first <= page1 < first + count):
+        problems.append('/O is not in the first-page section')
+    if not int(params['E']) <= len(data):
+        problems.append('/E is past the end of file')
+
+    t = int(params['T'])
+    if not re.search(rb'xref\n0 \d+$', data[max(0, t - 30):t]):
+        problems.append('/T does not point at the first main xref entry')
+    tail = re.search(rb'startxref\s+(\d+)\s*%%EOF\s*$', data[-64:])
+    if not tail:
+        problems.append('no startxref at the end of file')
+    elif int(tail.group(1)) != first_xref:
+        problems.append('final startxref does not point to the first-page xref')
+    return problems
+
+
+def layout_markdown(md_path, compressor=None, report=progress, **options):
+    """Lay out a markdown document into a SimplePDF.
+
+    `options` are passed to SimplePDF (page furniture and fonts). Returns (pdf, image_count); call
+    pdf.save() to write it, or pdf.finish() to settle page numbers
+    without writing.
+    """
+    # Elements are consumed as the parser produces them. Cost figures are
+    # drawn as vector charts from the Section 9 tables, read on the way.
+    figures = {}
+    elements = roadmap.expand(control_matrix.expand(charts.with_cost_figures(parse_markdown(md_path), figures)))
     num_counter = 0
     image_counter = 0
 
-    progress("Parsing content...")
-
-    while i < len(lines):
-        line = lines[i]
-
-        if line.startswith('```'):
-            if in_code:
-                progress("Processing code block...")
-                pdf.add_code('\n'.join(code_buf))
-                code_buf = []
-            in_code = not in_code
-            i += 1
-            continue
-
-        if in_code:
-            code_buf.append(line)
-            i += 1
-            continue
-
-        if '|' in line and line.strip().startswith('|'):
-            if not in_table:
-                in_table = True
-                table_rows = []
-            cells = [c.strip() for c in line.split('|')[1:-1]]
-            if not all(c.replace('-', '').replace(':', '') == '' for c in cells):
-                table_rows.append(cells)
-            i += 1
-            continue
-        elif in_table:
-            progress("Processing table...")
-            pdf.add_table(table_rows)
-            in_table = False
-            table_rows = []
-
-        # Check for image
-        img_match = re.match(r'^!\[([^\]]*)\]\(([^)]+)\)\s*$', line.strip())
-        if img_match:
-            img_path = img_match.group(2)
-            full_path = os.path.join(base_dir, img_path)
-            if os.path.exists(full_path):
-                progress(f"Processing image {image_counter + 1}...")
-                image_counter += 1
-                pdf.add_image(full_path, f"Img{image_counter}")
-            i += 1
-            continue
-
-        if line.startswith('# '):
-            progress(f"Section: {line[2:30]}...")
-            pdf.add_heading(line[2:], 1)
-        elif line.startswith('## '):
-            pdf.add_heading(line[3:], 2)
-        elif line.startswith('### '):
-            pdf.add_heading(line[4:], 3)
-        elif line.startswith('#### '):
-            pdf.add_heading(line[5:], 4)
-        elif line.strip().startswith('- '):
-            pdf.add_bullet(line.strip()[2:])
-        elif re.match(r'^\d+\.\s', line.strip()):
+    report("Parsing content...")
+
+    pdf = SimplePDF(compressor, **options)
+    for elem_type, content in elements:
+        if elem_type == 'code':
+            report("Processing code block...")
+            pdf.add_code(content)
+        elif elem_type == 'table':
+            report("Processing table...")
+            pdf.add_table(content)
+        elif elem_type == 'image':
+            report(f"Processing image {image_counter + 1}...")
+            image_counter += 1
+            chart = figures.get(os.path.basename(content[0]))
+            if chart:
+                pdf.add_chart(chart)
+            else:
+                pdf.add_image(content[0], f"Img{image_counter}")
+        elif elem_type == 'toc':
+            pdf.add_toc()
+        elif elem_type == 'h1':
+            report(f"Section: {content[:28]}...")
+            pdf.add_heading(content, 1)
+        elif elem_type in ('h2', 'h3', 'h4'):
+            pdf.add_heading(content, int(elem_type[1]))
+        elif elem_type == 'bullet':
+            pdf.add_bullet(content)
+        elif elem_type == 'numbered':
             num_counter += 1
-            pdf.add_numbered(num_counter, re.sub(r'^\d+\.\s', '', line.strip()))
-        elif line.strip() == '---':
+            pdf.add_numbered(num_counter, content)
+        elif elem_type == 'hr':
             pdf.add_hr()
-        elif line.strip():
-            text = line.strip()
-            # Check for italic caption
-            if text.startswith('*') and text.endswith('*') and not text.startswith('**'):
-                pdf.add_caption(text[1:-1])
-            else:
-                pdf.add_para(text)
-        else:
+        elif elem_type == 'caption':
+            pdf.add_caption(content)
+        elif elem_type == 'para':
+            pdf.add_para(content)
+        elif elem_type == 'blank':
             num_counter = 0
+    return pdf, image_counter
 
-        i += 1
 
-    if in_table and table_rows:
-        pdf.add_table(table_rows)
+def parse_md_and_generate(md_path, pdf_path, linearize=False, workers=None, manifest=None,
+                          max_updates=MAX_UPDATES, **options):
+    print(f"Generating PDF from: {md_path}")
 
-    progress("Writing PDF...")
-    pdf.save(pdf_path)
+    progress("Reading markdown...")
+    with Compressor(workers) as compressor:
+        pdf, image_counter = layout_markdown(md_path, compressor, **options)
+        progress("Writing PDF...")
+        written = pdf.save(pdf_path, linearize=linearize, manifest=manifest, max_updates=max_updates)
 
     progress("Complete!")
-    print(f"\n\nCreated: {pdf_path}")
+    if pdf.appended:
+        print(f"\n\nUpdated ({pdf.appended} objects appended): {pdf_path}")
+    else:
+        print(f"\n\n{'Created' if written else 'Unchanged (not rewritten)'}: {pdf_path}")
     print(f"Size: {os.path.getsize(pdf_path):,} bytes")
     print(f"Images embedded: {image_counter}")
 
 
 if __name__ == "__main__":
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    md_file = os.path.join(script_dir, "Furientis_CMMC_Compliance_Strategy.md")
-    pdf_file = os.path.join(script_dir, "Furientis_CMMC_Compliance_Strategy.pdf")
-    parse_md_and_generate(md_file, pdf_file)
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', nargs='?',
+                        default=os.path.join(script_dir, "Furientis_CMMC_Compliance_Strategy.md"),
+                        help='markdown source, or - to read from stdin')
+    parser.add_argument('-o', '--output', help='PDF path (default: input name with .pdf)')
+    parser.add_argument('--linearize', action='store_true',
+                        help='write a linearized ("fast web view") PDF')
+    parser.add_argument('--check-linearized', metavar='PDF',
+                        help='check the linearization structure of an existing PDF and exit')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='compression threads (default: number of CPUs)')
+    parser.add_argument('--header', nargs='?', const='', metavar='TEXT',
+                        help='add a running header (TEXT defaults to the document title)')
+    parser.add_argument('--footer', help='running footer text')
+    parser.add_argument('--marking', help='distribution marking banner for the top and bottom of every page, e.g. CUI')
+    parser.add_argument('--page-numbers', action='store_true', help='add "Page N of M" footers')
+    parser.add_argument('--standard-fonts', action='store_true',
+                        help='use the standard PDF fonts instead of embedding TrueType subsets (ASCII/WinAnsi only)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='append only changed objects to the previous build as an incremental update')
+    parser.add_argument('--max-updates', type=int, default=MAX_UPDATES,
+                        help=f'incremental updates before the file is compacted (default {MAX_UPDATES})')
+    args = parser.parse_args()
+
+    if args.check_linearized:
+        problems = check_linearized(args.check_linearized)
+        for problem in problems:
+            print(f"  {problem}")
+        print("Linearization OK" if not problems else f"{len(problems)} problem(s) found")
+        raise SystemExit(1 if problems else 0)
+
+    md_file = args.input
+    pdf_file = args.output or (os.path.splitext(md_file)[0] + ".pdf" if md_file != '-' else "output.pdf")
+    manifest = None
+    if args.incremental:
+        key = hashlib.sha256(os.path.abspath(pdf_file).encode('utf-8')).hexdigest()[:32]
+        manifest = os.path.join(script_dir, '.build_cache', 'pdf', key + '.json')
+    parse_md_and_generate(md_file, pdf_file, linearize=args.linearize, workers=args.jobs,
+                          manifest=manifest, max_updates=args.max_updates,
+                          header=(args.header or document_title(md_file)) if args.header is not None else None,
+                          footer=args.footer, marking=args.marking, page_numbers=args.page_numbers,
+                          embed_fonts=not args.standard_fonts,
+                          font_cache=os.path.join(script_dir, '.build_cache', 'fonts'))
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Image preparation for embedded diagrams - resamples PNGs to a target DPI for
+their placed size, optionally reduces flat-color images to a palette, and
+re-encodes them. Results are cached on disk by source hash and target size.
+Uses NumPy when available; without it images are passed through unchanged.
+"""
+
+import hashlib
+import os
+import struct
+import threading
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+EMU_PER_INCH = 914400
+DEFAULT_DPI = 150
+PALETTE_COVERAGE = 0.98  # Share of pixels the top 256 colors must cover
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+def read_chunks(data):
+    """Yield (type, payload) for each chunk of a PNG byte string."""
+    pos = 8
+    while pos + 8 <= len(data):
+        length = int.from_bytes(data[pos:pos + 4], 'big')
+        chunk_type = data[pos + 4:pos + 8]
+        yield chunk_type, data[pos + 8:pos + 8 + length]
+        if chunk_type == b'IEND':
+            break
+        pos += length + 12
+
+
+def decode_png(data):
+    """Decode an 8-bit non-interlaced PNG into an (h, w, 4) RGBA uint8 array.
+
+    Returns None for PNG variants this module does not handle.
+    """
+    if data[:8] != PNG_SIGNATURE:
+        return None
+    header = palette = trns = None
+    idat = []
+    for chunk_type, payload in read_chunks(data):
+        if chunk_type == b'IHDR':
+            header = struct.unpack('>IIBBBBB', payload)
+        elif chunk_type == b'PLTE':
+            palette = payload
+        elif chunk_type == b'tRNS':
+            trns = payload
+        elif chunk_type == b'IDAT':
+            idat.append(payload)
+    if header is None:
+        return None
+    width, height, bit_depth, color_type, _, _, interlace = header
+    if bit_depth != 8 or interlace or color_type not in CHANNELS:
+        return None
+
+    bpp = CHANNELS[color_type]
+    stride = width * bpp
+    raw = np.frombuffer(zlib.decompress(b''.join(idat)), dtype=np.uint8)
+    raw = raw[:height * (stride + 1)].reshape(height, stride + 1)
+    filters = raw[:, 0]
+    rows = raw[:, 1:]
+    if np.isin(filters, (3, 4)).any():
+        out = _unfilter_diagonals(rows, filters, width, bpp)
+    else:
+        out = np.empty((height, stride), dtype=np.uint8)
+        prev = np.zeros(stride, dtype=np.uint8)
+        for y in range(height):
+            row = rows[y]
+            ftype = filters[y]
+            if ftype == 0:
+                cur = row
+            elif ftype == 1:
+                # Sub: running sum of each byte lane, wrapping at 256
+                cur = np.cumsum(row.reshape(width, bpp), axis=0, dtype=np.uint8).reshape(stride)
+            else:
+                cur = row + prev
+            out[y] = cur
+            prev = out[y]
+
+    pixels = out.reshape(height, width, bpp)
+    if color_type == 3:
+        lut = np.full((256, 4), 255, dtype=np.uint8)
+        pal = np.frombuffer(palette or b'', dtype=np.uint8).reshape(-1, 3)
+        lut[:len(pal), :3] = pal
+        if trns:
+            lut[:len(trns), 3] = np.frombuffer(trns, dtype=np.uint8)
+        return lut[pixels[:, :, 0]]
+    rgba = np.empty((height, width, 4), dtype=np.uint8)
+    if color_type in (0, 4):
+        rgba[:, :, :3] = pixels[:, :, :1]
+    else:
+        rgba[:, :, :3] = pixels[:, :, :3]
+    rgba[:, :, 3] = pixels[:, :, -1] if color_type in (4, 6) else 255
+    return rgba
+
+
+def _unfilter_diagonals(rows, filters, width, bpp):
+    """Undo any mix of row filters, one anti-diagonal of pixels at a time.
+
+    Average (3) and Paeth (4) depend on the decoded pixel to the left,
+    so a row cannot be decoded in one step. A pixel only depends on its
+    left, upper and upper-left neighbours, though, so all pixels with the
+    same x + y are decoded together, every byte lane at once: the loop
+    runs height + width times instead of once per byte.
+    """
+    height = len(rows)
+    raw = rows.reshape(height, width, bpp).astype(np.int16)
+    # A row and column of zeros stand in for the neighbours outside the image
+    out = np.zeros((height + 1, width + 1, bpp), dtype=np.int16)
+    ftypes = filters.astype(np.int16)
+    for d in range(height + width - 1):
+        ys = np.arange(max(0, d - width + 1), min(height, d + 1))
+        xs = d - ys
+        a, b, c = out[ys + 1, xs], out[ys, xs + 1], out[ys, xs]
+        pa, pb, pc = np.abs(b - c), np.abs(a - c), np.abs(a + b - 2 * c)
+        paeth = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+        ftype = ftypes[ys, None]
+        pred = np.select([ftype == 1, ftype == 2, ftype == 3, ftype == 4], [a, b, (a + b) >> 1, paeth], 0)
+        out[ys + 1, xs + 1] = (raw[ys, xs] + pred) & 0xFF
+    return out[1:, 1:].astype(np.uint8).reshape(height, width * bpp)
+
+
+def _box_resample(values, new_size, axis):
+    """Area-average `values` along `axis` to `new_size` samples.
+
+    Each output sample is the mean of the source interval it covers,
+    computed from linearly interpolated cumulative sums so the filter
+    is exact for fractional scale factors and linear in the input size.
+    """
+    old_size = values.shape[axis]
+    values = np.moveaxis(values, axis, 0)
+    cum = np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+    edges = np.linspace(0, old_size, new_size + 1)
+    base = np.minimum(edges.astype(np.intp), old_size - 1)
+    frac = (edges - base).reshape((-1,) + (1,) * (values.ndim - 1))
+    at_edges = cum[base] + frac * (cum[base + 1] - cum[base])
+    result = (at_edges[1:] - at_edges[:-1]) * (new_size / old_size)
+    return np.moveaxis(result, 0, axis)
+
+
+def resample(rgba, width, height):
+    """Downsample an RGBA image to width x height with alpha-weighted box filtering."""
+    pixels = rgba.astype(np.float64)
+    alpha = pixels[:, :, 3:] / 255.0
+    pixels[:, :, :3] *= alpha
+    pixels = _box_resample(_box_resample(pixels, height, 0), width, 1)
+    alpha = pixels[:, :, 3:] / 255.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pixels[:, :, :3] = np.where(alpha > 0, pixels[:, :, :3] / alpha, 0)
+    return np.clip(np.rint(pixels), 0, 255).astype(np.uint8)
+
+
+def quantize(rgba, coverage=PALETTE_COVERAGE):
+    """Map a flat-color image onto a 256-entry palette.
+
+    Returns (indices, palette) when the 256 most frequent colors cover at
+    least `coverage` of the pixels (anti-aliased edges are then mapped to
+    their nearest palette entry), otherwise None.
+    """
+    packed = rgba.reshape(-1, 4).view('>u4').ravel()
+    colors, inverse, counts = np.unique(packed, return_inverse=True, return_counts=True)
+    if len(colors) > 256:
+        order = np.argsort(counts)[::-1]
+        if counts[order[:256]].sum() < coverage * packed.size:
+            return None
+        palette = colors[order[:256]]
+    else:
+        palette = colors
+    pal_rgba = palette.astype('>u4').view(np.uint8).reshape(-1, 4).astype(np.int32)
+    col_rgba = colors.astype('>u4').view(np.uint8).reshape(-1, 4).astype(np.int32)
+    nearest = np.empty(len(colors), dtype=np.uint8)
+    for start in range(0, len(colors), 4096):
+        block = col_rgba[start:start + 4096, None, :] - pal_rgba[None, :, :]
+        nearest[start:start + 4096] = np.argmin((block * block).sum(axis=2), axis=1)
+    indices = nearest[inverse].reshape(rgba.shape[:2])
+    return indices, pal_rgba.astype(np.uint8)
+
+
+def _filter_rows(pixels, bpp):
+    """Apply the PNG filter that minimises each row's sum of absolute values."""
+    height, stride = pixels.shape
+    cur = pixels.astype(np.int16)
+    up = np.vstack([np.zeros((1, stride), dtype=np.int16), cur[:-1]])
+    left = np.hstack([np.zeros((height, bpp), dtype=np.int16), cur[:, :-bpp]])
+    upleft = np.hstack([np.zeros((height, bpp), dtype=np.int16), up[:, :-bpp]])
+    p = left + up - upleft
+    pa, pb, pc = np.abs(p - left), np.abs(p - up), np.abs(p - upleft)
+    paeth = np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, upleft))
+    candidates = np.stack([cur, cur - left, cur - up, cur - ((left + up) >> 1), cur - paeth])
+    candidates = (candidates & 0xFF).astype(np.uint8)
+    cost = np.abs(candidates.view(np.int8).astype(np.int32)).sum(axis=2)
+    choice = np.argmin(cost, axis=0)
+    filtered = candidates[choice, np.arange(height)]
+    return np.hstack([choice.astype(np.uint8)[:, None], filtered])
+
+
+def _chunk(chunk_type, payload):
+    return (struct.pack('>I', len(payload)) + chunk_type + payload +
+            struct.pack('>I', zlib.crc32(chunk_type + payload) & 0xFFFFFFFF))
+
+
+def encode_png(rgba, dpi=None, palette='auto'):
+    """Encode an RGBA array as the smallest fitting PNG color type."""
+    height, width = rgba.shape[:2]
+    opaque = bool((rgba[:, :, 3] == 255).all())
+    chunks = []
+    quantized = quantize(rgba) if palette else None
+    if quantized is not None:
+        indices, pal = quantized
+        color_type, bpp = 3, 1
+        rows = np.hstack([np.zeros((height, 1), dtype=np.uint8), indices])
+        chunks.append(_chunk(b'PLTE', pal[:, :3].tobytes()))
+        if not opaque:
+            chunks.append(_chunk(b'tRNS', pal[:, 3].tobytes()))
+    else:
+        gray = bool((rgba[:, :, 0] == rgba[:, :, 1]).all() and (rgba[:, :, 1] == rgba[:, :, 2]).all())
+        channels = [0] if gray else [0, 1, 2]
+        if not opaque:
+            channels.append(3)
+        color_type = {1: 0, 2: 4, 3: 2, 4: 6}[len(channels)]
+        bpp = len(channels)
+        rows = _filter_rows(rgba[:, :, channels].reshape(height, width * bpp), bpp)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)
+    out = [PNG_SIGNATURE, _chunk(b'IHDR', header)] + chunks
+    if dpi:
+        ppm = int(round(dpi / 0.0254))
+        out.append(_chunk(b'pHYs', struct.pack('>IIB', ppm, ppm, 1)))
+    out.append(_chunk(b'IDAT', zlib.compress(rows.tobytes(), 9)))
+    out.append(_chunk(b'IEND', b''))
+    return b''.join(out)
+
+
+def target_pixels(width_emu, height_emu, dpi):
+    """Pixel size for an image placed at the given EMU extent and DPI."""
+    return (max(1, round(width_emu / EMU_PER_INCH * dpi)),
+            max(1, round(height_emu / EMU_PER_INCH * dpi)))
+
+
+def prepare_image(image_path, width_emu, height_emu, dpi=DEFAULT_DPI, palette='auto', cache_dir=None):
+    """Return PNG bytes for an image placed at width_emu x height_emu.
+
+    Images larger than needed for `dpi` at their placed size are
+    downsampled; all decodable PNGs are re-encoded (as a palette image
+    when they are flat-color and `palette` is set). The original bytes
+    are returned when they are smaller, when the image is not a PNG this
+    module can decode, or when NumPy is not installed.
+    """
+    with open(image_path, 'rb') as f:
+        original = f.read()
+    if np is None or original[:8] != PNG_SIGNATURE:
+        return original
+
+    width, height = target_pixels(width_emu, height_emu, dpi)
+    key = hashlib.sha256(original).hexdigest()[:32] + f"-{width}x{height}-{dpi}-{palette or 'rgb'}"
+    cache_path = os.path.join(cache_dir, key + '.png') if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, 'rb') as f:
+            return f.read()
+
+    result = original
+    rgba = decode_png(original)
+    if rgba is not None:
+        if rgba.shape[1] > width or rgba.shape[0] > height:
+            rgba = resample(rgba, width, height)
+        encoded = encode_png(rgba, dpi=dpi, palette=palette)
+        if len(encoded) < len(original):
+            result = encoded
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Unique per writer, since images may be prepared on several threads
+        tmp_path = f"{cache_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(result)
+        os.replace(tmp_path, cache_path)
+    return result
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Markdown parser shared by the CMMC document generators.
+Reads sources through a memory map (or stdin as a stream), iterates lines
+lazily and decodes text only once a line's element type is known.
+"""
+
+import mmap
+import os
+import re
+import sys
+
+# Inline run styles
+BOLD = 1
+ITALIC = 2
+CODE = 4
+LINK = 8
+
+INLINE_SPECIAL_RE = re.compile(r'[`\[*_]')
+IMAGE_RE = re.compile(rb'^!\[([^\]]*)\]\(([^)]+)\)\s*$')
+DIRECTIVE_RE = re.compile(rb'^\[(CONTROLS|ROADMAP):(\w+)\](?:\(([^)]+)\))?\s*$')
+NUMBERED_RE = re.compile(rb'\d+\.\s')
+HEADINGS = ((b'# ', 'h1'), (b'## ', 'h2'), (b'### ', 'h3'), (b'#### ', 'h4'))
+
+
+def decode(data):
+    return data.decode('utf-8', 'replace')
+
+
+def tokenize_inline(text):
+    """Split inline markdown into styled runs in a single left-to-right pass.
+
+    Returns a list of (text, style, href) tuples where style is a mask of
+    BOLD, ITALIC, CODE and LINK and href is set for link runs. Emphasis
+    uses ** / __ (bold) and * / _ (italic); underscores inside words are
+    literal. Delimiters without a partner are kept as text.
+
+    Runs in time linear in len(text): the scan never moves backwards,
+    closing-character lookups only advance their cached position, each
+    pairing step consumes an opener or a closer, and a link label (which
+    cannot contain ']') is tokenized once, at most one level deep.
+    """
+    parts = []
+    # Cache of the next occurrence of each closing character, so repeated
+    # unmatched openers never rescan the same text.
+    next_at = {}
+
+    def find(ch, start):
+        pos = next_at.get(ch, -2)
+        if pos == -1 or pos >= start:
+            return pos
+        pos = text.find(ch, start)
+        next_at[ch] = pos
+        return pos
+
+    i, n = 0, len(text)
+    literal_start = 0
+    while True:
+        match = INLINE_SPECIAL_RE.search(text, i)
+        if not match:
+            break
+        i = match.start()
+        c = text[i]
+        part = None
+        end = i + 1
+        if c == '`':
+            close = find('`', i + 1)
+            if close >= 0:
+                part, end = ('code', text[i + 1:close]), close + 1
+        elif c == '[':
+            close = find(']', i + 1)
+            if close >= 0 and text.startswith('(', close + 1):
+                paren = find(')', close + 2)
+                if paren >= 0:
+                    part = ('link', tokenize_inline(text[i + 1:close]), text[close + 2:paren])
+                    end = paren + 1
+        else:
+            while end < n and text[end] == c:
+                end += 1
+            before = text[i - 1] if i > 0 else ' '
+            after = text[end] if end < n else ' '
+            can_open = not after.isspace()
+            can_close = not before.isspace()
+            if c == '_':
+                can_open = can_open and not before.isalnum()
+                can_close = can_close and not after.isalnum()
+            if can_open or can_close:
+                # [char, unmatched count, can_open, can_close, styles opened, styles closed]
+                part = [c, end - i, can_open, can_close, [], []]
+        if part is not None:
+            if literal_start < i:
+                parts.append(text[literal_start:i])
+            parts.append(part)
+            literal_start = end
+        i = end
+    if literal_start < n:
+        parts.append(text[literal_start:])
+
+    # Pair delimiter runs; each character has its own opener stack
+    stacks = {'*': [], '_': []}
+    for part in parts:
+        if not isinstance(part, list):
+            continue
+        stack = stacks[part[0]]
+        if part[3]:
+            while part[1] and stack:
+                opener = stack[-1]
+                use = 3 if opener[1] >= 3 and part[1] >= 3 else 2 if opener[1] >= 2 and part[1] >= 2 else 1
+                style = {1: ITALIC, 2: BOLD, 3: BOLD | ITALIC}[use]
+                opener[1] -= use
+                part[1] -= use
+                opener[4].append(style)
+                part[5].append(style)
+                if not opener[1]:
+                    stack.pop()
+        if part[1] and part[2]:
+            stack.append(part)
+
+    runs = []
+    chunks = []
+    current = (0, None)
+    depth = {BOLD: 0, ITALIC: 0}
+
+    def emit(chunk, extra=0, href=None):
+        nonlocal current
+        if not chunk:
+            return
+        style = extra
+        for flag, count in depth.items():
+            if count:
+                style |= flag
+        if (style, href) != current:
+            if chunks:
+                runs.append((''.join(chunks), *current))
+                chunks.clear()
+            current = (style, href)
+        chunks.append(chunk)
+
+    def apply(styles, delta):
+        for style in styles:
+            for flag in (BOLD, ITALIC):
+                if style & flag:
+                    depth[flag] += delta
+
+    for part in parts:
+        if isinstance(part, str):
+            emit(part)
+        elif isinstance(part, list):
+            apply(part[5], -1)
+            emit(part[0] * part[1])
+            apply(part[4], 1)
+        elif part[0] == 'code':
+            emit(part[1], CODE)
+        else:
+            for chunk, style, _ in part[1]:
+                emit(chunk, style | LINK, part[2])
+    if chunks:
+        runs.append((''.join(chunks), *current))
+    return runs
+
+
+def strip_markdown(text):
+    """Remove inline markdown formatting from text."""
+    return ''.join(run[0] for run in tokenize_inline(text))
+
+
+def document_title(source):
+    """Title for a document: its file name with underscores as spaces ('Document' for stdin)."""
+    if source == '-':
+        return "Document"
+    return os.path.splitext(os.path.basename(source))[0].replace('_', ' ')
+
+
+def iter_lines(source):
+    """Yield the lines of `source` as bytes without line terminators.
+
+    `source` is a path, '-' for stdin, or a binary file object. Files are
+    memory-mapped and sliced one line at a time; streams are read line by
+    line, so neither is ever held in memory as a whole.
+    """
+    if source == '-':
+        source = sys.stdin.buffer
+    if hasattr(source, 'read'):
+        for line in source:
+            yield line.rstrip(b'\r\n')
+        return
+
+    with open(source, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos, size = 0, len(mm)
+            while pos < size:
+                end = mm.find(b'\n', pos)
+                if end < 0:
+                    end = size
+                line = mm[pos:end]
+                yield line[:-1] if line.endswith(b'\r') else line
+                pos = end + 1
+
+
+def parse_markdown(source, base_dir=None):
+    """Parse markdown into a stream of (element_type, content) tuples.
+
+    Element types: h1-h4, para, caption, bullet, numbered, code, table,
+    image ((path, alt_text)), hr, toc, controls and roadmap ((view, data
+    path or None), from [CONTROLS:view](mapping.csv) and
+    [ROADMAP:view](tasks.csv) lines; see control_matrix and roadmap), and
+    blank (a blank line, which ends a numbered list).
+    """
+    if base_dir is None:
+        base_dir = os.getcwd() if source == '-' or hasattr(source, 'read') else os.path.dirname(source)
+    in_code_block = False
+    code_content = []
+    in_table = False
+    table_rows = []
+
+    for line in iter_lines(source):
+        # Code blocks
+        if line.startswith(b'```'):
+            if in_code_block:
+                yield ('code', decode(b'\n'.join(code_content)))
+                code_content = []
+            in_code_block = not in_code_block
+            continue
+
+        if in_code_block:
+            code_content.append(line)
+            continue
+
+        stripped = line.strip()
+
+        # Tables; the |---|:--:| separator row is the only one made of these bytes
+        if stripped.startswith(b'|'):
+            in_table = True
+            if stripped.translate(None, b'|-: \t'):
+                table_rows.append([decode(c.strip()) for c in line.split(b'|')[1:-1]])
+            continue
+        elif in_table:
+            if table_rows:
+                yield ('table', table_rows)
+            in_table = False
+            table_rows = []
+
+        # Images - ![alt](path)
+        img_match = IMAGE_RE.match(stripped)
+        if img_match:
+            full_path = os.path.join(base_dir, decode(img_match.group(2)))
+            if os.path.exists(full_path):
+                yield ('image', (full_path, decode(img_match.group(1))))
+            continue
+
+        if stripped == b'[TOC]':
+            yield ('toc', '')
+            continue
+
+        directive = DIRECTIVE_RE.match(stripped)
+        if directive:
+            data = directive.group(3)
+            yield (decode(directive.group(1)).lower(), (decode(directive.group(2)),
+                                                        os.path.join(base_dir, decode(data)) if data else None))
+            continue
+
+        for prefix, elem_type in HEADINGS:
+            if line.startswith(prefix):
+                yield (elem_type, decode(line[len(prefix):].strip()))
+                break
+        else:
+            numbered = NUMBERED_RE.match(stripped)
+            if stripped.startswith(b'- '):
+                yield ('bullet', decode(stripped[2:]))
+            elif numbered:
+                yield ('numbered', decode(stripped[numbered.end():]))
+            elif stripped == b'---':
+                yield ('hr', '')
+            elif stripped:
+                # Italic-only lines are figure captions
+                if stripped.startswith(b'*') and stripped.endswith(b'*') and not stripped.startswith(b'**'):
+                    yield ('caption', decode(stripped[1:-1]))
+                else:
+                    yield ('para', decode(stripped))
+            else:
+                yield ('blank', '')
+
+    # Handle trailing table
+    if in_table and table_rows:
+        yield ('table', table_rows)
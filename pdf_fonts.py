@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Fonts for the PDF generator - the standard Type 1 fonts (WinAnsi encoded)
+and embedded TrueType subsets (Type 0 / CIDFontType2, Identity-H, with a
+ToUnicode CMap). Glyph use is recorded as text is encoded; each embedded
+font is subset once when the file is written, and subsets are cached on
+disk by font and glyph set so unchanged builds never subset again.
+"""
+
+import functools
+import hashlib
+import os
+import struct
+import threading
+import zlib
+
+from truetype import TrueTypeFont, find_font
+
+# Resource name -> standard font
+FACES = {
+    '/F1': 'Helvetica',
+    '/F2': 'Helvetica-Bold',
+    '/F3': 'Courier',
+    '/F4': 'Helvetica-Oblique',
+    '/F5': 'Helvetica-BoldOblique',
+}
+
+# TrueType families to embed instead, first complete one wins. A family is
+# used whole or not at all, so body text, headings and italic runs never
+# mix designs. Liberation Sans and Mono share Helvetica's and Courier's metrics.
+FAMILIES = (
+    {'/F1': 'LiberationSans-Regular.ttf', '/F2': 'LiberationSans-Bold.ttf', '/F3': 'LiberationMono-Regular.ttf',
+     '/F4': 'LiberationSans-Italic.ttf', '/F5': 'LiberationSans-BoldItalic.ttf'},
+    {'/F1': 'DejaVuSans.ttf', '/F2': 'DejaVuSans-Bold.ttf', '/F3': 'DejaVuSansMono.ttf',
+     '/F4': 'DejaVuSans-Oblique.ttf', '/F5': 'DejaVuSans-BoldOblique.ttf'},
+)
+
+# Helvetica and Helvetica-Bold advance widths (1/1000 em) for ASCII 32-126
+HELVETICA_WIDTHS = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)
+HELVETICA_BOLD_WIDTHS = (
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+)
+
+TO_UNICODE_HEAD = """/CIDInit /ProcSet findresource begin
+12 dict begin
+begincmap
+/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def
+/CMapName /Adobe-Identity-UCS def
+/CMapType 2 def
+1 begincodespacerange
+<0000> <FFFF>
+endcodespacerange
+"""
+TO_UNICODE_TAIL = """endcmap
+CMapName currentdict /CMap defineresource pop
+end
+end"""
+
+
+def load_fonts(embed=True, cache_dir=None):
+    """Font objects for every resource name in FACES.
+
+    With `embed`, the faces come from the first family in FAMILIES whose
+    files are all installed; without one (and without `embed`) every
+    face is the standard font.
+    """
+    for family in FAMILIES if embed else ():
+        paths = {name: find_font(family[name]) for name in FACES}
+        if all(paths.values()):
+            return {name: EmbeddedFont(_load(path), cache_dir) for name, path in paths.items()}
+    return {name: StandardFont(base_font) for name, base_font in FACES.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def _load(path):
+    """Parsed font file, shared by every document of a run (it is read-only)."""
+    return TrueTypeFont(path)
+
+
+class _Table(dict):
+    """Per-character lookup table that fills itself in on first use."""
+
+    def __init__(self, fill):
+        super().__init__()
+        self.fill = fill
+
+    def __missing__(self, key):
+        value = self[key] = self.fill(key)
+        return value
+
+
+class _Metrics:
+    """Text measuring shared by both font kinds; `widths` maps characters to 1/1000 em."""
+
+    def width(self, text, size):
+        """Width of `text` at `size` points."""
+        return sum(map(self.widths.__getitem__, text)) * size / 1000
+
+    def fit(self, text, size, room):
+        """Longest prefix of `text` no wider than `room` points."""
+        used, limit = 0, room * 1000 / size
+        for k, char in enumerate(text):
+            used += self.widths[char]
+            if used > limit:
+                return text[:k]
+        return text
+
+
+class StandardFont(_Metrics):
+    """One of the 14 standard Type 1 fonts with WinAnsiEncoding."""
+
+    embedded = False
+
+    def __init__(self, base_font):
+        self.base_font = base_font
+        if base_font.startswith('Courier'):
+            ascii_widths = (600,) * 95
+        else:
+            ascii_widths = HELVETICA_BOLD_WIDTHS if '-Bold' in base_font else HELVETICA_WIDTHS
+        self.widths = _Table(lambda char: 556)
+        self.widths.update(zip(map(chr, range(32, 127)), ascii_widths))
+
+    def dictionary(self):
+        return f"<< /Type /Font /Subtype /Type1 /BaseFont /{self.base_font} /Encoding /WinAnsiEncoding >>"
+
+    def encode(self, text):
+        """`text` as a string operand; characters outside WinAnsi become '?'."""
+        data = text.encode('cp1252', 'replace')
+        out = []
+        for byte in data:
+            if byte in b'()\\':
+                out.append('\\' + chr(byte))
+            elif 32 <= byte < 127:
+                out.append(chr(byte))
+            else:
+                out.append(f'\\{byte:03o}')  # Content streams stay ASCII
+        return f"({''.join(out)})"
+
+
+class EmbeddedFont(_Metrics):
+    """A TrueType font embedded as a subset, addressed by glyph id (Identity-H)."""
+
+    embedded = True
+    OBJECTS = 5  # Type 0 font, CIDFont, descriptor, font file, ToUnicode CMap
+
+    def __init__(self, font, cache_dir=None):
+        self.font = font
+        self.cache_dir = cache_dir
+        self.scale = 1000 / font.units_per_em
+        self.fallback = font.glyph_id('?')
+        self.codes = _Table(self._code)     # char -> escaped two-byte glyph code
+        self.widths = _Table(self._advance)  # char -> advance in 1/1000 em
+        self.used = {}  # glyph id -> char, for /W and the ToUnicode CMap
+        self._file = None
+
+    def _glyph(self, char):
+        return self.font.glyph_id(char) or self.fallback
+
+    def _advance(self, char):
+        return self.font.advance(self._glyph(char)) * self.scale
+
+    def _code(self, char):
+        glyph = self._glyph(char)
+        self.used.setdefault(glyph, char if glyph != self.fallback else '?')
+        return ''.join('\\' + c if c in '()\\' else '\\r' if c == '\r' else c
+                       for c in (chr(glyph >> 8), chr(glyph & 0xFF)))
+
+    def encode(self, text):
+        """`text` as a string of two-byte glyph ids; records the glyphs for the subset.
+
+        The string is binary (latin-1 characters): it deflates to about a
+        quarter less than the same codes in hex.
+        """
+        return f"({''.join(map(self.codes.__getitem__, text))})"
+
+    def start(self, compressor):
+        """Start subsetting and deflating on the compressor; the glyph set must be final."""
+        self._file = compressor.submit(self._font_file, compressor.level)
+
+    def _font_file(self, level):
+        """(subset length, deflated subset) for the glyphs used, from the cache when possible."""
+        glyphs = sorted(self.used)
+        subset = None
+        cache_path = None
+        if self.cache_dir:
+            key = (hashlib.sha256(self.font.data).hexdigest()[:32] + '-' +
+                   hashlib.sha256(struct.pack(f'>{len(glyphs)}H', *glyphs)).hexdigest()[:16])
+            cache_path = os.path.join(self.cache_dir, key + '.ttf')
+            if os.path.exists(cache_path):
+                with open(cache_path, 'rb') as f:
+                    subset = f.read()
+        if subset is None:
+            subset = self.font.subset(glyphs)
+            if cache_path:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{cache_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(subset)
+                os.replace(tmp_path, cache_path)
+        return len(subset), zlib.compress(subset, level)
+
+    def _base_font(self):
+        """Subset name: a tag derived from the glyph set, plus the font's file name."""
+        digest = hashlib.md5(','.join(map(str, sorted(self.used))).encode('ascii')).digest()
+        tag = ''.join(chr(65 + b % 26) for b in digest[:6])
+        return f"{tag}+{os.path.splitext(os.path.basename(self.font.file_path))[0]}"
+
+    def _widths(self):
+        """/W array: runs of consecutive glyph ids with their widths."""
+        runs = []
+        for glyph in sorted(self.used):
+            width = round(self.font.advance(glyph) * self.scale)
+            if runs and runs[-1][0] + len(runs[-1][1]) == glyph:
+                runs[-1][1].append(width)
+            else:
+                runs.append((glyph, [width]))
+        return ' '.join(f"{start} [{' '.join(map(str, widths))}]" for start, widths in runs)
+
+    def _to_unicode(self):
+        lines = []
+        entries = sorted(self.used.items())
+        for start in range(0, len(entries), 100):
+            chunk = entries[start:start + 100]
+            lines.append(f"{len(chunk)} beginbfchar")
+            lines.extend(f"<{glyph:04X}> <{char.encode('utf-16-be').hex().upper()}>" for glyph, char in chunk)
+            lines.append("endbfchar")
+        return TO_UNICODE_HEAD + '\n'.join(lines) + '\n' + TO_UNICODE_TAIL
+
+    def objects(self, num, level):
+        """The OBJECTS PDF objects of the font, numbered from `num` (the Type 0 font)."""
+        font = self.font
+        name = self._base_font()
+        length, data = self._file.result()
+        x_min, y_min, x_max, y_max = struct.unpack_from('>hhhh', font.data, font.tables['head'][0] + 36)
+        post = font.tables['post'][0]
+        italic_angle = struct.unpack_from('>i', font.data, post + 4)[0] / 65536
+        fixed_pitch = struct.unpack_from('>I', font.data, post + 12)[0]
+        flags = 32 | (1 if fixed_pitch else 0) | (64 if italic_angle else 0)
+        bbox = ' '.join(str(round(v * self.scale)) for v in (x_min, y_min, x_max, y_max))
+        cmap = zlib.compress(self._to_unicode().encode('ascii'), level)
+        return [
+            f"{num} 0 obj\n<< /Type /Font /Subtype /Type0 /BaseFont /{name} /Encoding /Identity-H "
+            f"/DescendantFonts [{num + 1} 0 R] /ToUnicode {num + 4} 0 R >>\nendobj",
+            f"{num + 1} 0 obj\n<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{name} "
+            f"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+            f"/FontDescriptor {num + 2} 0 R /CIDToGIDMap /Identity /W [{self._widths()}] >>\nendobj",
+            f"{num + 2} 0 obj\n<< /Type /FontDescriptor /FontName /{name} /Flags {flags} /FontBBox [{bbox}] "
+            f"/ItalicAngle {italic_angle:g} /Ascent {round(font.ascent * self.scale)} "
+            f"/Descent {round(font.descent * self.scale)} /CapHeight {round(font.ascent * self.scale)} "
+            f"/StemV 80 /FontFile2 {num + 3} 0 R >>\nendobj",
+            f"{num + 3} 0 obj\n<< /Length {len(data)} /Length1 {length} /Filter /FlateDecode >>\n"
+            f"stream\n{data.decode('latin-1')}\nendstream\nendobj",
+            f"{num + 4} 0 obj\n<< /Length {len(cmap)} /Filter /FlateDecode >>\n"
+            f"stream\n{cmap.decode('latin-1')}\nendstream\nendobj",
+        ]
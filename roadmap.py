@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+Implementation roadmap scheduler - reads the roadmap tasks (planned start,
+most likely duration with optional optimistic and pessimistic bounds, and
+the tasks each one follows, with an optional lead or lag) and the phase
+summaries, computes the schedule, slack and critical
+path in one topological pass, estimates the certification date by Monte
+Carlo over the duration ranges, and writes the Gantt chart as Mermaid
+source and as a PNG. The Section 10 tables render in the document
+generators through [ROADMAP:view] lines.
+"""
+
+import argparse
+import bisect
+import collections
+import csv
+import datetime
+import hashlib
+import itertools
+import json
+import math
+import operator
+import os
+import random
+import re
+
+import charts
+from compression import write_if_changed
+from control_matrix import print_table
+
+DIAGRAMS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'diagrams')
+TASKS = os.path.join(DIAGRAMS_DIR, 'implementation_roadmap.csv')
+PHASES = os.path.join(DIAGRAMS_DIR, 'implementation_roadmap_phases.csv')
+GANTT = os.path.join(DIAGRAMS_DIR, 'implementation_roadmap.mmd')
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.build_cache', 'roadmap')
+
+START = datetime.date(2025, 1, 1)  # Day one of the plan; the tables count weeks and months from it
+DEADLINE_MONTHS = 12
+SAMPLES = 10000
+SEED = 2025  # Fixed, so generated documents are reproducible
+
+VIEWS = ('phases', 'tasks', 'critical', 'forecast')
+
+DAY = 1 / 7  # In weeks
+LINK_RE = re.compile(r'(\w+)([+-]\d+(?:\.\d+)?)?$')  # task id, then weeks of lag (+) or lead (-)
+
+GANTT_HEAD = ("%%{init: {'theme': 'base', 'themeVariables': { 'primaryColor': '#1a365d', "
+              "'primaryTextColor': '#fff', 'primaryBorderColor': '#2c5282', 'fontFamily': 'Arial, sans-serif'}}}%%")
+
+# Gantt figure colors: phase bands, month rules, task bars and critical tasks
+BAND = '#edf2f7'
+RULE = '#cbd5e0'
+BAR = '#2b6cb0'
+CRITICAL = '#c53030'
+
+# `earliest` is the planned start in weeks from START; a task never starts before it.
+# `after` holds (task id, lag in weeks) pairs; a negative lag lets a task start before the other ends.
+Task = collections.namedtuple('Task', 'id phase name earliest weeks low high after')
+
+
+def _weeks(value):
+    return f"{value:g}"
+
+
+def day_of(weeks):
+    """Date of the day `weeks` after START."""
+    return START + datetime.timedelta(days=round(weeks * 7))
+
+
+def week_of(weeks):
+    """Week of the plan (from 1) holding the day `weeks` after START."""
+    return math.floor(weeks + 1e-9) + 1
+
+
+def month_of(weeks):
+    """Calendar month of the plan (from 1) holding the day `weeks` after START."""
+    day = day_of(weeks)
+    return (day.year - START.year) * 12 + day.month - START.month + 1
+
+
+def month_end(month):
+    """Weeks from START (the first of a month) to the end of plan month `month`."""
+    index = START.month - 1 + month
+    return (datetime.date(START.year + index // 12, index % 12 + 1, 1) - START).days / 7
+
+
+def last_day(start, weeks):
+    """Weeks from START to the last day of a task; a milestone's is its own day."""
+    return start + weeks - DAY if weeks else start
+
+
+def months_label(first, last):
+    return f"Month {first}" if first >= last else f"Months {first}-{last}"
+
+
+class Roadmap:
+    """The roadmap tasks in topological order, with earliest start and slack in weeks.
+
+    A task starts when the tasks it follows are done, give or take the
+    link's lag, but not before its planned start; a milestone falls on
+    the last day of the tasks it follows. `delays` maps task ids to weeks added to all three of
+    a task's duration estimates, for what-if runs.
+    """
+
+    def __init__(self, path=TASKS, delays=None):
+        self.path = path
+        self.rows = []  # Tasks in file order
+        delays = dict(delays or {})
+        with open(path, newline='', encoding='utf-8') as f:
+            for line, row in enumerate(csv.DictReader(f), 2):
+                task_id = row['id'].strip()
+                try:
+                    weeks = float(row['weeks'])
+                    low = float(row['low'] or weeks)
+                    high = float(row['high'] or weeks)
+                except ValueError:
+                    raise ValueError(f"{path}:{line}: durations must be numbers of weeks") from None
+                if not 0 <= low <= weeks <= high:
+                    raise ValueError(f"{path}:{line}: durations must satisfy 0 <= low <= weeks <= high")
+                earliest = 0
+                if row.get('start', '').strip():
+                    try:
+                        earliest = (datetime.date.fromisoformat(row['start'].strip()) - START).days / 7
+                    except ValueError:
+                        raise ValueError(f"{path}:{line}: start must be a date (YYYY-MM-DD)") from None
+                    if earliest < 0:
+                        raise ValueError(f"{path}:{line}: start is before the plan starts on {START.isoformat()}")
+                after = []
+                for link in row['after'].split():
+                    match = LINK_RE.match(link)
+                    if not match:
+                        raise ValueError(f"{path}:{line}: expected TASK, TASK+WEEKS or TASK-WEEKS in after, got {link!r}")
+                    after.append((match.group(1), float(match.group(2) or 0)))
+                delay = delays.pop(task_id, 0)
+                self.rows.append(Task(task_id, row['phase'].strip(), row['task'].strip(), earliest, weeks + delay,
+                                      low + delay, high + delay, tuple(after)))
+        if delays:
+            raise ValueError(f"unknown task {', '.join(sorted(delays))} in delays")
+        self.tasks = self._order()
+        self._schedule()
+
+    def _order(self):
+        """Tasks sorted so every task follows its predecessors (Kahn's algorithm, O(tasks + links))."""
+        by_id = {}
+        for task in self.rows:
+            if task.id in by_id:
+                raise ValueError(f"{self.path}: task {task.id} is defined twice")
+            by_id[task.id] = task
+        self.successors = {task.id: [] for task in self.rows}
+        waiting = {}
+        for task in self.rows:
+            for before, lag in task.after:
+                if before not in by_id:
+                    raise ValueError(f"{self.path}: task {task.id} follows unknown task {before}")
+                self.successors[before].append((task.id, lag))
+            waiting[task.id] = len(task.after)
+        ready = collections.deque(task.id for task in self.rows if not task.after)
+        order = []
+        while ready:
+            task_id = ready.popleft()
+            order.append(by_id[task_id])
+            for after, _ in self.successors[task_id]:
+                waiting[after] -= 1
+                if not waiting[after]:
+                    ready.append(after)
+        if len(order) < len(self.rows):
+            stuck = [task.id for task in self.rows if waiting[task.id]]
+            raise ValueError(f"{self.path}: dependency cycle among {', '.join(stuck)}")
+        return order
+
+    def _schedule(self):
+        """Earliest start (forward pass) and latest start (backward pass) of every task.
+
+        Both passes work on the point a task's links and planned start
+        hold back: its start, or for a milestone the end of its day, which
+        is also where the milestone finishes.
+        """
+        self.start = {}
+        finish = {}
+        ready = {}
+        for task in self.tasks:
+            lead = 0 if task.weeks else DAY
+            ready[task.id] = max([task.earliest + lead, *(finish[before] + lag for before, lag in task.after)])
+            self.start[task.id] = ready[task.id] - lead
+            finish[task.id] = ready[task.id] + task.weeks
+        self.finish = max(finish.values(), default=0)
+        latest = {}
+        for task in reversed(self.tasks):
+            latest[task.id] = min((latest[after] - lag for after, lag in self.successors[task.id]),
+                                  default=self.finish) - task.weeks
+        self.slack = {task.id: latest[task.id] - ready[task.id] for task in self.tasks}
+
+    def critical(self, task):
+        return self.slack[task.id] < 1e-9
+
+    def end(self, task):
+        return self.start[task.id] + (task.weeks or DAY)
+
+    def simulate(self, samples=SAMPLES, seed=SEED):
+        """Sorted project durations in weeks over `samples` random draws of every task's duration.
+
+        Durations are triangular over (low, weeks, high). The finishes of
+        a task for all samples are computed at once, as a column, so a run
+        is a single pass over the tasks in topological order. Without a
+        task whose range is wider than its estimate every draw is the
+        plan itself, so that is an error rather than a 100% forecast.
+        """
+        if samples < 1:
+            raise ValueError("the forecast needs at least one sample")
+        if not any(task.low < task.high for task in self.tasks):
+            raise ValueError(f"{self.path}: no task has low and high durations to forecast from")
+        triangular = random.Random(seed).triangular
+        finish = {}
+        for task in self.tasks:
+            durations = [triangular(task.low, task.high, task.weeks) for _ in range(samples)]
+            columns = [[end + lag for end in finish[before]] if lag else finish[before] for before, lag in task.after]
+            ready = task.earliest + (0 if task.weeks else DAY)
+            if ready:
+                columns.append(itertools.repeat(ready))
+            if len(columns) > 1:
+                columns = [map(max, *columns)]
+            finish[task.id] = list(map(operator.add, columns[0], durations)) if columns else durations
+        ends = [finish[task.id] for task in self.tasks if not self.successors[task.id]]
+        return sorted(map(max, *ends) if len(ends) > 1 else ends[0])
+
+    def phases(self):
+        """{phase: [tasks in file order]} in order of first appearance."""
+        phases = {}
+        for task in self.rows:
+            phases.setdefault(task.phase, []).append(task)
+        return phases
+
+    def months(self):
+        """Months the plan spans."""
+        return max((month_of(last_day(self.start[task.id], task.weeks)) for task in self.tasks), default=1)
+
+    def gantt(self):
+        """Mermaid Gantt source: one section per phase, critical tasks marked crit."""
+        lines = [GANTT_HEAD, 'gantt',
+                 f"    title CMMC Level 2 Implementation Roadmap ({self.months()} Months)",
+                 '    dateFormat YYYY-MM-DD', '    axisFormat %b']
+        for phase, tasks in self.phases().items():
+            lines += ['', f"    section {phase}"]
+            for task in tasks:
+                tags = ('crit, ' if self.critical(task) else '') + ('milestone, ' if not task.weeks else '')
+                day = day_of(self.start[task.id]).isoformat()
+                length = f"{task.weeks:g}w" if task.weeks == int(task.weeks) else f"{round(task.weeks * 7)}d"
+                lines.append(f"    {task.name:<34} :{tags}{task.id}, {day}, {length if task.weeks else '1d'}")
+        return '\n'.join(lines) + '\n'
+
+    def figure(self, width=720):
+        """The Gantt chart as a charts.Chart: months across, a band per phase, a bar per task."""
+        chart = charts.Chart(width)
+        row = 13
+        left, right, top = 200, width - 12, 44
+        months = self.months()
+        span = month_end(months)
+
+        def x(weeks):
+            return left + (right - left) * weeks / span
+
+        chart.text(width / 2, 16, f"CMMC Level 2 Implementation Roadmap ({months} Months)", 12, bold=True,
+                   anchor='middle')
+        phases = self.phases()
+        bottom = top + row * (len(phases) + len(self.rows))
+        y = top
+        for k, (phase, tasks) in enumerate(phases.items()):
+            chart.rect(0, y, width, row * (len(tasks) + 1), BAND if k % 2 == 0 else charts.WHITE)
+            y += row * (len(tasks) + 1)
+        for month in range(months + 1):
+            chart.rect(x(month_end(month)) - 0.25, top - 4, 0.5, bottom - top + 4, RULE)
+            if month < months:
+                label = day_of(month_end(month)).strftime('%b')
+                chart.text((x(month_end(month)) + x(month_end(month + 1))) / 2, top - 8, label, 8, anchor='middle')
+        y = top
+        for phase, tasks in phases.items():
+            chart.text(6, y + row - 3.5, phase, 8.5, bold=True)
+            y += row
+            for task in tasks:
+                chart.text(16, y + row - 3.5, task.name, 8)
+                start = self.start[task.id]
+                color = CRITICAL if self.critical(task) else BAR
+                if task.weeks:
+                    chart.rect(x(start), y + 2.5, max(x(start + task.weeks) - x(start), 1), row - 5, color)
+                else:
+                    cx, cy, r = x(start), y + row / 2, 5
+                    chart.path([[('M', cx, cy - r), ('L', cx + r, cy), ('L', cx, cy + r), ('L', cx - r, cy),
+                                 ('Z',)]], color)
+                y += row
+        legend = bottom + 16
+        for offset, (color, label) in enumerate(((BAR, 'Task'), (CRITICAL, 'Critical path'))):
+            lx = left + offset * 90
+            chart.rect(lx, legend - 7, 14, 7, color)
+            chart.text(lx + 18, legend, label, 8)
+        chart.height = legend + 8
+        return chart
+
+
+def phases_path(tasks_path):
+    """The phase summary file of a task file: the same name with _phases added."""
+    root, ext = os.path.splitext(tasks_path)
+    return f"{root}_phases{ext}"
+
+
+def read_phases(path):
+    """{phase: (key activities, deliverables)} as written for the Section 10 summary table."""
+    phases = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for line, row in enumerate(csv.DictReader(f), 2):
+            phase = row['phase'].strip()
+            if phase in phases:
+                raise ValueError(f"{path}:{line}: phase {phase!r} is summarized twice")
+            phases[phase] = (row['activities'].strip(), row['deliverables'].strip())
+    return phases
+
+
+def phase_rows(roadmap, path=None):
+    """[phase, timeline in months, key activities, deliverables]; the last two from the phase summaries."""
+    path = path or phases_path(roadmap.path)
+    summaries = read_phases(path)
+    rows = [['Phase', 'Timeline', 'Key Activities', 'Deliverables']]
+    for phase, tasks in roadmap.phases().items():
+        if phase not in summaries:
+            raise ValueError(f"{path}: no summary for {phase!r}")
+        first = month_of(min(roadmap.start[task.id] for task in tasks))
+        last = max(month_of(last_day(roadmap.start[task.id], task.weeks)) for task in tasks)
+        rows.append([phase.split(':')[0], months_label(first, last), *summaries[phase]])
+    return rows
+
+
+def task_rows(roadmap, critical_only=False):
+    """[task, phase, weeks, start week, end week, slack]; critical tasks in bold."""
+    rows = [['Task', 'Phase', 'Weeks', 'Start Week', 'End Week', 'Slack']]
+    tasks = roadmap.rows
+    if critical_only:
+        tasks = sorted(filter(roadmap.critical, tasks), key=roadmap.end)
+    for task in tasks:
+        name = f"**{task.name}**" if roadmap.critical(task) and not critical_only else task.name
+        start = roadmap.start[task.id]
+        rows.append([name, task.phase.split(':')[0], _weeks(task.weeks), str(week_of(start)),
+                     str(week_of(last_day(start, task.weeks))), _weeks(round(roadmap.slack[task.id], 2))])
+    return [row[:5] for row in rows] if critical_only else rows
+
+
+def forecast_rows(roadmap, samples=SAMPLES, seed=SEED, cache_dir=CACHE_DIR):
+    """[certified by month, probability] from the deadline or 5th percentile finish to the 95th percentile.
+
+    The rows are cached in `cache_dir` by a hash of the tasks, sample
+    count and seed, so documents only simulate when the plan changes.
+    """
+    cache_path = None
+    if cache_dir:
+        key = hashlib.sha256(repr((roadmap.rows, samples, seed)).encode('utf-8')).hexdigest()[:32]
+        cache_path = os.path.join(cache_dir, key + '.json')
+        if os.path.exists(cache_path):
+            with open(cache_path, encoding='utf-8') as f:
+                return json.load(f)
+    ends = roadmap.simulate(samples, seed)
+    # A finish of `weeks` is the end of the day before, so it falls in that day's month
+    first = max(1, min(DEADLINE_MONTHS, month_of(ends[len(ends) // 20] - DAY)))
+    last = max(first, month_of(ends[-(len(ends) // 20) - 1] - DAY))
+    rows = [['Certified By', 'Probability']]
+    for month in range(first, last + 1):
+        done = bisect.bisect_right(ends, month_end(month)) / len(ends)
+        rows.append([f"End of month {month}", f"{done:.0%}"])
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        write_if_changed(cache_path, json.dumps(rows).encode('utf-8'))
+    return rows
+
+
+def table(view, path=None):
+    """Rows (header first) of one view of the roadmap in `path` (default: the shipped task file)."""
+    if view not in VIEWS:
+        raise ValueError(f"unknown roadmap view {view!r} (expected one of {', '.join(VIEWS)})")
+    roadmap = Roadmap(path or TASKS)
+    if view == 'phases':
+        return phase_rows(roadmap)
+    if view == 'forecast':
+        return forecast_rows(roadmap)
+    return task_rows(roadmap, critical_only=view == 'critical')
+
+
+def expand(elements):
+    """Replace the parser's ('roadmap', (view, path)) elements with ('table', rows)."""
+    for elem_type, content in elements:
+        if elem_type == 'roadmap':
+            yield ('table', table(*content))
+        else:
+            yield (elem_type, content)
+
+
+def positive_int(text):
+    try:
+        value = int(text)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive whole number, got {text!r}")
+    return value
+
+
+def parse_delay(text):
+    task_id, _, weeks = text.partition('=')
+    try:
+        return task_id, float(weeks)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected TASK=WEEKS, got {text!r}") from None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', default=TASKS, help='task file (default: diagrams/implementation_roadmap.csv)')
+    parser.add_argument('--delay', type=parse_delay, action='append', default=[], metavar='TASK=WEEKS',
+                        help='add WEEKS to every estimate of TASK (what-if; repeatable)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    schedule_cmd = commands.add_parser('schedule', help='print the schedule and critical path')
+    schedule_cmd.add_argument('--critical', action='store_true', help='show only critical tasks')
+    simulate_cmd = commands.add_parser('simulate', help='estimate the certification date by Monte Carlo')
+    simulate_cmd.add_argument('-n', '--samples', type=positive_int, default=SAMPLES,
+                              help=f'number of samples (default {SAMPLES})')
+    simulate_cmd.add_argument('--seed', type=int, default=SEED, help=f'random seed (default {SEED})')
+    simulate_cmd.add_argument('--deadline', type=int, default=DEADLINE_MONTHS,
+                              help=f'target month (default {DEADLINE_MONTHS})')
+    gantt_cmd = commands.add_parser('gantt', help='write the Gantt chart as Mermaid source and PNG')
+    gantt_cmd.add_argument('-o', '--output', default=GANTT,
+                           help='Mermaid path, or - for stdout (default: diagrams/implementation_roadmap.mmd)')
+    gantt_cmd.add_argument('--no-png', action='store_true',
+                           help='skip the PNG written next to the Mermaid source')
+    gantt_cmd.add_argument('--scale', type=float, default=2.5, help='PNG pixels per point (default 2.5)')
+    args = parser.parse_args()
+
+    try:
+        roadmap = Roadmap(args.tasks, dict(args.delay))
+        if args.command == 'schedule':
+            print_table(task_rows(roadmap, args.critical))
+            print(f"\nPlanned finish: {day_of(roadmap.finish - DAY):%b %d, %Y} (month {roadmap.months()})")
+        elif args.command == 'simulate':
+            ends = roadmap.simulate(args.samples, args.seed)
+            on_time = bisect.bisect_right(ends, month_end(args.deadline)) / len(ends)
+            print(f"Planned finish: {day_of(roadmap.finish - DAY):%b %d, %Y}")
+            for pct in (50, 80, 95):
+                weeks = ends[max(0, math.ceil(len(ends) * pct / 100) - 1)]
+                print(f"P{pct}: {day_of(weeks - DAY):%b %d, %Y} (week {weeks:.1f})")
+            print(f"Certified by the end of month {args.deadline}: {on_time:.1%} of {len(ends):,} samples")
+        else:
+            source = roadmap.gantt()
+            if args.output == '-':
+                print(source, end='')
+            else:
+                outputs = [(args.output, source.encode('utf-8'))]
+                if not args.no_png:
+                    outputs.append((os.path.splitext(args.output)[0] + '.png',
+                                    charts.to_png(roadmap.figure(), args.scale)))
+                for path, data in outputs:
+                    written = write_if_changed(path, data)
+                    print(f"{'Created' if written else 'Unchanged (not rewritten)'}: {path}")
+    except (OSError, ValueError, RuntimeError) as e:
+        raise SystemExit(str(e))
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Full-text section index - splits markdown documents into heading-scoped
+sections and tables with the shared parser, keeps them in a local SQLite
+FTS5 index updated incrementally by content hash, and answers queries with
+the section path, a snippet, the PDF page and the DOCX bookmark.
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+
+import control_matrix
+import roadmap
+from generate_cmmc_pdf import layout_markdown
+from markdown_parser import DIRECTIVE_RE, decode, parse_markdown, strip_markdown
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    document INTEGER NOT NULL REFERENCES documents(id),
+    position INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    pdf_page INTEGER,
+    anchor TEXT,
+    hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sections_document ON sections(document, hash);
+CREATE VIRTUAL TABLE IF NOT EXISTS section_text USING fts5(path, body, tokenize='porter unicode61');
+"""
+
+HEADING_LEVELS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4}
+
+
+def iter_sections(md_path):
+    """Yield (kind, path, body, heading_index) for each section and table of a document.
+
+    A section is the text under a heading up to the next heading; each
+    table is its own entry under the enclosing section's path.
+    heading_index counts h1-h4 headings from 1, matching the DOCX _Toc
+    bookmarks (0 for text before the first heading).
+    """
+    trail = []
+    heading_index = 0
+    body = []
+
+    def section():
+        return ('section', ' > '.join(text for _, text in trail), '\n'.join(body), heading_index)
+
+    for elem_type, content in roadmap.expand(control_matrix.expand(parse_markdown(md_path))):
+        if elem_type in HEADING_LEVELS:
+            if body:
+                yield section()
+            body = []
+            level = HEADING_LEVELS[elem_type]
+            trail = [(lvl, text) for lvl, text in trail if lvl < level] + [(level, strip_markdown(content))]
+            heading_index += 1
+            body.append(trail[-1][1])
+        elif elem_type == 'table':
+            rows = '\n'.join(' | '.join(strip_markdown(cell) for cell in row) for row in content)
+            yield ('table', ' > '.join(text for _, text in trail), rows, heading_index)
+        elif elem_type == 'image':
+            body.append(content[1])
+        elif elem_type == 'code':
+            body.append(content)
+        elif elem_type in ('para', 'caption', 'bullet', 'numbered'):
+            body.append(strip_markdown(content))
+    if body:
+        yield section()
+
+
+def heading_pages(md_path):
+    """1-based PDF page of every heading, in document order, from a layout pass."""
+    pdf, _ = layout_markdown(md_path, report=lambda msg: None)
+    pdf.finish()
+    return [page + 1 for _, _, page, _ in pdf.headings]
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def document_hash(md_path):
+    """Hash of a document and of the data files its [CONTROLS:...] and [ROADMAP:...] lines expand from."""
+    digest = hashlib.sha256()
+    inputs = set()
+    with open(md_path, 'rb') as f:
+        for line in f:
+            digest.update(line)
+            directive = DIRECTIVE_RE.match(line.strip())
+            if not directive:
+                continue
+            kind, view, data = directive.groups()
+            path = os.path.join(os.path.dirname(md_path), decode(data)) if data else None
+            if kind == b'CONTROLS':
+                inputs.update((control_matrix.CATALOG, control_matrix.DOMAINS))
+                if path:
+                    inputs.add(path)
+            else:
+                inputs.add(path or roadmap.TASKS)
+                if view == b'phases':
+                    inputs.add(roadmap.phases_path(path) if path else roadmap.PHASES)
+    for path in sorted(inputs):
+        digest.update(f"\0{path}\0{file_hash(path)}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class SectionIndex:
+    """SQLite FTS5 index of document sections."""
+
+    def __init__(self, db_path):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db = sqlite3.connect(db_path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def update(self, md_path):
+        """Index one document; returns (added, removed) section counts.
+
+        Unchanged documents are skipped by a hash of the file and the data
+        files its tables expand from. For changed documents only sections
+        whose text changed are replaced, so edits touch few rows; the PDF
+        page and bookmark of kept sections are updated in place.
+        """
+        path = os.path.abspath(md_path)
+        digest = document_hash(path)
+        row = self.db.execute("SELECT id, hash FROM documents WHERE path = ?", (path,)).fetchone()
+        if row and row[1] == digest:
+            return 0, 0
+
+        pages = heading_pages(path)
+        with self.db:
+            if row:
+                doc_id = row[0]
+                self.db.execute("UPDATE documents SET hash = ? WHERE id = ?", (digest, doc_id))
+            else:
+                doc_id = self.db.execute("INSERT INTO documents (path, hash) VALUES (?, ?)",
+                                         (path, digest)).lastrowid
+            existing = {}
+            for section_id, section_hash in self.db.execute(
+                    "SELECT id, hash FROM sections WHERE document = ?", (doc_id,)):
+                existing.setdefault(section_hash, []).append(section_id)
+
+            added = 0
+            for position, (kind, section_path, body, heading) in enumerate(iter_sections(path)):
+                page = pages[heading - 1] if heading else 1
+                anchor = f"_Toc{heading}" if heading else None
+                key = f"{kind}\0{section_path}\0{body}".encode('utf-8')
+                section_hash = hashlib.sha256(key).hexdigest()
+                kept = existing.get(section_hash)
+                if kept:
+                    self.db.execute("UPDATE sections SET position = ?, pdf_page = ?, anchor = ? WHERE id = ?",
+                                    (position, page, anchor, kept.pop()))
+                    continue
+                section_id = self.db.execute(
+                    "INSERT INTO sections (document, position, kind, path, pdf_page, anchor, hash) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (doc_id, position, kind, section_path, page, anchor, section_hash)).lastrowid
+                self.db.execute("INSERT INTO section_text (rowid, path, body) VALUES (?, ?, ?)",
+                                (section_id, section_path, body))
+                added += 1
+
+            stale = [section_id for ids in existing.values() for section_id in ids]
+            self._delete(stale)
+        return added, len(stale)
+
+    def prune(self):
+        """Drop documents whose files no longer exist; returns their paths."""
+        gone = [(doc_id, path) for doc_id, path in self.db.execute("SELECT id, path FROM documents")
+                if not os.path.exists(path)]
+        with self.db:
+            for doc_id, _ in gone:
+                ids = [r[0] for r in self.db.execute("SELECT id FROM sections WHERE document = ?", (doc_id,))]
+                self._delete(ids)
+                self.db.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+        return [path for _, path in gone]
+
+    def _delete(self, section_ids):
+        for start in range(0, len(section_ids), 500):
+            chunk = section_ids[start:start + 500]
+            marks = ','.join('?' * len(chunk))
+            self.db.execute(f"DELETE FROM section_text WHERE rowid IN ({marks})", chunk)
+            self.db.execute(f"DELETE FROM sections WHERE id IN ({marks})", chunk)
+
+    def search(self, query, limit=10, raw=False):
+        """Return [(document, kind, path, pdf_page, anchor, snippet)] best match first.
+
+        Each word of `query` is matched as a phrase of its tokens, so
+        "FIPS 140-2" and "AC.L2-3.1.1" work as typed; raw=True passes the
+        query through as FTS5 syntax.
+        """
+        if not raw:
+            query = ' '.join('"' + word.replace('"', '""') + '"' for word in query.split())
+        return self.db.execute(
+            "SELECT d.path, s.kind, s.path, s.pdf_page, s.anchor, "
+            "snippet(section_text, 1, '[', ']', '...', 16) "
+            "FROM section_text JOIN sections s ON s.id = section_text.rowid "
+            "JOIN documents d ON d.id = s.document "
+            "WHERE section_text MATCH ? ORDER BY bm25(section_text, 5.0, 1.0) LIMIT ?",
+            (query, limit)).fetchall()
+
+
+def find_markdown(paths):
+    """Expand files and directories into the markdown files they contain."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+                for name in sorted(files):
+                    if name.endswith('.md'):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default=os.path.join(script_dir, '.build_cache', 'search.sqlite'),
+                        help='index database (default: .build_cache/search.sqlite)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    index_cmd = commands.add_parser('index', help='add or update documents')
+    index_cmd.add_argument('paths', nargs='*',
+                           default=[os.path.join(script_dir, "Furientis_CMMC_Compliance_Strategy.md")],
+                           help='markdown files or directories (default: the strategy document)')
+    search_cmd = commands.add_parser('search', help='query the index')
+    search_cmd.add_argument('query')
+    search_cmd.add_argument('-n', '--limit', type=int, default=10, help='maximum results (default 10)')
+    search_cmd.add_argument('--raw', action='store_true', help='pass the query through as FTS5 syntax')
+    args = parser.parse_args()
+
+    index = SectionIndex(args.db)
+    if args.command == 'index':
+        for path in index.prune():
+            print(f"Removed: {path}")
+        for md_path in find_markdown(args.paths):
+            added, removed = index.update(md_path)
+            state = f"+{added} -{removed} sections" if added or removed else "unchanged"
+            print(f"{md_path}: {state}")
+    else:
+        try:
+            results = index.search(args.query, args.limit, args.raw)
+        except sqlite3.OperationalError as e:
+            sys.exit(f"Bad query: {e}")
+        for doc, kind, path, page, anchor, snippet in results:
+            where = f"p.{page}" + (f"  #{anchor}" if anchor else "")
+            label = f"{path} [table]" if kind == 'table' else path
+            print(f"{os.path.basename(doc)}  {where}\n  {label}\n  {' '.join(snippet.split())}\n")
+        if not results:
+            print("No matches.")
+    index.close()
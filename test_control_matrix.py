@@ -0,0 +1,91 @@
+"""Coverage and scoring tests for control_matrix on a two-system mapping fixture."""
+
+import os
+
+import pytest
+
+import control_matrix
+from control_matrix import MAX_SCORE, Snapshot, domain_rows, load_catalog, status_label
+
+MAPPING = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_data', 'control_mapping.csv')
+
+
+def ids(rows):
+    return [req['requirement'] for req in rows]
+
+
+def requirements(catalog, mask):
+    return ids(catalog.members(mask))
+
+
+def test_catalog_counts_match_the_section_2_2_table():
+    catalog = load_catalog()
+    rows = domain_rows(catalog)
+    assert len(catalog.requirements) == 110
+    assert [(row[1], row[2]) for row in rows[1:4]] == [('AC', '22'), ('AT', '3'), ('AU', '9')]
+    assert sum(int(row[2]) for row in rows[1:]) == 110
+
+
+def test_system_coverage():
+    snapshot = Snapshot(MAPPING)
+    catalog = snapshot.catalog
+    coverage = snapshot.coverage('enclave')
+    assert requirements(catalog, coverage.met) == ['3.1.1', '3.1.2', '3.12.4']
+    assert requirements(catalog, coverage.partial) == ['3.1.3', '3.5.3']
+    assert requirements(catalog, coverage.planned) == ['3.1.4']
+    assert requirements(catalog, coverage.na) == ['3.13.11']
+    assert coverage.gaps.bit_count() == 106
+    assert status_label(coverage, catalog.index['3.3.1']) == 'Not addressed'
+
+
+def test_organization_needs_every_system():
+    snapshot = Snapshot(MAPPING)
+    catalog = snapshot.catalog
+    coverage = snapshot.coverage()
+    # 3.1.2 is inherited in the enclave but only planned on the commercial side
+    assert requirements(catalog, coverage.met) == ['3.1.1', '3.12.4', '3.13.11']
+    assert requirements(catalog, coverage.planned) == ['3.1.2', '3.1.4']
+    assert coverage.na == 0
+
+
+def test_score_deducts_partial_credit():
+    snapshot = Snapshot(MAPPING)
+    catalog = snapshot.catalog
+    unmapped = MAX_SCORE - sum(points * mask.bit_count() for points, mask in catalog.points.items())
+    assert unmapped == -203
+    # Met or N/A: 3.1.1 and 3.1.2 (5 each), 3.13.11 (5), 3.12.4 (0); 3.5.3 partial deducts 3, not 5
+    assert catalog.score(snapshot.coverage('enclave')) == unmapped + 15 + 2
+    assert catalog.score(snapshot.coverage()) == unmapped + 10 + 2
+
+
+def test_views_render_from_the_mapping():
+    rows = control_matrix.table('matrix', MAPPING)
+    assert rows[0] == ['System', 'Practice', 'Status', 'Implementation', 'Evidence']
+    assert len(rows) == 1 + 2 * 110
+    assert rows[1][:3] == ['enclave', 'AC.L2-3.1.1 Authorized Access Control', 'Met']
+    poam = control_matrix.table('poam', MAPPING)
+    assert poam[1] == ['AC.L2-3.1.3 Control CUI Flow', '1', 'Purview DLP on SharePoint only']
+    assert control_matrix.table('summary', MAPPING)[-1][:2] == ['**Organization**', '-191']
+    with pytest.raises(ValueError, match='needs a mapping file'):
+        control_matrix.table('gaps')
+
+
+def test_diff_reports_met_requirements_gained_and_lost(tmp_path):
+    newer = tmp_path / 'newer.csv'
+    with open(MAPPING, encoding='utf-8') as f:
+        newer.write_text(f.read().replace('enclave,3.1.4,planned', 'enclave,3.1.4,implemented')
+                         .replace('enclave,3.1.1,implemented', 'enclave,3.1.1,partial'), encoding='utf-8')
+    changes = {system: (ids(gained), ids(lost))
+               for system, gained, lost in control_matrix.diff(Snapshot(MAPPING), Snapshot(str(newer)))}
+    assert changes == {'commercial': ([], []), 'enclave': (['3.1.4'], ['3.1.1'])}
+
+
+@pytest.mark.parametrize('row, problem', [
+    ('enclave,3.99.1,implemented,,', r"control_mapping.csv:2: unknown requirement '3.99.1'"),
+    ('enclave,3.1.1,done,,', r'control_mapping.csv:2: status must be one of'),
+])
+def test_bad_rows_are_reported_with_their_line(tmp_path, row, problem):
+    path = tmp_path / 'control_mapping.csv'
+    path.write_text('system,requirement,status,implementation,evidence\n' + row + '\n', encoding='utf-8')
+    with pytest.raises(ValueError, match=problem):
+        Snapshot(str(path))
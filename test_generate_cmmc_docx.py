@@ -0,0 +1,52 @@
+"""Build tests for generate_cmmc_docx: reproducible archives and updates that reuse unchanged members."""
+
+import os
+import re
+import shutil
+import zipfile
+
+import pytest
+
+from generate_cmmc_docx import generate_docx
+from markdown_parser import document_title
+
+DOCUMENT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Furientis_CMMC_Compliance_Strategy.md')
+
+
+@pytest.fixture(scope='module')
+def cache_dir(tmp_path_factory):
+    """Image cache shared by the module's builds, so images are resampled once."""
+    return str(tmp_path_factory.mktemp('cache'))
+
+
+@pytest.mark.parametrize('workers', [None, 4])
+def test_builds_are_byte_identical_whatever_the_thread_count(tmp_path, cache_dir, workers):
+    outputs = []
+    for name, jobs in (('first.docx', 1), ('second.docx', 1), ('threaded.docx', workers)):
+        generate_docx(DOCUMENT, str(tmp_path / name), cache_dir=cache_dir, workers=jobs,
+                      header=document_title(DOCUMENT), page_numbers=True)
+        outputs.append((tmp_path / name).read_bytes())
+    assert outputs[0] == outputs[1] == outputs[2]
+
+
+def members(path):
+    with zipfile.ZipFile(path) as archive:
+        return {info.filename: archive.read(info) for info in archive.infolist()}
+
+
+def test_update_reuses_unchanged_members_and_unzips_like_a_clean_build(tmp_path, cache_dir, capsys):
+    md_path = tmp_path / 'strategy.md'
+    shutil.copy(DOCUMENT, md_path)
+    (tmp_path / 'diagrams').symlink_to(os.path.join(os.path.dirname(DOCUMENT), 'diagrams'))
+    options = dict(cache_dir=cache_dir, header='Furientis CMMC Compliance Strategy', page_numbers=True)
+    generate_docx(str(md_path), str(tmp_path / 'updated.docx'), update=True, **options)
+    text = md_path.read_text(encoding='utf-8')
+    md_path.write_text(text.replace('critical inflection point', 'decisive inflection point', 1), encoding='utf-8')
+    capsys.readouterr()
+    generate_docx(str(md_path), str(tmp_path / 'updated.docx'), update=True, **options)
+    assert re.search(r'\(12 of 13 members reused\)', capsys.readouterr().out)
+    generate_docx(str(md_path), str(tmp_path / 'clean.docx'), **options)
+    updated, clean = members(tmp_path / 'updated.docx'), members(tmp_path / 'clean.docx')
+    assert list(updated) == list(clean) and updated == clean
+    assert b'decisive inflection point' in updated['word/document.xml']
+    assert (tmp_path / 'updated.docx').read_bytes() == (tmp_path / 'clean.docx').read_bytes()
@@ -0,0 +1,250 @@
+"""Structure tests for generate_cmmc_pdf: plain, linearized and incrementally updated output."""
+
+import os
+import re
+
+import pytest
+
+from generate_cmmc_pdf import PageTree, check_linearized, layout_markdown, parse_md_and_generate
+from markdown_parser import document_title
+
+DOCUMENT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Furientis_CMMC_Compliance_Strategy.md')
+
+SAMPLE = """# Sample Compliance Strategy
+
+## 1. Scope
+
+{body}
+
+### 1.1 Boundary
+
+| Asset | Environment |
+|-------|-------------|
+| File server | Enclave |
+| Laptop | Commercial |
+
+## 2. Controls
+
+- Access control
+- Audit and accountability
+
+```
+aws ec2 describe-instances
+```
+
+{body}
+"""
+
+PARAGRAPH = "The enclave boundary is documented, reviewed and enforced through change management. " * 12
+
+
+def save(md_path, pdf_path, **save_options):
+    pdf, _ = layout_markdown(str(md_path), report=lambda msg: None, embed_fonts=False)
+    pdf.save(str(pdf_path), **save_options)
+    return pdf
+
+
+def build(tmp_path, linearize):
+    md_path = tmp_path / 'sample.md'
+    md_path.write_text(SAMPLE.format(body='\n\n'.join([PARAGRAPH] * 8)), encoding='utf-8')
+    pdf_path = tmp_path / ('linearized.pdf' if linearize else 'plain.pdf')
+    save(md_path, pdf_path, linearize=linearize)
+    return pdf_path, pdf_path.read_bytes()
+
+
+def xref_offsets(data):
+    """{object number: offset} from every classic xref section in the file."""
+    offsets = {}
+    for table in re.finditer(rb'xref\n((?:\d+ \d+\n(?:\d{10} \d{5} [nf]\s*\n)*)+)', data):
+        for first, count, entries in re.findall(rb'(\d+) (\d+)\n((?:\d{10} \d{5} [nf]\s*\n)*)', table.group(1)):
+            for k, entry in enumerate(re.findall(rb'(\d{10}) \d{5} ([nf])', entries)):
+                if entry[1] == b'n':
+                    offsets.setdefault(int(first) + k, int(entry[0]))
+    return offsets
+
+
+def page_count(data):
+    return len(re.findall(rb'/Type /Page\b', data))
+
+
+@pytest.mark.parametrize('linearize', [False, True])
+def test_xref_offsets_point_at_their_objects(tmp_path, linearize):
+    _, data = build(tmp_path, linearize)
+    assert data.startswith(b'%PDF-') and data.rstrip().endswith(b'%%EOF')
+    offsets = xref_offsets(data)
+    assert offsets
+    for num, offset in offsets.items():
+        assert re.match(rb'%d 0 obj' % num, data[offset:offset + 20]), f"object {num}"
+    startxref = int(re.search(rb'startxref\s+(\d+)\s*%%EOF\s*$', data).group(1))
+    assert data[startxref:startxref + 5] == b'xref\n'
+
+
+def test_plain_output_is_not_linearized(tmp_path):
+    path, data = build(tmp_path, linearize=False)
+    assert page_count(data) > 2
+    assert check_linearized(str(path)) == ['no linearization dictionary in the first 1024 bytes']
+
+
+def test_linearized_output_passes_the_structure_check(tmp_path):
+    path, data = build(tmp_path, linearize=True)
+    assert check_linearized(str(path)) == []
+    assert page_count(data) == page_count(build(tmp_path, linearize=False)[1])
+    pages = int(re.search(rb'/Linearized 1 .*?/N (\d+)', data[:1024], re.S).group(1))
+    assert pages == page_count(data)
+
+
+@pytest.mark.parametrize('damage, problem', [
+    (lambda data: re.sub(rb' /T \d+', b'', data, count=1), 'lacks /T'),
+    (lambda data: re.sub(rb' /H \[[^\]]*\]', b'', data, count=1), 'lacks /H'),
+    (lambda data: data.replace(b'xref\n', b'xrfe\n'), 'no first-page xref'),
+    (lambda data: data[:data.rindex(b'startxref')], 'no startxref'),
+])
+def test_damaged_linearized_output_is_reported_not_raised(tmp_path, damage, problem):
+    path, data = build(tmp_path, linearize=True)
+    path.write_bytes(damage(data))
+    problems = check_linearized(str(path))
+    assert any(problem in text for text in problems), problems
+
+
+def test_pypdf_reads_both_forms_alike(tmp_path):
+    pypdf = pytest.importorskip('pypdf')
+    plain = pypdf.PdfReader(str(build(tmp_path, linearize=False)[0]))
+    linearized = pypdf.PdfReader(str(build(tmp_path, linearize=True)[0]))
+    assert len(plain.pages) == len(linearized.pages)
+    assert plain.pages[0].extract_text() == linearized.pages[0].extract_text()
+
+
+def contents(pypdf, path):
+    """Page text and (title, page, top) of every outline entry, depth first."""
+    reader = pypdf.PdfReader(str(path))
+
+    def walk(items):
+        for item in items:
+            if isinstance(item, list):
+                yield from walk(item)
+            else:
+                yield item.title, reader.get_destination_page_number(item), item.top
+
+    return [page.extract_text() for page in reader.pages], list(walk(reader.outline))
+
+
+# Each edit rewrites a paragraph; the second also adds a section, so pages and outline entries are added
+EDITS = [
+    lambda text: text.replace('reviewed and enforced', 'reviewed quarterly and enforced', 1),
+    lambda text: text.replace('## 2. Controls', '## 2. Monitoring\n\n' + '\n\n'.join([PARAGRAPH] * 6)
+                              + '\n\n## 3. Controls'),
+]
+
+
+def test_incremental_updates_read_like_a_clean_build(tmp_path):
+    pypdf = pytest.importorskip('pypdf')
+    md_path, pdf_path, manifest = tmp_path / 'sample.md', tmp_path / 'updated.pdf', tmp_path / 'manifest.json'
+    clean_path = tmp_path / 'clean.pdf'
+    text = SAMPLE.format(body='\n\n'.join([PARAGRAPH] * 8))
+    md_path.write_text(text, encoding='utf-8')
+    save(md_path, pdf_path, manifest=str(manifest))
+    pages = [len(pypdf.PdfReader(str(pdf_path)).pages)]
+    for count, edit in enumerate(EDITS, 1):
+        before = pdf_path.read_bytes()
+        text = edit(text)
+        md_path.write_text(text, encoding='utf-8')
+        pdf = save(md_path, pdf_path, manifest=str(manifest))
+        data = pdf_path.read_bytes()
+        assert pdf.appended and data.startswith(before)
+        assert len(re.findall(rb'trailer\n<<[^\n]* /Prev \d+', data)) == count
+        save(md_path, clean_path)
+        assert contents(pypdf, pdf_path) == contents(pypdf, clean_path)
+        pages.append(len(pypdf.PdfReader(str(pdf_path)).pages))
+    assert pages[0] == pages[1] < pages[2]
+
+
+def test_updates_are_compacted_after_max_updates(tmp_path):
+    md_path, pdf_path, manifest = tmp_path / 'sample.md', tmp_path / 'updated.pdf', tmp_path / 'manifest.json'
+    text = SAMPLE.format(body='\n\n'.join([PARAGRAPH] * 8))
+    md_path.write_text(text, encoding='utf-8')
+    save(md_path, pdf_path, manifest=str(manifest), max_updates=1)
+    appended = []
+    for edit in EDITS:
+        text = edit(text)
+        md_path.write_text(text, encoding='utf-8')
+        appended.append(save(md_path, pdf_path, manifest=str(manifest), max_updates=1).appended)
+    assert appended[0] and appended[1] is None
+    save(md_path, tmp_path / 'clean.pdf')
+    assert pdf_path.read_bytes() == (tmp_path / 'clean.pdf').read_bytes()
+    # The compacted file is the base of the next round of updates
+    md_path.write_text(text.replace('- Access control', '- Access control policy'), encoding='utf-8')
+    assert save(md_path, pdf_path, manifest=str(manifest), max_updates=1).appended
+
+
+@pytest.mark.parametrize('workers', [None, 4])
+def test_builds_are_byte_identical_whatever_the_thread_count(tmp_path, workers):
+    outputs = []
+    for name, jobs in (('first.pdf', 1), ('second.pdf', 1), ('threaded.pdf', workers)):
+        parse_md_and_generate(DOCUMENT, str(tmp_path / name), workers=jobs, header=document_title(DOCUMENT),
+                              page_numbers=True, font_cache=str(tmp_path / 'fonts'))
+        outputs.append((tmp_path / name).read_bytes())
+    assert outputs[0] == outputs[1] == outputs[2]
+
+
+@pytest.mark.parametrize('count, fanout', [(1, 32), (16, 32), (17, 32), (33, 32), (1025, 32), (17, 4), (100, 4)])
+def test_page_tree_is_balanced_and_counts_its_pages(count, fanout):
+    tree = PageTree(count, fanout)
+    nodes = {node: (parent, pages, kids, total) for node, parent, pages, kids, total in tree.nodes()}
+    assert len(nodes) == tree.size and nodes[0][0] is None
+    leaves = []
+
+    def walk(node, depth):
+        parent, pages, kids, total = nodes[node]
+        assert 0 < len(pages) + len(kids) <= fanout
+        for kid in kids:
+            assert nodes[kid][0] == node
+        if pages:
+            leaves.append((depth, list(pages)))
+            assert all(tree.parent(page) == node for page in pages)
+        assert total == len(pages) + sum(walk(kid, depth + 1) for kid in kids)
+        return total
+
+    assert walk(0, 0) == count
+    assert len({depth for depth, _ in leaves}) == 1
+    assert [page for _, pages in leaves for page in pages] == list(range(count))
+
+
+def test_page_tree_in_a_long_document(tmp_path):
+    pypdf = pytest.importorskip('pypdf')
+    md_path = tmp_path / 'long.md'
+    md_path.write_text(SAMPLE.format(body='\n\n'.join([PARAGRAPH] * 60)), encoding='utf-8')
+    save(md_path, tmp_path / 'long.pdf')
+    reader = pypdf.PdfReader(str(tmp_path / 'long.pdf'))
+    leaves = []
+
+    def walk(node, parent):
+        assert node.get('/Parent') == parent
+        if node['/Type'] == '/Page':
+            leaves.append(node.indirect_reference.idnum)
+            return 1
+        kids = node['/Kids']
+        assert 0 < len(kids) <= 32
+        total = sum(walk(kid.get_object(), node.indirect_reference) for kid in kids)
+        assert node['/Count'] == total
+        return total
+
+    root = reader.trailer['/Root']['/Pages']
+    assert walk(root.get_object(), None) > 32
+    assert len(root['/Kids']) > 1
+    assert leaves == [page.indirect_reference.idnum for page in reader.pages]
+
+
+def test_long_headings_wrap_inside_the_margins(tmp_path):
+    pypdf = pytest.importorskip('pypdf')
+    title = "A Comprehensive Guide to CMMC Certification, Dual-Echelon Architecture, and Operational Excellence"
+    md_path = tmp_path / 'heading.md'
+    md_path.write_text(f"# {title}\n\n## {title}\n\n{PARAGRAPH}\n", encoding='utf-8')
+    pdf = save(md_path, tmp_path / 'heading.pdf')
+    lines = pypdf.PdfReader(str(tmp_path / 'heading.pdf')).pages[0].extract_text().splitlines()
+    for size in (18, 14):
+        wrapped = []
+        while ' '.join(wrapped) != title:
+            wrapped.append(lines.pop(0))
+            assert title.startswith(' '.join(wrapped))
+        assert len(wrapped) > 1
+        assert all(pdf.text_width(line, '/F2', size) <= pdf.page_width - 2 * pdf.margin for line in wrapped)
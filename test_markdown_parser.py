@@ -0,0 +1,77 @@
+"""Inline tokenizer tests for markdown_parser: emphasis pairing, code spans, links and strip_markdown."""
+
+import os
+import re
+
+import pytest
+
+from markdown_parser import BOLD, CODE, ITALIC, LINK, strip_markdown, tokenize_inline
+
+DOCUMENT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Furientis_CMMC_Compliance_Strategy.md')
+
+
+def regex_strip_markdown(text):
+    """The regex strip_markdown the generators used before the tokenizer."""
+    text = re.sub(r'\*\*(.+?)\*\*', r'\1', text)  # Bold
+    text = re.sub(r'\*(.+?)\*', r'\1', text)  # Italic
+    text = re.sub(r'__(.+?)__', r'\1', text)  # Bold alt
+    text = re.sub(r'_(.+?)_', r'\1', text)  # Italic alt
+    text = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', text)  # Links
+    text = re.sub(r'`([^`]+)`', r'\1', text)  # Inline code
+    return text
+
+
+@pytest.mark.parametrize('text, runs', [
+    ('***both*** text', [('both', BOLD | ITALIC, None), (' text', 0, None)]),
+    ('**bold *italic* bold**', [('bold ', BOLD, None), ('italic', BOLD | ITALIC, None), (' bold', BOLD, None)]),
+    ('*italic **bold** italic*', [('italic ', ITALIC, None), ('bold', BOLD | ITALIC, None),
+                                  (' italic', ITALIC, None)]),
+    ('__bold__ _it_', [('bold', BOLD, None), (' ', 0, None), ('it', ITALIC, None)]),
+])
+def test_nested_emphasis(text, runs):
+    assert tokenize_inline(text) == runs
+
+
+@pytest.mark.parametrize('text, runs', [
+    ('**not closed', [('**not closed', 0, None)]),
+    ('a * b and 2 * 3', [('a * b and 2 * 3', 0, None)]),
+    ('*a **b*', [('*a *', 0, None), ('b', ITALIC, None)]),
+    ('*a*b*', [('a', ITALIC, None), ('b*', 0, None)]),
+    ('file_name_here', [('file_name_here', 0, None)]),
+    ('[not a link] x', [('[not a link] x', 0, None)]),
+])
+def test_unmatched_delimiters_stay_literal(text, runs):
+    assert tokenize_inline(text) == runs
+
+
+@pytest.mark.parametrize('text, runs', [
+    ('run `ls *.py` now', [('run ', 0, None), ('ls *.py', CODE, None), (' now', 0, None)]),
+    ('**bold `a*b` bold**', [('bold ', BOLD, None), ('a*b', BOLD | CODE, None), (' bold', BOLD, None)]),
+    ('`*a*` *b*', [('*a*', CODE, None), (' ', 0, None), ('b', ITALIC, None)]),
+    ('`unclosed *code*', [('`unclosed ', 0, None), ('code', ITALIC, None)]),
+])
+def test_code_spans_hide_emphasis(text, runs):
+    assert tokenize_inline(text) == runs
+
+
+def test_link_with_bold_text():
+    url = 'https://csrc.nist.gov/pubs/sp/800/171/r2/upd1/final'
+    assert tokenize_inline(f'see [**NIST** SP 800-171]({url}) now') == [
+        ('see ', 0, None), ('NIST', BOLD | LINK, url), (' SP 800-171', LINK, url), (' now', 0, None)]
+    assert tokenize_inline(f'**[guide]({url})**') == [('guide', BOLD | LINK, url)]
+
+
+@pytest.mark.parametrize('text', [
+    '**Bold** lead-in: *italic* detail, __alt bold__ and _alt italic_',
+    'See [NIST SP 800-171](https://csrc.nist.gov) and `aws ec2 describe-instances`',
+    'Plain text with no markup',
+])
+def test_strip_markdown_matches_the_regex_version(text):
+    assert strip_markdown(text) == regex_strip_markdown(text)
+
+
+def test_strip_markdown_matches_the_regex_version_on_the_document():
+    with open(DOCUMENT, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip('\n')
+            assert strip_markdown(line) == regex_strip_markdown(line), f"line {number}"
@@ -0,0 +1,71 @@
+"""Schedule tests for roadmap: planned starts, leads and milestones in both passes."""
+
+import pytest
+
+from roadmap import DAY, Roadmap, day_of, phase_rows
+
+HEADER = 'id,phase,task,start,weeks,low,high,after\n'
+
+
+def plan(tmp_path, *rows):
+    path = tmp_path / 'tasks.csv'
+    path.write_text(HEADER + ''.join(row + '\n' for row in rows), encoding='utf-8')
+    return Roadmap(str(path))
+
+
+def critical(roadmap):
+    return [task.id for task in roadmap.rows if roadmap.critical(task)]
+
+
+def test_shipped_plan_ends_on_the_certification_milestone():
+    roadmap = Roadmap()
+    milestone = roadmap.rows[-1]
+    assert day_of(roadmap.start[milestone.id]) == day_of(roadmap.finish - DAY)
+    assert critical(roadmap) == ['p5a', 'p5b', 'p5c']
+
+
+def test_lead_starts_a_task_before_the_one_it_follows_ends(tmp_path):
+    roadmap = plan(tmp_path,
+                   'a,P,Assess,,3,,,',
+                   'b,P,Respond,,2,,,a-1',
+                   'c,P,Issue,,0,,,b')
+    assert roadmap.start == {'a': 0, 'b': 2, 'c': 4 - DAY}
+    assert roadmap.finish == 4
+    assert critical(roadmap) == ['a', 'b', 'c']
+
+
+def test_planned_start_counts_in_the_backward_pass(tmp_path):
+    # b waits for its planned start, so a has that much slack; b drives the finish
+    roadmap = plan(tmp_path,
+                   'a,P,First,,1,,,',
+                   'b,P,Booked,2025-01-29,2,,,a',
+                   'c,P,Other,,1,,,a')
+    assert roadmap.start['b'] == 4
+    assert roadmap.slack == pytest.approx({'a': 3, 'b': 0, 'c': 4})
+    assert critical(roadmap) == ['b']
+
+
+def test_bad_link_is_reported_with_its_line(tmp_path):
+    with pytest.raises(ValueError, match=r'tasks.csv:3: .*got .a~1.'):
+        plan(tmp_path, 'a,P,First,,1,,,', 'b,P,Second,,1,,,a~1')
+
+
+def test_forecast_needs_duration_ranges(tmp_path):
+    with pytest.raises(ValueError, match='no task has low and high durations'):
+        Roadmap().simulate(100)
+    roadmap = plan(tmp_path, 'a,P,First,,2,1,4,')
+    ends = roadmap.simulate(100)
+    assert len(ends) == 100 and 1 <= ends[0] <= ends[-1] <= 4
+    with pytest.raises(ValueError, match='at least one sample'):
+        roadmap.simulate(0)
+
+
+def test_phase_table_takes_activities_from_the_phase_summaries(tmp_path):
+    rows = phase_rows(Roadmap())
+    assert rows[1] == ['Phase 1', 'Months 1-3', 'Project initiation, gap assessment, architecture design',
+                       'SSP draft, gap analysis report, architecture diagrams']
+    assert rows[-1][:2] == ['Phase 5', 'Month 12']
+    roadmap = plan(tmp_path, 'a,P,First,,1,,,', 'b,Q,Second,,1,,,a')
+    (tmp_path / 'tasks_phases.csv').write_text('phase,activities,deliverables\nP,Start,Plan\n', encoding='utf-8')
+    with pytest.raises(ValueError, match="no summary for 'Q'"):
+        phase_rows(roadmap)
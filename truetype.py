@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Minimal TrueType font reader - character mapping, advance widths and glyph
+outlines from the cmap, hmtx, loca and glyf tables, and glyph subsetting.
+Used to draw chart text when rasterizing charts to PNG and to embed font
+subsets in PDFs.
+"""
+
+import os
+import struct
+
+FONT_DIRS = ('/usr/share/fonts/truetype/liberation', '/usr/share/fonts/truetype/dejavu',
+             '/usr/share/fonts/liberation', '/usr/share/fonts/dejavu',
+             '/usr/share/fonts/TTF', '/Library/Fonts', 'C:\\Windows\\Fonts')
+
+# Tables a subset keeps: glyph data, metrics and the hinting programs
+SUBSET_TABLES = ('cvt ', 'fpgm', 'glyf', 'head', 'hhea', 'hmtx', 'loca', 'maxp', 'prep')
+
+# glyf flags
+ON_CURVE = 0x01
+X_SHORT = 0x02
+Y_SHORT = 0x04
+REPEAT = 0x08
+X_SAME = 0x10
+Y_SAME = 0x20
+
+# Composite glyph flags
+ARG_WORDS = 0x0001
+HAVE_SCALE = 0x0008
+MORE_COMPONENTS = 0x0020
+HAVE_XY_SCALE = 0x0040
+HAVE_2X2 = 0x0080
+
+
+def find_font(*names):
+    """Return the path of the first of `names` found in FONT_DIRS, or None."""
+    for name in names:
+        for directory in FONT_DIRS:
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                return path
+    return None
+
+
+class TrueTypeFont:
+    """Read-only view of a TrueType (glyf-based) font file."""
+
+    def __init__(self, path):
+        self.file_path = path
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        num_tables = struct.unpack_from('>H', self.data, 4)[0]
+        self.tables = {}
+        for i in range(num_tables):
+            tag, _, offset, length = struct.unpack_from('>4sIII', self.data, 12 + 16 * i)
+            self.tables[tag.decode('latin-1')] = (offset, length)
+
+        head = self.tables['head'][0]
+        self.units_per_em = struct.unpack_from('>H', self.data, head + 18)[0]
+        self.index_to_loc = struct.unpack_from('>h', self.data, head + 50)[0]
+        self.num_glyphs = struct.unpack_from('>H', self.data, self.tables['maxp'][0] + 4)[0]
+        hhea = self.tables['hhea'][0]
+        self.ascent, self.descent = struct.unpack_from('>hh', self.data, hhea + 4)
+        self.num_hmetrics = struct.unpack_from('>H', self.data, hhea + 34)[0]
+        self.cmap = self._read_cmap()
+
+    def _read_cmap(self):
+        """Map code points to glyph ids from the best Unicode subtable (format 12 or 4)."""
+        base = self.tables['cmap'][0]
+        count = struct.unpack_from('>H', self.data, base + 2)[0]
+        subtables = {}
+        for i in range(count):
+            platform, encoding, offset = struct.unpack_from('>HHI', self.data, base + 4 + 8 * i)
+            fmt = struct.unpack_from('>H', self.data, base + offset)[0]
+            if (platform, encoding) in ((3, 10), (0, 4)) and fmt == 12:
+                subtables[12] = base + offset
+            elif (platform, encoding) in ((3, 1), (0, 3)) and fmt == 4:
+                subtables[4] = base + offset
+
+        mapping = {}
+        if 12 in subtables:
+            pos = subtables[12]
+            groups = struct.unpack_from('>I', self.data, pos + 12)[0]
+            for i in range(groups):
+                start, end, glyph = struct.unpack_from('>III', self.data, pos + 16 + 12 * i)
+                for code in range(start, end + 1):
+                    mapping[code] = glyph + code - start
+        elif 4 in subtables:
+            pos = subtables[4]
+            segs = struct.unpack_from('>H', self.data, pos + 6)[0] // 2
+            ends = struct.unpack_from(f'>{segs}H', self.data, pos + 14)
+            starts = struct.unpack_from(f'>{segs}H', self.data, pos + 16 + 2 * segs)
+            deltas = struct.unpack_from(f'>{segs}h', self.data, pos + 16 + 4 * segs)
+            range_pos = pos + 16 + 6 * segs
+            offsets = struct.unpack_from(f'>{segs}H', self.data, range_pos)
+            for i in range(segs):
+                for code in range(starts[i], ends[i] + 1):
+                    if code == 0xFFFF:
+                        continue
+                    if offsets[i]:
+                        at = range_pos + 2 * i + offsets[i] + 2 * (code - starts[i])
+                        glyph = struct.unpack_from('>H', self.data, at)[0]
+                        glyph = (glyph + deltas[i]) & 0xFFFF if glyph else 0
+                    else:
+                        glyph = (code + deltas[i]) & 0xFFFF
+                    if glyph:
+                        mapping[code] = glyph
+        return mapping
+
+    def glyph_id(self, char):
+        return self.cmap.get(ord(char), 0)
+
+    def advance(self, glyph):
+        """Advance width of a glyph in font units."""
+        hmtx = self.tables['hmtx'][0]
+        return struct.unpack_from('>H', self.data, hmtx + 4 * min(glyph, self.num_hmetrics - 1))[0]
+
+    def _metrics(self, glyph):
+        """(advance, left side bearing) of a glyph."""
+        hmtx = self.tables['hmtx'][0]
+        if glyph < self.num_hmetrics:
+            return struct.unpack_from('>Hh', self.data, hmtx + 4 * glyph)
+        lsb = struct.unpack_from('>h', self.data, hmtx + 4 * self.num_hmetrics + 2 * (glyph - self.num_hmetrics))
+        return self.advance(glyph), lsb[0]
+
+    def table(self, tag):
+        offset, length = self.tables[tag]
+        return self.data[offset:offset + length]
+
+    def text_width(self, text, size):
+        """Width of `text` set at `size` points (no kerning)."""
+        return sum(self.advance(self.glyph_id(c)) for c in text) * size / self.units_per_em
+
+    def _glyph_range(self, glyph):
+        loca = self.tables['loca'][0]
+        if self.index_to_loc:
+            start, end = struct.unpack_from('>II', self.data, loca + 4 * glyph)
+        else:
+            start, end = (2 * v for v in struct.unpack_from('>HH', self.data, loca + 2 * glyph))
+        return self.tables['glyf'][0] + start, end - start
+
+    def contours(self, glyph):
+        """Outline of a glyph as contours of (x, y, on_curve) points in font units."""
+        pos, length = self._glyph_range(glyph)
+        if not length:
+            return []
+        num_contours = struct.unpack_from('>h', self.data, pos)[0]
+        pos += 10
+        if num_contours < 0:
+            return self._composite(pos)
+
+        ends = struct.unpack_from(f'>{num_contours}H', self.data, pos)
+        pos += 2 * num_contours
+        pos += 2 + struct.unpack_from('>H', self.data, pos)[0]  # Skip instructions
+        count = ends[-1] + 1 if ends else 0
+        flags = []
+        while len(flags) < count:
+            flag = self.data[pos]
+            pos += 1
+            flags.append(flag)
+            if flag & REPEAT:
+                flags.extend([flag] * self.data[pos])
+                pos += 1
+        coords = []
+        for short, same in ((X_SHORT, X_SAME), (Y_SHORT, Y_SAME)):
+            values, value = [], 0
+            for flag in flags[:count]:
+                if flag & short:
+                    delta = self.data[pos]
+                    pos += 1
+                    value += delta if flag & same else -delta
+                elif not flag & same:
+                    value += struct.unpack_from('>h', self.data, pos)[0]
+                    pos += 2
+                values.append(value)
+            coords.append(values)
+        points = [(x, y, bool(flag & ON_CURVE)) for x, y, flag in zip(coords[0], coords[1], flags)]
+        contours, start = [], 0
+        for end in ends:
+            contours.append(points[start:end + 1])
+            start = end + 1
+        return contours
+
+    def _composite(self, pos):
+        contours = []
+        flags = MORE_COMPONENTS
+        while flags & MORE_COMPONENTS:
+            flags, glyph = struct.unpack_from('>HH', self.data, pos)
+            pos += 4
+            if flags & ARG_WORDS:
+                dx, dy = struct.unpack_from('>hh', self.data, pos)
+                pos += 4
+            else:
+                dx, dy = struct.unpack_from('>bb', self.data, pos)
+                pos += 2
+            a, b, c, d = 1.0, 0.0, 0.0, 1.0
+            if flags & HAVE_SCALE:
+                a = d = struct.unpack_from('>h', self.data, pos)[0] / 16384
+                pos += 2
+            elif flags & HAVE_XY_SCALE:
+                a, d = (v / 16384 for v in struct.unpack_from('>hh', self.data, pos))
+                pos += 4
+            elif flags & HAVE_2X2:
+                a, b, c, d = (v / 16384 for v in struct.unpack_from('>hhhh', self.data, pos))
+                pos += 8
+            for contour in self.contours(glyph):
+                contours.append([(a * x + c * y + dx, b * x + d * y + dy, on) for x, y, on in contour])
+        return contours
+
+    def _components(self, glyph):
+        """Glyph ids a composite glyph is built from (empty for simple glyphs)."""
+        pos, length = self._glyph_range(glyph)
+        if not length or struct.unpack_from('>h', self.data, pos)[0] >= 0:
+            return []
+        pos += 10
+        components = []
+        flags = MORE_COMPONENTS
+        while flags & MORE_COMPONENTS:
+            flags, component = struct.unpack_from('>HH', self.data, pos)
+            components.append(component)
+            pos += 4 + (4 if flags & ARG_WORDS else 2)
+            pos += 2 if flags & HAVE_SCALE else 4 if flags & HAVE_XY_SCALE else 8 if flags & HAVE_2X2 else 0
+        return components
+
+    def subset(self, glyphs):
+        """Font program keeping only `glyphs`, their components and .notdef.
+
+        Glyph ids are unchanged (a PDF can then use CIDToGIDMap /Identity);
+        other glyphs are left empty and the font ends at the highest glyph
+        kept. Character maps, names and layout tables are dropped.
+        """
+        keep = set()
+        todo = [0, *glyphs]
+        while todo:
+            glyph = todo.pop()
+            if glyph not in keep and glyph < self.num_glyphs:
+                keep.add(glyph)
+                todo.extend(self._components(glyph))
+        count = max(keep) + 1
+
+        glyf, loca, hmtx = bytearray(), [], bytearray()
+        for glyph in range(count):
+            loca.append(len(glyf))
+            if glyph in keep:
+                pos, length = self._glyph_range(glyph)
+                glyf += self.data[pos:pos + length]
+                glyf += bytes(-len(glyf) % 4)
+                hmtx += struct.pack('>Hh', *self._metrics(glyph))
+            else:
+                hmtx += bytes(4)
+        loca.append(len(glyf))
+
+        tables = {tag: self.table(tag) for tag in SUBSET_TABLES if tag in self.tables}
+        tables['glyf'] = bytes(glyf)
+        tables['loca'] = struct.pack(f'>{count + 1}I', *loca)
+        tables['hmtx'] = bytes(hmtx)
+        head = bytearray(tables['head'])
+        head[8:12] = bytes(4)  # checkSumAdjustment, set by _build_font
+        head[50:52] = struct.pack('>h', 1)  # Long loca offsets
+        tables['head'] = head
+        tables['hhea'] = tables['hhea'][:34] + struct.pack('>H', count) + tables['hhea'][36:]
+        tables['maxp'] = tables['maxp'][:4] + struct.pack('>H', count) + tables['maxp'][6:]
+        return _build_font(tables)
+
+    def path(self, text, x, y, size):
+        """Outline of `text` with its baseline starting at (x, y) in y-down coordinates.
+
+        Returns subpaths of ('M', x, y) / ('L', x, y) / ('C', x1, y1, x2, y2, x, y)
+        commands, the same form charts use for shapes.
+        """
+        scale = size / self.units_per_em
+        subpaths = []
+        for char in text:
+            glyph = self.glyph_id(char)
+            for contour in self.contours(glyph):
+                pts = [(x + px * scale, y - py * scale, on) for px, py, on in contour]
+                subpaths.append(_contour_path(pts))
+            x += self.advance(glyph) * scale
+        return subpaths
+
+
+def _checksum(data):
+    data += bytes(-len(data) % 4)
+    return sum(struct.unpack(f'>{len(data) // 4}I', data)) & 0xFFFFFFFF
+
+
+def _build_font(tables):
+    """Assemble an sfnt file from {tag: bytes}, with checksums and head.checkSumAdjustment."""
+    tags = sorted(tables)
+    search = 1 << (len(tags).bit_length() - 1)
+    header = struct.pack('>IHHHH', 0x00010000, len(tags), search * 16, search.bit_length() - 1,
+                         (len(tags) - search) * 16)
+    directory, body = [], []
+    offset = 12 + 16 * len(tags)
+    for tag in tags:
+        data = bytes(tables[tag])
+        directory.append(struct.pack('>4sIII', tag.encode('latin-1'), _checksum(data), offset, len(data)))
+        body.append(data + bytes(-len(data) % 4))
+        offset += len(body[-1])
+    font = bytearray(header + b''.join(directory) + b''.join(body))
+    head = 12 + 16 * len(tags) + sum(len(b) for b in body[:tags.index('head')])
+    struct.pack_into('>I', font, head + 8, (0xB1B0AFBA - _checksum(bytes(font))) & 0xFFFFFFFF)
+    return bytes(font)
+
+
+def _contour_path(points):
+    """Convert a quadratic TrueType contour into move/line/cubic commands."""
+    # Start on an on-curve point; insert the implied midpoint if there is none
+    start = next((i for i, p in enumerate(points) if p[2]), None)
+    if start is None:
+        (x0, y0, _), (x1, y1, _) = points[0], points[1]
+        points = [((x0 + x1) / 2, (y0 + y1) / 2, True)] + points
+        start = 0
+    points = points[start:] + points[:start]
+    cx, cy = points[0][0], points[0][1]
+    commands = [('M', cx, cy)]
+    control = None
+    for x, y, on in points[1:] + points[:1]:
+        if on:
+            if control is None:
+                commands.append(('L', x, y))
+            else:
+                commands.append(_quad(cx, cy, control, x, y))
+                control = None
+            cx, cy = x, y
+        else:
+            if control is not None:
+                mx, my = (control[0] + x) / 2, (control[1] + y) / 2
+                commands.append(_quad(cx, cy, control, mx, my))
+                cx, cy = mx, my
+            control = (x, y)
+    commands.append(('Z',))
+    return commands
+
+
+def _quad(x0, y0, control, x, y):
+    qx, qy = control
+    return ('C', x0 + 2 / 3 * (qx - x0), y0 + 2 / 3 * (qy - y0),
+            x + 2 / 3 * (qx - x), y + 2 / 3 * (qy - y), x, y)